@@ -0,0 +1,54 @@
+"""
+Test the shared and cached network model.
+"""
+
+import os
+
+from evi.network import NetworkModel, get_network_model
+
+NET_FILE = "networks/paderborn-hynets/paderborn-hynets.net.xml"
+
+
+def test_network_model_is_shared():
+    assert get_network_model(NET_FILE) is get_network_model(
+        os.path.join(".", NET_FILE)
+    )
+
+
+def test_cached_index_data_yields_same_lookups(tmp_path):
+    coords = [(8572.29, 5154.57), (8632.22, 5046.24), (8994.04, 5005.48)]
+    cold = NetworkModel(NET_FILE, cache_dir=str(tmp_path))
+    expected_lanes = [cold.lane_finder.nearest_lane(c).getID() for c in coords]
+    expected_junctions = [
+        cold.junction_finder.hit_junction(c) is not None for c in coords
+    ]
+    expected_connector = [f"30926598#{nr}" for nr in range(5)]
+    assert os.listdir(tmp_path / "netmodel")
+
+    warm = NetworkModel(NET_FILE, cache_dir=str(tmp_path))
+    assert warm.projection == cold.projection
+    assert warm._load_cached_index_data() is not None
+    warm.preload(with_net=False)
+    assert "net" not in vars(warm)
+    assert [
+        warm.lane_finder.nearest_lane(c).getID() for c in coords
+    ] == expected_lanes
+    assert [
+        warm.junction_finder.hit_junction(c) is not None for c in coords
+    ] == expected_junctions
+    for model in (cold, warm):
+        connector = model.routing_index.shortest_connector(
+            model.net.getEdge("30926598#0"), model.net.getEdge("30926598#4")
+        )
+        assert [edge.getID() for edge in connector] == expected_connector
+    assert warm.tls_link_table.connections == cold.tls_link_table.connections
+
+
+def test_preload_builds_network_and_indices():
+    model = NetworkModel(NET_FILE)
+    model.preload(with_indices=False)
+    assert "net" in vars(model) and "lane_finder" not in vars(model)
+    model.preload()
+    assert {"lane_finder", "junction_finder", "routing_index"} <= set(
+        vars(model)
+    )
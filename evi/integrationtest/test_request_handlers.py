@@ -0,0 +1,20 @@
+"""
+Test request handlers on a real network.
+"""
+
+import pytest
+
+from evi.request_handlers import HorizonEgoTrafficLightHandler
+from evi.routehelper import RouteTracker
+
+NET_FILE = "networks/paderborn-hynets/paderborn-hynets.net.xml"
+
+
+@pytest.mark.asyncio
+async def test_horizon_teardown_stops_route_workers():
+    handler = HorizonEgoTrafficLightHandler(
+        NET_FILE, sumo_interface=None, horizon_workers=2
+    )
+    await handler.teardown()
+    with pytest.raises(RuntimeError):
+        handler.route_workers.submit(0, RouteTracker.forget, 0)
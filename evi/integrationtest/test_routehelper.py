@@ -5,12 +5,19 @@ More complex tests of utils that require further files.
 import re
 from typing import Dict, Optional, Tuple
 
+import numpy as np
 import pytest
+import shapely.geometry
 import sumolib
 
 from evi.routehelper import (
     JunctionFinder,
     LaneFinder,
+    RouteTracker,
+    RouteWorkerPool,
+    RoutingIndex,
+    TLSTiming,
+    TLSLinkTable,
     find_connection,
     find_tls_in_route,
     get_next_green_phase_times,
@@ -243,6 +250,23 @@ def test_find_connection_for_edges_with_two_non_consecutive_gaps(sumo_net):
     assert found_route == expted_route
 
 
+@pytest.mark.parametrize("max_hops", [16, 1])
+def test_routing_index_finds_same_connections(sumo_net, max_hops):
+    routing_index = RoutingIndex(sumo_net, max_hops=max_hops)
+    for from_id, to_id in [
+        ("30926598#0", "30926598#1"),
+        ("30926598#0", "30926598#2"),
+        ("30926598#0", "30926598#4"),
+    ]:
+        from_edge = sumo_net.getEdge(from_id)
+        to_edge = sumo_net.getEdge(to_id)
+        expected_route = find_connection(from_edge, to_edge)
+        # second query is answered from the cache
+        for _ in range(2):
+            found_route = routing_index.shortest_connector(from_edge, to_edge)
+            assert found_route == expected_route
+
+
 def test_finding_points_on_route(route_config, lane_finder):
     for point, expected_lane in route_config["all_coords_map"].items():
         lane = lane_finder.nearest_lane(point)
@@ -251,6 +275,17 @@ def test_finding_points_on_route(route_config, lane_finder):
             assert lane.getID() == expected_lane
 
 
+def test_batch_lookup_matches_single_lookups(route_config, lane_finder):
+    coords = list(route_config["all_coords_map"])
+    lanes, offsets = lane_finder.nearest_lanes(np.array(coords))
+    assert lanes == [lane_finder.nearest_lane(coord) for coord in coords]
+    for coord, lane, offset in zip(coords, lanes, offsets):
+        linestring = shapely.geometry.LineString(lane.getShape(True))
+        assert offset == pytest.approx(
+            linestring.project(shapely.geometry.Point(coord))
+        )
+
+
 def test_finding_hit_junctions(route_config, junction_finder):
     found_junctions = junction_finder.hit_junctions(route_config["coords"])
     found_junction_ids = {
@@ -266,6 +301,48 @@ def test_reconstruct_simple_route(route_config, lane_finder, junction_finder):
     assert [edge.getID() for edge in route] == route_config["route_edges"]
 
 
+def test_route_tracker_matches_reconstruct_route(
+    route_config, lane_finder, junction_finder
+):
+    tracker = RouteTracker(lane_finder, junction_finder)
+    coords = route_config["coords"]
+    expected = reconstruct_route(coords, lane_finder, junction_finder)
+    assert tracker.reconstruct(0, coords) == expected
+    # repeated and shifted requests reuse cached data
+    assert tracker.reconstruct(0, coords) == expected
+    if len(coords) > 2:
+        assert tracker.reconstruct(0, coords[1:]) == reconstruct_route(
+            coords[1:], lane_finder, junction_finder
+        )
+
+
+def test_route_worker_pool_matches_reconstruct_route(
+    lane_finder, junction_finder
+):
+    pool = RouteWorkerPool(
+        lambda: RouteTracker(lane_finder, junction_finder), workers=2
+    )
+    try:
+        futures = [
+            (
+                config["coords"],
+                pool.submit(
+                    vehicle_id,
+                    RouteTracker.reconstruct,
+                    vehicle_id,
+                    config["coords"],
+                ),
+            )
+            for vehicle_id, config in enumerate(ROUTE_PATHS.values())
+        ]
+        for coords, future in futures:
+            assert future.result() == reconstruct_route(
+                coords, lane_finder, junction_finder
+            )
+    finally:
+        pool.shutdown()
+
+
 def test_reconstruct_route_with_tls(tls_route_config, sumo_net):
     route = [
         sumo_net.getEdge(edge_id)
@@ -281,6 +358,33 @@ def test_reconstruct_route_with_tls(tls_route_config, sumo_net):
     assert found_link_indices == expected_link_indices
 
 
+def test_tls_link_table_finds_same_tls(tls_route_config, sumo_net):
+    route = [
+        sumo_net.getEdge(edge_id)
+        for edge_id in tls_route_config["route_edges"]
+    ]
+    table = TLSLinkTable(sumo_net)
+    found_tls = table.find_tls_in_route(route)
+    assert [(tls, link_index) for tls, link_index, _ in found_tls] == (
+        find_tls_in_route(route, sumo_net)
+    )
+    distances = table.route_distances(route)
+    for tls, _, edge_nr in found_tls:
+        assert route[edge_nr].getToNode().getID() == tls.getID()
+        via_lanes = [
+            sumo_net.getLane(
+                from_edge.getConnections(to_edge)[0].getViaLaneID()
+            )
+            for from_edge, to_edge in zip(
+                route[:edge_nr], route[1 : edge_nr + 1]
+            )
+        ]
+        assert distances[edge_nr] == pytest.approx(
+            sum(edge.getLength() for edge in route[: edge_nr + 1])
+            + sum(lane.getLength() for lane in via_lanes)
+        )
+
+
 def test_find_one_green_duration_of_ongoing_green_phase(tls_program):
     """Assumes the green phase is already active."""
     phase_nr = 0
@@ -353,3 +457,27 @@ def test_offset_green_phase_time_at_phase_end():
         raw_green_times, passed_time
     )
     assert restulting_green_times == expteced_green_times
+
+
+@pytest.mark.parametrize("phase_nr", range(8))
+@pytest.mark.parametrize("time_to_switch", [6, 3.5, 0])
+def test_tls_timing_matches_phase_walk(sumo_net, phase_nr, time_to_switch):
+    tls = sumo_net.getTLS("536777420")
+    program = tls.getPrograms()["0"]
+    duration = program.getPhases()[phase_nr].duration
+    for link_index in (0, 4, 8):
+        expected = offset_green_phase_times(
+            get_next_green_phase_times(
+                program, link_index, phase_nr, green_phases=3
+            ),
+            passed_time=duration - min(time_to_switch, duration),
+        )
+        found = TLSTiming().next_green_windows(
+            tls,
+            link_index,
+            "0",
+            phase_nr,
+            min(time_to_switch, duration),
+            green_phases=3,
+        )
+        assert found == pytest.approx(expected)
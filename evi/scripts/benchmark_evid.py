@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Benchmark evid end-to-end by replaying recorded ASM traffic.
+
+Every case (an EVI config file and a recorded ASM trace) is run for every
+fellow limit and replay period with a fresh evid (and SUMO) instance.
+A period of 0 replays as fast as possible: each message is sent once the
+reply to the previous one arrived.
+Results are appended as one json object per run to the results file.
+"""
+
+import argparse
+import asyncio
+import binascii
+import collections
+import csv
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+import psutil
+
+import evi
+from evi.tracereport import summarize
+from evi.util import flex_open, kill_subproc_after, launch_subproc
+
+LOG = logging.getLogger(__name__)
+
+EVI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_CASES = [
+    (
+        "networks/paderborn-hynets/paderborn-hynets.evi.ini",
+        "networks/paderborn-hynets/reference-traces/asm.csv.bz2",
+    ),
+    (
+        "networks/paderborn-hynets/paderborn-hynets.evi.ini",
+        "networks/paderborn-hynets/asm-replay-2022-03-09.csv",
+    ),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--case",
+        action="append",
+        metavar="CONFIG_FILE:ASM_TRACE",
+        help=(
+            "EVI config file and ASM trace (csv, see pcapreplay.py) to "
+            "replay, can be given multiple times "
+            "(default: all bundled paderborn-hynets traces)."
+        ),
+    )
+    parser.add_argument(
+        "--rt-max-vehicles",
+        default="5,15,None",
+        help="Comma separated fellow limits to run (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--period",
+        default="0,0.1",
+        help=(
+            "Comma separated periods between messages in seconds, "
+            "0 means as fast as possible (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--max-messages",
+        type=int,
+        help="Only replay the first messages of each trace.",
+    )
+    parser.add_argument(
+        "--reply-timeout",
+        type=float,
+        default=2.0,
+        help="Seconds after which a reply counts as lost (default: 2).",
+    )
+    parser.add_argument(
+        "--results",
+        default="benchmark-results.jsonl",
+        help="File to append results to (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--evid-arg",
+        action="append",
+        default=[],
+        help="Additional argument for evid, e.g., --evid-arg=--sumo-binary=…",
+    )
+    parser.add_argument(
+        "--verbosity",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+    )
+    return parser.parse_args()
+
+
+def read_asm_trace(file_name, max_messages=None):
+    """Return the payloads of a recorded ASM trace."""
+    with flex_open(file_name, "rt") as csv_file:
+        payloads = [
+            binascii.unhexlify(record["payload"])
+            for record in csv.DictReader(csv_file)
+        ]
+    return payloads[:max_messages]
+
+
+def unused_port(kind):
+    with socket.socket(type=kind) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ReplayProtocol(asyncio.DatagramProtocol):
+    """
+    Send ASM messages and match replies in order.
+
+    EVI answers every vehicle (and horizon) message with exactly one reply.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = collections.deque()
+        self.latencies = []
+        self.reply_sizes = []
+        self.lost = 0
+        self.reply_event = asyncio.Event()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if not self.pending:
+            LOG.warning("Unexpected reply of %d bytes", len(data))
+            return
+        self.latencies.append(time.perf_counter() - self.pending.popleft())
+        self.reply_sizes.append(len(data))
+        self.reply_event.set()
+
+    def send(self, payload):
+        self.pending.append(time.perf_counter())
+        self.transport.sendto(payload)
+
+    def expire(self, timeout):
+        """Count replies pending for longer than timeout as lost."""
+        deadline = time.perf_counter() - timeout
+        while self.pending and self.pending[0] < deadline:
+            self.pending.popleft()
+            self.lost += 1
+
+
+async def replay(protocol, payloads, period, reply_timeout):
+    """Replay payloads, return the duration until the last reply."""
+    start = time.perf_counter()
+    for number, payload in enumerate(payloads):
+        if period > 0:
+            await asyncio.sleep(
+                max(start + number * period - time.perf_counter(), 0)
+            )
+            protocol.send(payload)
+            protocol.expire(reply_timeout)
+            continue
+        protocol.reply_event.clear()
+        protocol.send(payload)
+        try:
+            await asyncio.wait_for(protocol.reply_event.wait(), reply_timeout)
+        except asyncio.TimeoutError:
+            protocol.expire(0)
+    end = time.perf_counter() + reply_timeout
+    while protocol.pending and time.perf_counter() < end:
+        await asyncio.sleep(0.01)
+    protocol.expire(0)
+    return time.perf_counter() - start
+
+
+def cpu_seconds(processes):
+    total = 0.0
+    for process in processes:
+        try:
+            times = process.cpu_times()
+        except psutil.NoSuchProcess:
+            continue
+        total += times.user + times.system
+    return total
+
+
+async def run_case(
+    config_file, trace_file, rt_max_vehicles, period, args, payloads
+):
+    """Run evid once with a replayed trace and return the results."""
+    evi_port = unused_port(socket.SOCK_DGRAM)
+    evid_cmd = [
+        sys.executable,
+        os.path.join(EVI_DIR, "scripts", "evid.py"),
+        "--config-file",
+        config_file,
+        "--evi-port",
+        str(evi_port),
+        "--sumo-port",
+        str(unused_port(socket.SOCK_STREAM)),
+        "--rt-max-vehicles",
+        rt_max_vehicles,
+        "--verbosity",
+        "WARNING",
+        *args.evid_arg,
+    ]
+    evid_proc = await launch_subproc(
+        evid_cmd, evi_port, "udp", "EVID", wait_times=400
+    )
+    try:
+        evid = psutil.Process(evid_proc.pid)
+        simulators = evid.children(recursive=True)
+        cpu_before = cpu_seconds([evid]), cpu_seconds(simulators)
+        transport, protocol = (
+            await asyncio.get_running_loop().create_datagram_endpoint(
+                ReplayProtocol, remote_addr=("127.0.0.1", evi_port)
+            )
+        )
+        try:
+            duration = await replay(
+                protocol, payloads, period, args.reply_timeout
+            )
+        finally:
+            transport.close()
+        cpu_after = cpu_seconds([evid]), cpu_seconds(simulators)
+    finally:
+        evid_proc.terminate()
+        await kill_subproc_after(evid_proc, 5.0, "EVID")
+
+    replies = len(protocol.latencies)
+    return {
+        "evi_version": evi.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config_file": config_file,
+        "trace": trace_file,
+        "rt_max_vehicles": rt_max_vehicles,
+        "period_s": period,
+        "messages": len(payloads),
+        "replies": replies,
+        "lost": protocol.lost,
+        "duration_s": duration,
+        "requests_per_s": replies / duration if duration else 0.0,
+        "latency_ms": summarize(
+            [latency * 1000 for latency in protocol.latencies]
+        ),
+        "reply_bytes": summarize(protocol.reply_sizes),
+        "cpu_s_per_step": {
+            "evid": (cpu_after[0] - cpu_before[0]) / max(replies, 1),
+            "simulators": (cpu_after[1] - cpu_before[1]) / max(replies, 1),
+        },
+    }
+
+
+async def main():
+    args = parse_args()
+    logging.basicConfig(level=args.verbosity)
+    cases = (
+        [tuple(case.rsplit(":", 1)) for case in args.case]
+        if args.case
+        else [
+            (os.path.join(EVI_DIR, config), os.path.join(EVI_DIR, trace))
+            for config, trace in DEFAULT_CASES
+        ]
+    )
+    for config_file, trace_file in cases:
+        payloads = read_asm_trace(trace_file, args.max_messages)
+        for rt_max_vehicles in args.rt_max_vehicles.split(","):
+            for period in map(float, args.period.split(",")):
+                LOG.info(
+                    "Running %s with %s (max. %s fellows, period %.3fs)",
+                    os.path.basename(config_file),
+                    os.path.basename(trace_file),
+                    rt_max_vehicles,
+                    period,
+                )
+                result = await run_case(
+                    config_file,
+                    trace_file,
+                    rt_max_vehicles,
+                    period,
+                    args,
+                    payloads,
+                )
+                LOG.info(
+                    "%.1f req/s, latency p50 %.2fms, p99 %.2fms, "
+                    "%d lost, %.2fms cpu per step",
+                    result["requests_per_s"],
+                    result["latency_ms"]["p50"],
+                    result["latency_ms"]["p99"],
+                    result["lost"],
+                    result["cpu_s_per_step"]["evid"] * 1000,
+                )
+                with open(args.results, "a") as results_file:
+                    results_file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
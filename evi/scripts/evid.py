@@ -6,35 +6,46 @@ import argparse
 import asyncio
 import collections
 import configparser
+import contextlib
 import logging
 import logging.handlers
 import os
 import queue
 import signal
-
-from evi.asm import ASMCodec, ASMProtocol
-from evi.defaultconfig import DEFAULT_SUMO_OPTS, DEFAULTS
-from evi.filtering import FELLOW_FILTERS
-from evi.request_handlers import (
-    EgoVehicleUpdateHandler,
-    HorizonEgoTrafficLightHandler,
-    RequestDispatcher,
-    UnityEgoVehicleUpdateHandler,
+import sys
+import time
+
+# taken before importing evi to include its import time in the profile
+IMPORT_START = time.perf_counter()
+
+# Only modules needed to parse arguments are imported here.
+# Simulator interfaces, protocols, handlers and the network model
+# (and with them traci, numpy, sumolib, zmq) are imported once configured.
+from evi import options  # noqa: E402
+from evi.defaultconfig import (  # noqa: E402
+    DEFAULT_SUMO_OPTS,
+    DEFAULTS,
+    NETWORK_INIT_CACHE_VERSION,
+    WARM_START_CACHE_VERSION,
 )
-from evi.sumo import SumoInterface
-from evi.unity import UnityProtocol
-from evi.util import (
+from evi.filtering import FELLOW_FILTERS  # noqa: E402
+from evi.util import (  # noqa: E402
     ID_MAPPER,
     TRACER,
+    DiskCache,
     extract_projection_data,
     flex_open,
+    hash_files,
     kill_subproc_after,
     launch_sumo,
     launch_veins,
     make_event_setting_handler,
     make_geo_mapper,
+    sumo_config_input_files,
 )
-from evi.veins import VeinsInterface
+from evi.tracing import TRACE_FORMATS, parse_sample_every  # noqa: E402
+
+IMPORT_END = time.perf_counter()
 
 LOG = logging.getLogger(__name__)
 
@@ -49,7 +60,25 @@ def logging_parser(defaults):
     )
     logging_group.add_argument(
         "--event-trace-file",
-        help="File name to write chrome-style event trace to.",
+        help="File name to stream chrome-style event trace to.",
+    )
+    logging_group.add_argument(
+        "--event-trace-format",
+        choices=TRACE_FORMATS,
+        default=defaults["event_trace_format"],
+        help=(
+            "Format of the event trace file, binary traces are smaller "
+            "and can be read with evi.tracing.read_trace "
+            "(default: {}).".format(defaults["event_trace_format"])
+        ),
+    )
+    logging_group.add_argument(
+        "--event-trace-sampling",
+        default=defaults.get("event_trace_sampling", ""),
+        help=(
+            "Only trace every n-th instant/complete event of a tid, "
+            "e.g., 'veins=10,request=2' (default: trace all events)."
+        ),
     )
     logging_group.add_argument(
         "--protocol-trace-file",
@@ -59,6 +88,11 @@ def logging_parser(defaults):
         "--vehicle-trace-file",
         help="File name to write (ego) vehicle state traces to.",
     )
+    logging_group.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Print the time spent in each startup stage to stderr.",
+    )
     logging_group.add_argument(
         "--verbosity",
         choices=["TRACE", "DEBUG", "INFO", "WARNING", "ERROR"],
@@ -127,6 +161,14 @@ def evid_parser(rt_interfaces, defaults):
             defaults["veins_runnr"]
         ),
     )
+    evid_group.add_argument(
+        "--veins-lanradio-baseport",
+        type=int,
+        help=(
+            "Base port of the Lanradio module when spawning Veins "
+            "(default: as in omnetpp.ini)."
+        ),
+    )
     evid_group.add_argument(
         "--veins-result-dir",
         help="Directory for Veins to write its results when spawning Veins.",
@@ -140,6 +182,42 @@ def evid_parser(rt_interfaces, defaults):
         action="store_true",
         help="Disable geometry mapping of x/y to lat/lon coordinates.",
     )
+    evid_group.add_argument(
+        "--cache-dir",
+        help=(
+            "Directory for data derived from scenario files that is reused "
+            "across runs (default: {}).".format(defaults["cache_dir"])
+        ),
+    )
+    evid_group.add_argument(
+        "--disable-cache",
+        action="store_true",
+        help="Do not read or write cached scenario data.",
+    )
+    evid_group.add_argument(
+        "--warm-start",
+        action="store_true",
+        help=(
+            "Start SUMO from a cached state at the start time, saved by the "
+            "first run with the same scenario files, seed and start time."
+        ),
+    )
+    evid_group.add_argument(
+        "--metrics-port",
+        type=lambda string: int(string) if string != "None" else None,
+        help=(
+            "Port to serve live Prometheus metrics at /metrics "
+            "(None disables the endpoint, default: {}).".format(
+                defaults["metrics_port"]
+            )
+        ),
+    )
+    evid_group.add_argument(
+        "--metrics-host",
+        help="Address to serve metrics at (default: {}).".format(
+            defaults["metrics_host"]
+        ),
+    )
     rt_group = parser.add_argument_group("All Real-Time Interfaces")
     rt_group.add_argument(
         "--evi-port",
@@ -170,6 +248,49 @@ def evid_parser(rt_interfaces, defaults):
         default=defaults["rt_fellow_filter"],
         help="Filter mechanism to select fellows for the rt simulator.",
     )
+    rt_group.add_argument(
+        "--tls-visibility-radius",
+        type=lambda string: float(string) if string != "None" else None,
+        help=(
+            "Only send traffic lights within this distance (m) of any ego "
+            "(None means all, default: {}).".format(
+                defaults["tls_visibility_radius"]
+            )
+        ),
+    )
+    rt_group.add_argument(
+        "--tls-full-refresh-interval",
+        type=lambda string: int(string) if string != "None" else None,
+        help=(
+            "Send all visible traffic lights every n updates, "
+            "otherwise only changed ones (None means never, default: {})."
+        ).format(defaults["tls_full_refresh_interval"]),
+    )
+    rt_group.add_argument(
+        "--horizon-poi-interval",
+        type=lambda string: float(string) if string != "None" else None,
+        help=(
+            "Minimum interval (s) between tracing an ego's requested route "
+            "as POIs, only done if SUMO runs with GUI "
+            "(None disables tracing, default: {})."
+        ).format(defaults["horizon_poi_interval"]),
+    )
+    rt_group.add_argument(
+        "--horizon-workers",
+        type=int,
+        help=(
+            "Number of threads to process Horizon requests of different "
+            "egos in parallel (0 processes them on the event loop, "
+            "default: {})."
+        ).format(defaults["horizon_workers"]),
+    )
+    rt_group.add_argument(
+        "--headless-trajectories",
+        help=(
+            "Ego trajectories (csv) to drive EVI with as fast as possible "
+            "with --rt-simulator Headless, see evi.headless for formats."
+        ),
+    )
     rt_group.add_argument(
         "--register-from-update",
         action="store_true",
@@ -234,8 +355,9 @@ def parse_args(rt_interfaces):
     parser = argparse.ArgumentParser(
         parents=[
             conf_parser,
-            SumoInterface.get_parser(defaults=defaults),
-            VeinsInterface.get_parser(defaults=defaults),
+            options.sumo_parser(defaults=defaults),
+            options.playback_parser(defaults=defaults),
+            options.veins_parser(defaults=defaults),
             logging_parser(defaults=defaults),
             evid_parser(rt_interfaces, defaults=defaults),
         ],
@@ -246,6 +368,8 @@ def parse_args(rt_interfaces):
     # enable requirement later on to allow -h without giving a conf file
     conf_argument.required = True
     args = parser.parse_known_args()[0]
+    if args.rt_simulator == "Headless" and not args.headless_trajectories:
+        parser.error("--rt-simulator Headless needs --headless-trajectories")
     return args
 
 
@@ -304,6 +428,12 @@ def setup_logging(args):
         "Configuration: {\n\t%s\n}",
         "\n\t".join("%s: %s" % (k, v) for k, v in sorted(vars(args).items())),
     )
+    # event tracing, streamed to file while running
+    if args.event_trace_file:
+        TRACER.sample_every = parse_sample_every(args.event_trace_sampling)
+        TRACER.start_writer(args.event_trace_file, args.event_trace_format)
+    else:
+        TRACER.enabled = False
     # protocol trace logging
     prepare_file_logger("proto", args.protocol_trace_file)
     # ego vehicle tracing
@@ -323,20 +453,78 @@ def setup_logging(args):
     )
 
 
+def prepare_warm_start(args, sumo_config_file):
+    """
+    Return SUMO options to start from a cached state at the start time.
+
+    States are keyed by the contents of the SUMO input files (incl. routes),
+    the seed, the start time, and the SUMO binary.
+    Without a cached state, simulate saves one once the start time is reached.
+    """
+    if args.disable_cache or not args.start_time:
+        return []
+    cache = DiskCache(
+        args.cache_dir,
+        "warmstart",
+        WARM_START_CACHE_VERSION,
+        suffix=".xml.gz",
+    )
+    cache_key = hash_files(
+        [
+            sumo_config_file,
+            *sumo_config_input_files(
+                sumo_config_file,
+                ("net-file", "additional-files", "route-files"),
+            ),
+        ],
+        str(args.sumo_seed),
+        str(args.start_time),
+        args.sumo_binary,
+    )
+    state_file = os.path.abspath(cache.path(cache_key))
+    if os.path.exists(state_file):
+        LOG.info("Starting SUMO from cached state %s", state_file)
+        return [
+            "--load-state",
+            state_file,
+            "--begin",
+            str(args.start_time / 1000),
+        ]
+    args.warm_start_state_file = state_file
+    return ["--save-state.rng"]
+
+
+async def save_warm_start(sumo_interface, state_file):
+    """Save the SUMO state to state_file, failures are only logged."""
+    from traci.exceptions import TraCIException
+
+    tmp_name = f"{state_file}.{os.getpid()}.tmp.xml.gz"
+    try:
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        await sumo_interface.save_state(tmp_name)
+        os.replace(tmp_name, state_file)
+    except (OSError, TraCIException) as exc:
+        LOG.warning("Could not save SUMO warm start state: %s", exc)
+
+
 def prepare_launch_configs(args):
     """
     Configure coroutines to launch coupled simulators.
     """
     to_launch = collections.OrderedDict()
-    if args.sumo_config_file:
+    if args.sumo_config_file and not args.playback_traffic:
         sumo_config_file = os.path.join(
             os.path.dirname(args.config_file), args.sumo_config_file
         )
+        extra_opts = list(DEFAULT_SUMO_OPTS)
+        if args.warm_start:
+            extra_opts += prepare_warm_start(args, sumo_config_file)
         to_launch["Sumo"] = launch_sumo(
             config=sumo_config_file,
             port=args.sumo_port,
             binary=args.sumo_binary,
-            extra_opts=DEFAULT_SUMO_OPTS,
+            extra_opts=extra_opts,
+            seed=args.sumo_seed,
         )
         args.sumo_host = "127.0.0.1"
 
@@ -360,6 +548,7 @@ def prepare_launch_configs(args):
             binary=args.veins_binary,
             scenario_dir=veins_scenario_dir,
             runnr=args.veins_runnr,
+            lanradio_baseport=args.veins_lanradio_baseport,
             extra_opts=[
                 "-u",
                 "Cmdenv",
@@ -374,64 +563,256 @@ def prepare_launch_configs(args):
     return to_launch
 
 
-async def simulate(parsed_args):
+class StartupProfile:
+    """
+    Record the wall clock time spent in each stage of the EVI startup.
+
+    Stages may overlap, e.g., when run concurrently in a thread.
+    """
+
+    def __init__(self, start: float) -> None:
+        self.start = start
+        self.stages = []
+
+    def record(self, name: str, begin: float, end: float) -> None:
+        """Record a stage with perf_counter timestamps."""
+        self.stages.append((name, begin - self.start, end - begin))
+
+    @contextlib.contextmanager
+    def stage(self, name: str, tid: str = "startup"):
+        """Context manager to record and trace a stage."""
+        begin = time.perf_counter()
+        try:
+            with TRACER.complete(name, tid=tid):
+                yield
+        finally:
+            self.record(name, begin, time.perf_counter())
+
+    def in_thread(self, name: str, function, *args) -> asyncio.Future:
+        """Run function(*args) as a stage in the default executor."""
+
+        def run_stage():
+            with self.stage(name, tid=name):
+                return function(*args)
+
+        return asyncio.get_running_loop().run_in_executor(None, run_stage)
+
+    def report(self) -> str:
+        """Return a table of all stages (sorted by their start)."""
+        lines = [f"{'stage':<24} {'start [s]':>10} {'duration [s]':>13}"]
+        lines.extend(
+            f"{name:<24} {offset:>10.3f} {duration:>13.3f}"
+            for name, offset, duration in sorted(
+                self.stages, key=lambda stage: stage[1]
+            )
+        )
+        lines.append(
+            f"{'total':<24} {0:>10.3f} "
+            f"{time.perf_counter() - self.start:>13.3f}"
+        )
+        return "\n".join(lines)
+
+
+async def prepare_network_init_payload(sumo_interface, parsed_args):
+    """
+    Return the serialized network init data for Veins.
+
+    Retrieving all polygons from SUMO is slow for building-heavy scenarios.
+    So the result is cached, keyed by the contents of the SUMO input files.
+    Caching requires a SUMO config file to know which files SUMO loaded.
+    """
+    cache = None
+    if parsed_args.get("sumo_config_file") and not parsed_args.get(
+        "disable_cache"
+    ):
+        sumo_config_file = os.path.join(
+            os.path.dirname(parsed_args["config_file"]),
+            parsed_args["sumo_config_file"],
+        )
+        cache = DiskCache(
+            parsed_args["cache_dir"], "netinit", NETWORK_INIT_CACHE_VERSION
+        )
+        cache_key = hash_files(
+            [sumo_config_file, *sumo_config_input_files(sumo_config_file)]
+        )
+        payload = cache.load(cache_key)
+        if payload is not None:
+            LOG.info("Using cached network init data for Veins.")
+            return payload
+
+    from evi.veins import make_network_init_payload
+
+    with TRACER.complete("networkInitData", tid="sumo"):
+        network_init_data = await sumo_interface.network_init_data()
+    payload = make_network_init_payload(network_init_data)
+    if cache is not None:
+        cache.store(cache_key, payload)
+    return payload
+
+
+async def simulate(
+    parsed_args, startup, network_loaded=None, indices_loaded=None
+):
     """
     Set up and run the simulation.
+
+    network_loaded and indices_loaded may be futures of concurrent preloads
+    of the network model, which are awaited before the first component
+    using the sumolib network or the network indices, respectively.
     """
 
-    # connect to sumo and retrieve scnario data
-    sumo_interface = SumoInterface(**parsed_args)
+    # the trigger manager of the sumo interface reads the network
+    if network_loaded is not None and parsed_args.get("triggers_file"):
+        with startup.stage("awaitNetwork"):
+            await network_loaded
+    # connect to sumo (or open a traffic recording), retrieve scenario data
+    with startup.stage("connectSumo"):
+        if parsed_args.get("playback_traffic"):
+            from evi.playback import PlaybackInterface
+
+            sumo_interface = PlaybackInterface(**parsed_args)
+        else:
+            from evi.sumo import SumoInterface
+
+            sumo_interface = SumoInterface(**parsed_args)
     # connect to veins (if configured) and transfer scenario settings
     veins_interface = None
     if parsed_args.get("veins_host", None):
-        veins_interface = VeinsInterface(**parsed_args)
-        network_init_data = await sumo_interface.network_init_data()
-        await veins_interface.init(
-            parsed_args.get("start_time"), network_init_data
-        )
+        with startup.stage("initVeins"):
+            from evi.veins import VeinsInterface
+
+            veins_interface = VeinsInterface(**parsed_args)
+            network_init_payload = await prepare_network_init_payload(
+                sumo_interface, parsed_args
+            )
+            await veins_interface.init(
+                parsed_args.get("start_time"), network_init_payload
+            )
 
     # advance to start time
-    await sumo_interface.warm_up_traffic(parsed_args.get("start_time"))
+    with startup.stage("warmUpTraffic"):
+        await sumo_interface.warm_up_traffic(parsed_args.get("start_time"))
+    if parsed_args.get("warm_start_state_file"):
+        with startup.stage("saveWarmStart"):
+            await save_warm_start(
+                sumo_interface, parsed_args["warm_start_state_file"]
+            )
 
     # set up server handler and protocol
     shutdown_event = asyncio.Event()
     loop = asyncio.get_running_loop()
+    if indices_loaded is not None and not indices_loaded.done():
+        with startup.stage("awaitNetworkIndex"):
+            await indices_loaded
+    horizon_handler = None
     # TODO: refactor
     if parsed_args["rt_simulator"] == "ASM":
-        handlers = [
-            EgoVehicleUpdateHandler(
-                sumo_interface, veins_interface, shutdown_event, **parsed_args
-            ),
-            HorizonEgoTrafficLightHandler(
+        with startup.stage("setupASM"):
+            from evi.asm import ASMCodec, ASMProtocol
+            from evi.request_handlers import (
+                EgoVehicleUpdateHandler,
+                HorizonEgoTrafficLightHandler,
+                RequestDispatcher,
+            )
+
+            horizon_handler = HorizonEgoTrafficLightHandler(
                 sumo_network_file=os.path.join(
                     os.path.dirname(parsed_args["config_file"]),
                     parsed_args["sumo_network_file"],
                 ),
                 sumo_interface=sumo_interface,
-            ),
-        ]
-        dispatcher = RequestDispatcher(handlers, shutdown_event)
-        _transport, _protocol = await loop.create_datagram_endpoint(
-            lambda: ASMProtocol(
-                ASMCodec(),
+                horizon_poi_interval=parsed_args["horizon_poi_interval"],
+                horizon_workers=int(parsed_args["horizon_workers"]),
+            )
+            handlers = [
+                EgoVehicleUpdateHandler(
+                    sumo_interface,
+                    veins_interface,
+                    shutdown_event,
+                    **parsed_args,
+                ),
+                horizon_handler,
+            ]
+            dispatcher = RequestDispatcher(handlers, shutdown_event)
+            _transport, _protocol = await loop.create_datagram_endpoint(
+                lambda: ASMProtocol(
+                    ASMCodec(),
+                    dispatcher,
+                    shutdown_event,
+                    override_remote_port=parsed_args[
+                        "rt_override_remote_port"
+                    ],
+                    override_remote_host=parsed_args[
+                        "rt_override_remote_host"
+                    ],
+                ),
+                local_addr=("0.0.0.0", parsed_args.get("evi_port")),
+            )
+    elif parsed_args["rt_simulator"] == "Unity":
+        with startup.stage("setupUnity"):
+            from evi.request_handlers import (
+                RequestDispatcher,
+                UnityEgoVehicleUpdateHandler,
+            )
+            from evi.unity import UnityProtocol
+
+            # ego ids per Unity client, maintained by the protocol
+            client_egos = {}
+            handlers = [
+                UnityEgoVehicleUpdateHandler(
+                    sumo_interface,
+                    veins_interface,
+                    shutdown_event,
+                    client_egos=client_egos,
+                    **parsed_args,
+                ),
+            ]
+            dispatcher = RequestDispatcher(handlers, shutdown_event)
+            unity_protocol = UnityProtocol(
                 dispatcher,
                 shutdown_event,
-                override_remote_port=parsed_args["rt_override_remote_port"],
-                override_remote_host=parsed_args["rt_override_remote_host"],
-            ),
-            local_addr=("0.0.0.0", parsed_args.get("evi_port")),
-        )
-    elif parsed_args["rt_simulator"] == "Unity":
-        handlers = [
-            UnityEgoVehicleUpdateHandler(
-                sumo_interface, veins_interface, shutdown_event, **parsed_args
-            ),
-        ]
-        dispatcher = RequestDispatcher(handlers, shutdown_event)
-        unity_protocol = UnityProtocol(
-            dispatcher, shutdown_event, parsed_args.get("evi_port")
-        )
-        asyncio.create_task(unity_protocol.serve())
+                parsed_args.get("evi_port"),
+                client_egos=client_egos,
+                sync_timeout_s=int(parsed_args["sync_interval_ms"]) / 1000,
+            )
+            asyncio.create_task(unity_protocol.serve())
+    elif parsed_args["rt_simulator"] == "Headless":
+        with startup.stage("setupHeadless"):
+            from evi.headless import HeadlessDriver, read_vehicle_messages
+            from evi.request_handlers import (
+                EgoVehicleUpdateHandler,
+                RequestDispatcher,
+            )
+
+            handlers = [
+                EgoVehicleUpdateHandler(
+                    sumo_interface,
+                    veins_interface,
+                    shutdown_event,
+                    **parsed_args,
+                ),
+            ]
+            dispatcher = RequestDispatcher(handlers, shutdown_event)
+            headless_driver = HeadlessDriver(
+                dispatcher,
+                shutdown_event,
+                read_vehicle_messages(
+                    parsed_args["headless_trajectories"],
+                    int(parsed_args["sync_interval_ms"]) / 1000,
+                ),
+            )
+            headless_task = asyncio.create_task(headless_driver.run())
+
+    metrics_server = None
+    if parsed_args.get("metrics_port") is not None:
+        with startup.stage("serveMetrics"):
+            from evi.metrics import METRICS, serve_metrics
+
+            metrics_server = await serve_metrics(
+                METRICS,
+                parsed_args["metrics_host"],
+                parsed_args["metrics_port"],
+            )
 
     # setup signals for graceful shutdown
     for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
@@ -441,16 +822,26 @@ async def simulate(parsed_args):
 
     # let the server run
     LOG.info("Protocol set up, waiting for requests.")
+    if parsed_args.get("startup_profile"):
+        print(startup.report(), file=sys.stderr)
     with TRACER.complete("serving"):
         await shutdown_event.wait()
 
     # shut down
     LOG.info("Shutting down EVI")
+    if parsed_args["rt_simulator"] == "Headless":
+        # the driver stops after the current step (or raised an error)
+        await headless_task
     teardowns = [sumo_interface.teardown()]
     if veins_interface:
         teardowns += [veins_interface.teardown()]
+    if horizon_handler is not None:
+        teardowns += [horizon_handler.teardown()]
     with TRACER.complete("teardownInterfaces"):
         await asyncio.gather(*teardowns)
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
 
 
 async def main():
@@ -458,31 +849,61 @@ async def main():
     Run Ego Vehicle Interface Daemon.
     """
     TRACER.instant("mainStart")
+    startup = StartupProfile(IMPORT_START)
+    startup.record("imports", IMPORT_START, IMPORT_END)
 
     # register available real time simulator interfaces
-    rt_interfaces = ["ASM", "Unity"]
+    rt_interfaces = ["ASM", "Unity", "Headless"]
 
-    args = parse_args(rt_interfaces)
-    setup_logging(args)
+    with startup.stage("parseArgs"):
+        args = parse_args(rt_interfaces)
+        setup_logging(args)
 
     # prime id mapping with ego vehicle
-    if args.rt_simulator == "ASM":
+    # headless runs replaying ASM traces need the ASM mapping as well
+    if args.rt_simulator in ("ASM", "Headless"):
         # TODO: ensure reliable mapping between ego uint_ids and string_ids
         for ego_nr, ego_name in enumerate(sorted(args.ego_ids)):
             ID_MAPPER.force_add_mapping(string_id=ego_name, uint_id=ego_nr)
     elif args.rt_simulator == "Unity":
         ID_MAPPER.prime(args.ego_ids)  # prime with real id for Unity
+    net_file = os.path.join(
+        os.path.dirname(args.config_file), args.sumo_network_file
+    )
+    # the network model is only needed by the horizon handler and triggers
+    horizon = args.rt_simulator == "ASM"
+    network_model = None
+    if horizon or args.triggers_file:
+        with startup.stage("importNetworkModel"):
+            from evi.network import get_network_model
+
+            network_model = get_network_model(
+                net_file,
+                cache_dir=None if args.disable_cache else args.cache_dir,
+            )
     # prepare geo-projection mapper (lat/lon <-> x/y)
     geo_projection = None
     if not args.disable_geo_mapper:
-        geo_projection = make_geo_mapper(
-            *extract_projection_data(
-                os.path.join(
-                    os.path.dirname(args.config_file), args.sumo_network_file
+        with startup.stage("geoMapper"):
+            geo_projection = make_geo_mapper(
+                *(
+                    network_model.projection
+                    if network_model is not None
+                    else extract_projection_data(net_file)
                 )
             )
-        )
     setattr(args, "geo_projection", geo_projection)
+    # parse the network concurrently to launching and connecting simulators
+    # (cached indices do not need it, so they are loaded separately)
+    network_loaded = indices_loaded = None
+    if network_model is not None:
+        network_loaded = startup.in_thread(
+            "loadNetwork", network_model.preload, False, True
+        )
+        if horizon:
+            indices_loaded = startup.in_thread(
+                "loadNetworkIndex", network_model.preload, True, False
+            )
 
     # collect simulator subprocesses to lanch before ynode itself
     to_launch = prepare_launch_configs(args)
@@ -490,7 +911,7 @@ async def main():
     sim_subprocesses = dict()
     try:
         # launch simulator subprocesses
-        with TRACER.complete("launcSubprocs"):
+        with startup.stage("launchSubprocs"):
             sim_subproc_list = await asyncio.gather(
                 *to_launch.values(), return_exceptions=True
             )
@@ -509,7 +930,9 @@ async def main():
 
         # run the simulation
         with TRACER.complete("simulate"):
-            await simulate(parsed_args=vars(args))
+            await simulate(
+                vars(args), startup, network_loaded, indices_loaded
+            )
     finally:
         # kill simulator subprocesses that did not stop by themselves
         with TRACER.complete("shutdownSubprocs"):
@@ -518,6 +941,8 @@ async def main():
                 for name, sim_subproc in sim_subprocesses.items()
             ]
             await asyncio.gather(*shutdown_coros)
+        # flush trace events, also if the simulation failed
+        TRACER.stop_writer()
 
     # write final data
     if args.write_id_mapping_file:
@@ -526,10 +951,6 @@ async def main():
                 "Writing final id mapping to %s", args.write_id_mapping_file
             )
             id_mapping_file.write(ID_MAPPER.dump_mapping())
-    if TRACER.messages and args.event_trace_file:
-        with flex_open(args.event_trace_file, "wt") as event_trace_file:
-            num_traces = TRACER.write(event_trace_file, True)
-            LOG.info("Wrote %d trace event messages.", num_traces)
 
 
 if __name__ == "__main__":
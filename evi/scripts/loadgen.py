@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic ego vehicle load for evid, standing in for ASM or Unity.
+
+Ego vehicles drive back and forth along random routes sampled from the
+SUMO network. Their updates are sent at a fixed rate (or, closed-loop,
+as soon as all replies to the previous tick arrived) either as ASM
+datagrams (one message for all egos) or as Unity frames (one ZMQ DEALER
+client per --clients, egos are distributed among them).
+
+EVI echoes the time of a vehicle message in its traffic reply, so replies
+are matched to requests by their time. As Unity updates of several
+clients are merged into one tick, a reply answers all pending requests
+up to its time. A summary is logged and appended to --results as json.
+
+evid has to know the ego ids used, e.g.:
+    scripts/evid.py --config-file … --ego-ids loadgen-00,loadgen-01
+"""
+
+import argparse
+import asyncio
+import bisect
+import collections
+import json
+import logging
+import math
+import random
+import socket
+import time
+from typing import Deque, List, Optional, Sequence, Tuple
+
+import sumolib
+import zmq
+import zmq.asyncio
+
+import asmp.asmp_pb2 as asmp
+import evi
+from evi.asm import ASMCodec
+from evi.defaultconfig import DEFAULTS
+from evi.tracereport import summarize
+from evi.util import ID_MAPPER
+
+LOG = logging.getLogger(__name__)
+
+# time_s of replies matches requests (doubles), allow for rounding anyway
+TIME_EPSILON_S = 1e-6
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--net-file", required=True, help="SUMO network to sample routes of."
+    )
+    parser.add_argument(
+        "--rt-simulator",
+        choices=["ASM", "Unity"],
+        default="ASM",
+        help="Protocol to speak (default: %(default)s).",
+    )
+    parser.add_argument("--evi-host", default="127.0.0.1")
+    parser.add_argument(
+        "--evi-port", type=int, default=int(DEFAULTS["evi_port"])
+    )
+    parser.add_argument(
+        "--egos",
+        type=int,
+        default=1,
+        help="Number of ego vehicles (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--ego-ids",
+        type=lambda string: list(string.split(",")),
+        help="Ids of the ego vehicles (default: loadgen-00, loadgen-01, …).",
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        help="Number of Unity clients (default: one per ego).",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=10.0,
+        help="Updates per second and ego (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--closed-loop",
+        action="store_true",
+        help="Send the next tick as soon as all replies arrived.",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=60.0,
+        help="Seconds of simulation time to run (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=8.0,
+        help="Ego speed in m/s (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--vclass",
+        default="passenger",
+        help="Vehicle class routes have to allow (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--route-edges",
+        type=int,
+        default=30,
+        help="Maximum number of edges per route (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--unregister",
+        action="store_true",
+        help="Unregister all egos at the end (evid then shuts down).",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--reply-timeout",
+        type=float,
+        default=1.0,
+        help="Seconds after which a reply counts as lost (default: 1).",
+    )
+    parser.add_argument(
+        "--results",
+        help="File to append the results to as a json line.",
+    )
+    parser.add_argument(
+        "--verbosity",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+    )
+    return parser.parse_args()
+
+
+def sample_route(
+    net: sumolib.net.Net, rng: random.Random, vclass: str, max_edges: int
+) -> List[Tuple[float, float]]:
+    """Return the shape of a random walk through the network."""
+    edges = [
+        edge
+        for edge in net.getEdges(withInternal=False)
+        if edge.allows(vclass)
+    ]
+    if not edges:
+        raise ValueError(f"No edge of the network allows {vclass}")
+    edge = rng.choice(edges)
+    shape = list(edge.getLanes()[0].getShape())
+    for _ in range(max_edges - 1):
+        successors = [
+            successor
+            for successor in edge.getOutgoing()
+            if successor.allows(vclass)
+            and successor.getID() != edge.getID()
+        ]
+        if not successors:
+            break
+        edge = rng.choice(successors)
+        shape.extend(edge.getLanes()[0].getShape())
+    return shape
+
+
+class EgoDriver:
+    """An ego vehicle driving back and forth along a route shape."""
+
+    def __init__(
+        self, ego_id: str, shape: Sequence[Tuple[float, float]], speed: float
+    ) -> None:
+        self.ego_id = ego_id
+        self.speed = speed
+        self.points = [shape[0]]
+        self.offsets = [0.0]
+        for point in shape[1:]:
+            step = math.dist(self.points[-1], point)
+            if step > 0:
+                self.points.append(point)
+                self.offsets.append(self.offsets[-1] + step)
+        self.length = self.offsets[-1]
+
+    def position(self, time_s: float) -> Tuple[float, float, float]:
+        """Return x, y and compass angle (0 is North) at time_s."""
+        if self.length == 0:
+            return (*self.points[0], 0.0)
+        distance = (time_s * self.speed) % (2 * self.length)
+        backwards = distance > self.length
+        if backwards:
+            distance = 2 * self.length - distance
+        index = min(
+            max(bisect.bisect_right(self.offsets, distance) - 1, 0),
+            len(self.points) - 2,
+        )
+        (x_0, y_0), (x_1, y_1) = self.points[index], self.points[index + 1]
+        frac = (distance - self.offsets[index]) / (
+            self.offsets[index + 1] - self.offsets[index]
+        )
+        if backwards:
+            x_0, y_0, x_1, y_1 = x_1, y_1, x_0, y_0
+            frac = 1 - frac
+        angle = math.degrees(math.atan2(x_1 - x_0, y_1 - y_0)) % 360
+        return x_0 + (x_1 - x_0) * frac, y_0 + (y_1 - y_0) * frac, angle
+
+
+def make_vehicle_message(
+    egos: Sequence[Tuple[int, EgoDriver]], time_s: float, register: bool
+) -> asmp.Message:
+    """Build a vehicle message with register or update commands of egos."""
+    message = asmp.Message()
+    message.vehicle.time_s = time_s
+    for uint_id, ego in egos:
+        command = message.vehicle.commands.add()
+        vehicle = (
+            command.register_vehicle_command
+            if register
+            else command.update_vehicle_command
+        )
+        vehicle.vehicle_id = uint_id
+        vehicle.is_ego_vehicle = True
+        x, y, angle = ego.position(time_s)
+        vehicle.state.position.px = x
+        vehicle.state.position.py = y
+        vehicle.state.position.angle = angle
+        vehicle.state.speed_mps = ego.speed
+    return message
+
+
+def make_unregister_message(
+    egos: Sequence[Tuple[int, EgoDriver]], time_s: float
+) -> asmp.Message:
+    message = asmp.Message()
+    message.vehicle.time_s = time_s
+    for uint_id, _ in egos:
+        command = message.vehicle.commands.add()
+        command.unregister_vehicle_command.vehicle_id = uint_id
+    return message
+
+
+class ReplyTracker:
+    """
+    Match replies to requests by their time and collect statistics.
+
+    A reply answers all pending requests up to its time. Replies older
+    than the newest answered time are out of order, replies not answering
+    any pending request (e.g., after the request was considered lost)
+    are late.
+    """
+
+    def __init__(self) -> None:
+        self.pending: Deque[Tuple[float, float]] = collections.deque()
+        self.sent = 0
+        self.latencies: List[float] = []
+        self.reply_sizes: List[int] = []
+        self.lost = 0
+        self.late = 0
+        self.out_of_order = 0
+        self.newest_reply_s = -math.inf
+        self.reply_event = asyncio.Event()
+
+    def request_sent(self, time_s: float) -> None:
+        self.pending.append((time_s, time.perf_counter()))
+        self.sent += 1
+
+    def reply_received(self, time_s: float, size: int) -> None:
+        now = time.perf_counter()
+        self.reply_sizes.append(size)
+        if time_s < self.newest_reply_s:
+            self.out_of_order += 1
+        self.newest_reply_s = max(self.newest_reply_s, time_s)
+        matched = 0
+        while self.pending and self.pending[0][0] <= time_s + TIME_EPSILON_S:
+            self.latencies.append(now - self.pending.popleft()[1])
+            matched += 1
+        if not matched:
+            self.late += 1
+        self.reply_event.set()
+
+    def expire(self, timeout: float) -> None:
+        """Count requests pending for longer than timeout as lost."""
+        deadline = time.perf_counter() - timeout
+        while self.pending and self.pending[0][1] < deadline:
+            self.pending.popleft()
+            self.lost += 1
+
+    async def wait_for_replies(self, timeout: float) -> None:
+        """Wait until no request is pending (or expire them)."""
+        end = time.perf_counter() + timeout
+        while self.pending and time.perf_counter() < end:
+            self.reply_event.clear()
+            try:
+                await asyncio.wait_for(
+                    self.reply_event.wait(), end - time.perf_counter()
+                )
+            except asyncio.TimeoutError:
+                break
+        self.expire(0)
+
+
+class ASMClient(asyncio.DatagramProtocol):
+    """ASM stand-in, all egos share one socket like EVI expects."""
+
+    def __init__(self, egos: Sequence[Tuple[int, EgoDriver]]) -> None:
+        self.egos = egos
+        self.codec = ASMCodec()
+        self.tracker = ReplyTracker()
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        for message in self.codec.decode(data):
+            if message.HasField("vehicle"):
+                self.tracker.reply_received(message.vehicle.time_s, len(data))
+            else:
+                LOG.debug("Ignoring non-vehicle reply of %d bytes", len(data))
+
+    def send(self, message: asmp.Message) -> None:
+        assert self.transport is not None
+        self.tracker.request_sent(message.vehicle.time_s)
+        self.transport.sendto(self.codec.encode([message]))
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+
+
+class UnityClient:
+    """Unity stand-in with a ZMQ DEALER socket and its own egos."""
+
+    def __init__(
+        self,
+        context: zmq.asyncio.Context,
+        address: str,
+        egos: Sequence[Tuple[int, EgoDriver]],
+    ) -> None:
+        self.egos = egos
+        self.tracker = ReplyTracker()
+        self.socket = context.socket(zmq.DEALER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(address)
+        self._receiver = asyncio.create_task(self._receive())
+
+    async def _receive(self) -> None:
+        while True:
+            frames = await self.socket.recv_multipart()
+            time_s = None
+            for frame in frames:
+                # skip separating frames like the EVI does
+                if len(frame.strip()) <= 5:
+                    continue
+                message = asmp.Message()
+                message.ParseFromString(frame)
+                if not message.HasField("vehicle"):
+                    continue
+                commands = message.vehicle.commands
+                # updates of other clients' egos relayed by the EVI
+                if any(
+                    cmd.register_vehicle_command.is_ego_vehicle
+                    or cmd.update_vehicle_command.is_ego_vehicle
+                    for cmd in commands
+                ):
+                    continue
+                time_s = message.vehicle.time_s
+            if time_s is not None:
+                self.tracker.reply_received(time_s, sum(map(len, frames)))
+
+    def send(self, message: asmp.Message) -> None:
+        self.tracker.request_sent(message.vehicle.time_s)
+        self.socket.send_multipart([b"", message.SerializeToString()])
+
+    def close(self) -> None:
+        self._receiver.cancel()
+        self.socket.close()
+
+
+async def generate_load(args, clients, ticks: int) -> float:
+    """Send all ticks, return the duration until the last reply."""
+    period = 1 / args.rate
+    start = time.perf_counter()
+    for tick in range(ticks):
+        time_s = tick * period
+        if not args.closed_loop:
+            await asyncio.sleep(
+                max(start + time_s - time.perf_counter(), 0)
+            )
+        for client in clients:
+            client.send(
+                make_vehicle_message(client.egos, time_s, register=tick == 0)
+            )
+        for client in clients:
+            if args.closed_loop:
+                await client.tracker.wait_for_replies(args.reply_timeout)
+            else:
+                client.tracker.expire(args.reply_timeout)
+    for client in clients:
+        await client.tracker.wait_for_replies(args.reply_timeout)
+    duration = time.perf_counter() - start
+    if args.unregister:
+        for client in clients:
+            client.send(make_unregister_message(client.egos, ticks * period))
+            # no reply is expected after the last ego left
+            client.tracker.pending.clear()
+            client.tracker.sent -= 1
+        # let the messages leave before the sockets are closed
+        await asyncio.sleep(0.1)
+    return duration
+
+
+def summarize_results(args, clients, duration: float) -> dict:
+    trackers = [client.tracker for client in clients]
+    latencies = [
+        latency * 1000 for tracker in trackers for latency in tracker.latencies
+    ]
+    return {
+        "evi_version": evi.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rt_simulator": args.rt_simulator,
+        "egos": args.egos,
+        "clients": len(clients),
+        "rate_hz": None if args.closed_loop else args.rate,
+        "requests": sum(tracker.sent for tracker in trackers),
+        "replies": sum(len(tracker.reply_sizes) for tracker in trackers),
+        "lost": sum(tracker.lost for tracker in trackers),
+        "late": sum(tracker.late for tracker in trackers),
+        "out_of_order": sum(tracker.out_of_order for tracker in trackers),
+        "duration_s": duration,
+        "requests_per_s": len(latencies) / duration if duration else 0.0,
+        "latency_ms": summarize(latencies),
+        "reply_bytes": summarize(
+            [size for tracker in trackers for size in tracker.reply_sizes]
+        ),
+    }
+
+
+async def main():
+    args = parse_args()
+    logging.basicConfig(level=args.verbosity)
+    ego_ids = args.ego_ids or [
+        f"loadgen-{number:02d}" for number in range(args.egos)
+    ]
+    if len(ego_ids) != args.egos:
+        raise ValueError("Number of --ego-ids differs from --egos")
+    LOG.info("Start evid with --ego-ids %s", ",".join(ego_ids))
+
+    rng = random.Random(args.seed)
+    net = sumolib.net.readNet(args.net_file)
+    drivers = [
+        EgoDriver(
+            ego_id,
+            sample_route(net, rng, args.vclass, args.route_edges),
+            args.speed,
+        )
+        for ego_id in ego_ids
+    ]
+    ticks = int(args.duration * args.rate)
+
+    if args.rt_simulator == "ASM":
+        # evid maps the sorted ego ids to 0, 1, … for ASM
+        uint_ids = {ego_id: nr for nr, ego_id in enumerate(sorted(ego_ids))}
+        egos = [(uint_ids[driver.ego_id], driver) for driver in drivers]
+        _, asm_client = (
+            await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: ASMClient(egos),
+                remote_addr=(args.evi_host, args.evi_port),
+                family=socket.AF_INET,
+            )
+        )
+        clients = [asm_client]
+    else:
+        egos = [
+            (ID_MAPPER.to_uint(driver.ego_id), driver) for driver in drivers
+        ]
+        num_clients = min(args.clients or args.egos, args.egos)
+        context = zmq.asyncio.Context.instance()
+        clients = [
+            UnityClient(
+                context,
+                f"tcp://{args.evi_host}:{args.evi_port}",
+                egos[number::num_clients],
+            )
+            for number in range(num_clients)
+        ]
+
+    try:
+        duration = await generate_load(args, clients, ticks)
+    finally:
+        for client in clients:
+            client.close()
+
+    result = summarize_results(args, clients, duration)
+    LOG.info(
+        "%d egos: %.1f req/s, latency p50 %.2fms, p99 %.2fms, "
+        "%d lost, %d late, %d out of order",
+        result["egos"],
+        result["requests_per_s"],
+        result["latency_ms"]["p50"],
+        result["latency_ms"]["p99"],
+        result["lost"],
+        result["late"],
+        result["out_of_order"],
+    )
+    if args.results:
+        with open(args.results, "a") as results_file:
+            results_file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,7 +4,6 @@ import asmp.asmp_pb2 as asmp
 import time
 import zmq
 from zmq.asyncio import Context, Socket
-import binascii
 
 LOG = logging.getLogger(__name__)
 
@@ -13,7 +12,76 @@ LOG = logging.getLogger(__name__)
 # and extended/changed
 
 
+class LagStats:
+    """Per-client statistics of the update lag behind the first client."""
+
+    ticks: int
+    missed: int
+    total_s: float
+    max_s: float
+
+    def __init__(self) -> None:
+        self.ticks = 0
+        self.missed = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def record(self, lag_s: float) -> None:
+        self.ticks += 1
+        self.total_s += lag_s
+        self.max_s = max(self.max_s, lag_s)
+
+    def record_miss(self) -> None:
+        self.missed += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "mean_ms": 1e3 * self.total_s / self.ticks if self.ticks else 0.0,
+            "max_ms": 1e3 * self.max_s,
+        }
+
+
+class ClientState:
+    """State of a single 3DEnv instance, indexed by its ROUTER address."""
+
+    address: bytes
+    ego_ids: set
+    pending: list
+    ego_frame: bytes
+    arrival: float
+    lag: LagStats
+
+    def __init__(self, address: bytes) -> None:
+        self.address = address
+        self.ego_ids = set()
+        self.pending = []
+        self.ego_frame = b""
+        self.arrival = 0.0
+        self.lag = LagStats()
+
+    def add_message(self, message, frame: bytes) -> None:
+        for command in message.vehicle.commands:
+            if command.HasField("register_vehicle_command"):
+                self.ego_ids.add(command.register_vehicle_command.vehicle_id)
+            elif command.HasField("update_vehicle_command"):
+                self.ego_ids.add(command.update_vehicle_command.vehicle_id)
+            elif command.HasField("unregister_vehicle_command"):
+                self.ego_ids.discard(
+                    command.unregister_vehicle_command.vehicle_id
+                )
+        self.pending.append(message)
+        self.ego_frame = frame
+
+
 class Env3dProtocol:
+    """
+    Aggregates ego updates of several 3DEnv instances into ticks for the EVI.
+
+    A tick is complete once `quorum` clients sent an update,
+    or `deadline_s` after the first update of the tick arrived.
+    """
 
     context: Context
     connection: Socket
@@ -23,13 +91,12 @@ class Env3dProtocol:
     msg_queue_env3d: asyncio.Queue
     # for Messages from EVI
     msg_queue_evi: asyncio.Queue
-    msg_queue_commands: asyncio.Queue
-    client_updated: []
-    ego_vehicle_list: []
     number_of_env3ds: int
-    curr_time: float
-    curr_updates: int
-    ego_ids: []
+    quorum: int
+    deadline_s: float
+    metrics_interval: int
+    clients: dict
+    tick_clients: list
 
     def __init__(
         self,
@@ -37,7 +104,10 @@ class Env3dProtocol:
         shutdown_event: asyncio.Event,
         msg_queue_env3d: asyncio.Queue,
         msg_queue_evi: asyncio.Queue,
-        number_of_env3ds: int
+        number_of_env3ds: int,
+        quorum: int = None,
+        deadline_s: float = 0.05,
+        metrics_interval: int = 100,
     ) -> None:
         self.context = Context.instance()
         local_address = f"tcp://0.0.0.0:{env3d_port}"
@@ -48,14 +118,114 @@ class Env3dProtocol:
         self.current_id = 0
         self.msg_queue_env3d = msg_queue_env3d
         self.msg_queue_evi = msg_queue_evi
-        self.msg_queue_commands = asyncio.Queue()
-        self.ego_vehicle_list = []
         self.number_of_env3ds = number_of_env3ds
-        self.curr_time = 0.0
-        self.curr_updates = 0
-        self.client_updated = []
-        self.updates = []
-        self.ego_ids = []
+        self.quorum = quorum if quorum is not None else number_of_env3ds
+        self.deadline_s = deadline_s
+        self.metrics_interval = metrics_interval
+        # client address -> ClientState
+        self.clients = {}
+        # clients that sent updates in the current tick (in arrival order)
+        self._updated = {}
+        self._tick_start = None
+        self._tick_count = 0
+        self._update_event = asyncio.Event()
+        self._receiver = None
+        # clients that took part in the last completed tick
+        self.tick_clients = []
+
+    def _ensure_receiver(self):
+        if self._receiver is None:
+            self._receiver = asyncio.create_task(self._receive_loop())
+
+    async def _receive_loop(self):
+        """Receive updates from all 3DEnv instances and index them."""
+        while not self.shutdown_event.is_set():
+            message_bytes = await self.connection.recv_multipart()
+            arrival = time.perf_counter()
+            address = message_bytes[0]
+            client = self.clients.get(address)
+            if client is None:
+                print(f"3DEnv connector: new 3DEnv instance {address}")
+                client = self.clients[address] = ClientState(address)
+            for frame in message_bytes[1:]:
+                # skip seperating messages
+                if len(frame.strip()) <= 5:
+                    continue
+                message = asmp.Message()
+                message.ParseFromString(frame)
+                LOG.debug("Got Message from 3DEnv %s: %s", address, message)
+                client.add_message(message, frame)
+            if client.pending and address not in self._updated:
+                self._updated[address] = None
+                client.arrival = arrival
+                if self._tick_start is None:
+                    self._tick_start = arrival
+                self._update_event.set()
+
+    async def _wait_for_tick(self, quorum, deadline_s, strict=False):
+        """
+        Wait until quorum clients updated or the deadline passed.
+
+        Unless strict, the quorum is capped to the number of active clients.
+        """
+        self._ensure_receiver()
+        while True:
+            needed = quorum
+            if not strict:
+                active = sum(1 for c in self.clients.values() if c.ego_ids)
+                needed = min(quorum, max(active, 1))
+            if self._updated and len(self._updated) >= needed:
+                return
+            timeout = None
+            if self._tick_start is not None and deadline_s is not None:
+                timeout = self._tick_start + deadline_s - time.perf_counter()
+                if timeout <= 0:
+                    return
+            self._update_event.clear()
+            try:
+                await asyncio.wait_for(self._update_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    def _finish_tick(self):
+        """Close the current tick and return the merged message for EVI."""
+        self.tick_clients = list(self._updated)
+        messages = []
+        for address in self.tick_clients:
+            client = self.clients[address]
+            client.lag.record(client.arrival - self._tick_start)
+            messages.extend(client.pending)
+            client.pending = []
+        for address, client in list(self.clients.items()):
+            if address not in self._updated and client.ego_ids:
+                client.lag.record_miss()
+            if not client.ego_ids:
+                # all ego vehicles of this client unregistered
+                del self.clients[address]
+        self._updated = {}
+        self._tick_start = None
+        self._tick_count += 1
+        if self._tick_count % self.metrics_interval == 0:
+            self.log_lag_metrics()
+        return self.construct_evi_message_proto(messages)
+
+    def lag_metrics(self):
+        """Return lag statistics for every connected client."""
+        return {
+            address: client.lag.as_dict()
+            for address, client in self.clients.items()
+        }
+
+    def log_lag_metrics(self):
+        for address, metrics in self.lag_metrics().items():
+            LOG.info(
+                "3DEnv %s: lag mean %.1fms, max %.1fms, missed %d of %d ticks",
+                address,
+                metrics["mean_ms"],
+                metrics["max_ms"],
+                metrics["missed"],
+                metrics["ticks"] + metrics["missed"],
+            )
 
     # Wait for first messages from all 3DEnv instances,
     # and process these messages
@@ -64,307 +234,48 @@ class Env3dProtocol:
             "3DEnv connector is waiting for first messages "
             "from 3DEnv instances…"
         )
-        while not self.curr_updates == self.number_of_env3ds:
-            message_bytes = await self.connection.recv_multipart()
-            clientAdress = message_bytes[0]
-            # print("test")
-            # hex_data = binascii.hexlify(clientAdress)
-            # str_data = hex_data.decode('utf-8')
-            # print(str_data)
-
-            # decode
-            message = asmp.Message()
-            message.ParseFromString(message_bytes[1])
-            # print("Got Message from 3DEnv: %s", message)
-
-            # get vehicle ID
-            commands = message.vehicle.commands
-
-            for command in commands:
-                # all_fields = set([field.name for field in command._fields])
-                # if "register_vehicle_command" in all_fields:
-                if command.HasField('register_vehicle_command'):
-                    vehicle_id = command.register_vehicle_command.vehicle_id
-
-                    if vehicle_id not in self.ego_ids:
-                        self.ego_ids.append(vehicle_id)
-                        self.client_updated.append((clientAdress, vehicle_id))
-                        self.ego_vehicle_list.append((
-                            clientAdress, message, vehicle_id
-                        ))
-                        self.curr_updates += 1
-                    else:
-                        # delete entries
-                        # find element position
-                        position = list(map(
-                            lambda x: x[2],
-                            self.ego_vehicle_list
-                        )).index(vehicle_id)
-                        # delete element
-                        self.ego_vehicle_list.pop(position)
-                        # find element position
-                        position = list(map(
-                            lambda x: x[1],
-                            self.client_updated
-                        )).index(vehicle_id)
-                        # delete element
-                        self.client_updated.pop(position)
-                        # add with new position
-                        self.client_updated.append(
-                            (clientAdress, vehicle_id)
-                        )
-                        self.ego_vehicle_list.append(
-                            (clientAdress, message, vehicle_id)
-                        )
-
-                    print(
-                        f"3DEnv connector got Message from 3DEnv: {message}"
-                    )
-
-        for (address, veh_msg, veh_id) in self.ego_vehicle_list:
-            self.updates.append((address, veh_msg))
-
-        # direct ego position exchange
-        ego_message = []
-        for (client, vehicle_id) in self.client_updated:
-            adress = client
-            ego_message.clear()
-            ego_message.append(adress)
-            ego_message.append(b'')
-
-            # add other ego vehicles
-            for (client_adress, msg, ego_id) in self.ego_vehicle_list:
-                # all_fields = set([field.name for field in msg._fields])
-                if vehicle_id != ego_id:
-                    # if "register_vehicle_command" in all_fields:
-                    if command.HasField('register_vehicle_command'):
-                        command.register_vehicle_command.is_ego_vehicle = True
-                        # print("Got Message from EVI: %s", part)
-                ego_message.append(msg.SerializeToString())
-
-            print(
-                "3DEnv connector sending ego update message "
-                f"with {len(ego_message)} replies"
-            )
-            # print("Send Message to 3DEnv: %s", final_message)
-
-            # await asyncio.create_task(self._send_message_set(ego_message))
-
-        await self.msg_queue_env3d.put(await self.construct_evi_message_proto(
-            self.updates, 0.0, self.number_of_env3ds
-        ))
-
-        self.curr_updates = 0
+        await self._wait_for_tick(self.number_of_env3ds, None, strict=True)
+        await self.msg_queue_env3d.put(self._finish_tick())
 
     # Process messages from multiple 3DEnv instances
     async def serve_only(self):
-        print(
-            "3DEnv connector is waiting for messages "
-            "from 3DEnv instances…"
-        )
-        self.client_updated.clear()
-        self.curr_time = time.perf_counter()
-        stop = False
-
-        while (
-                self.curr_updates != self.number_of_env3ds
-                and abs(self.curr_time - time.perf_counter()) < 0.05
-                and not stop
-        ):
-            try:
-                # wait for at least one 3DEnv to send update message
-                if self.curr_updates == 0:
-                    message_bytes = await self.connection.recv_multipart()
-                else:
-                    message_bytes = await asyncio.wait_for(
-                        self.connection.recv_multipart(),
-                        timeout=0.05
-                    )
-            except asyncio.TimeoutError:
-                print("Timeout")
-                stop = True
-
-            if not stop:
-                clientAdress = message_bytes[0]
-                print(clientAdress)
-                # decode
-                message = asmp.Message()
-                message.ParseFromString(message_bytes[1])
-
-                # get vehicle ID
-                commands = message.vehicle.commands
-
-                for command in commands:
-                    vehicle_id = command.update_vehicle_command.vehicle_id
-
-                if (clientAdress, vehicle_id) not in self.client_updated:
-                    self.client_updated.append((clientAdress, vehicle_id))
-                    self.curr_updates += 1
-
-                if self.curr_updates == 1:
-                    self.curr_time = time.perf_counter()
-
-                print(f"3DEnv connector got Message from 3DEnv: {message}")
-
-                if vehicle_id in self.ego_ids:
-                    # update ego vehicle position message
-                    # find element position
-                    position = list(map(
-                        lambda x: x[2],
-                        self.ego_vehicle_list
-                    )).index(vehicle_id)
-                    # delete element
-                    self.ego_vehicle_list.pop(position)
-                    # add with new position
-                    self.ego_vehicle_list.append(
-                        (clientAdress, message, vehicle_id)
-                    )
-
-                self.updates.append((clientAdress, message))
-
-        # direct ego position exchange
-        ego_message = []
-        for (client, vehicle_id) in self.client_updated:
-            adress = client
-            ego_message.clear()
-            ego_message.append(adress)
-            ego_message.append(b'')
-
-            # add other ego vehicles
-            for (client_adress, msg, id) in self.ego_vehicle_list:
-                # all_fields = set([field.name for field in msg._fields])
-                if vehicle_id != id:
-                    # if "register_vehicle_command" in all_fields:
-                    if command.HasField('register_vehicle_command'):
-                        # msg.register_vehicle_command.is_ego_vehicle=True
-                        # print("Got Message from EVI: %s", part)
-                        command.register_vehicle_command.is_ego_vehicle = True
-                    # if "unregister_vehicle_command" in all_fields:
-                    if command.HasField('unregister_vehicle_command'):
-                        # msg.unregister_vehicle_command.is_ego_vehicle=True
-                        command.unregister_vehicle_command.is_ego_vehicle = (
-                            True
-                        )
-                        # print("Got Message from EVI: %s", part)
-                    # if "update_vehicle_command" in all_fields:
-                    if command.HasField('update_vehicle_command'):
-                        # msg.update_vehicle_command.is_ego_vehicle=True
-                        command.update_vehicle_command.is_ego_vehicle = True
-                        # print("Got Message from EVI: %s", part.update_vehicle_command.is_ego_vehicle)
-                    ego_message.append(msg.SerializeToString())
-
-            print(
-                "3DEnv connector sending ego update "
-                f"message with {len(ego_message)} replies"
-            )
-            # print("Send Message to 3DEnv: %s", final_message)
-
-            # await asyncio.create_task(self._send_message_set(ego_message))
-
-        # construct message out of all and put in queue for evi
-        message = await self.construct_evi_message_proto(
-            self.updates,
-            None,
-            self.number_of_env3ds
-        )
-
-        await self.msg_queue_env3d.put(message)
-
-        self.curr_updates = 0
+        LOG.debug("3DEnv connector is waiting for messages")
+        await self._wait_for_tick(self.quorum, self.deadline_s)
+        await self.msg_queue_env3d.put(self._finish_tick())
 
     # Construct EVI suitable update message
-    async def construct_evi_message_proto(
-            self,
-            message_list,
-            time_s,
-            number_messages
-    ):
-        # go through message list updated
+    @staticmethod
+    def construct_evi_message_proto(messages):
         update_message = asmp.Message()
-        if time_s is not None:
-            update_message.vehicle.time_s = time_s
-        commands = update_message.vehicle.commands
-
-        num = 0
-        already_updated = []
-        delete = []
-        result = []
-
-        for tuple_curr in message_list:
-            # print(tuple_curr)
-            if num < number_messages:
-                if tuple_curr[0] not in already_updated:
-                    delete.append(tuple_curr[1])
-                    already_updated.append(tuple_curr[0])
-
-                    add_vehicles = tuple_curr[1].vehicle.commands
-                    for add_vehicle in add_vehicles:
-                        add_command = commands.add()
-                        if add_vehicle.HasField("register_vehicle_command"):
-                            add_command.register_vehicle_command.MergeFrom(
-                                add_vehicle.register_vehicle_command
-                            )
-                        if add_vehicle.HasField("unregister_vehicle_command"):
-                            add_command.unregister_vehicle_command.MergeFrom(
-                                add_vehicle.unregister_vehicle_command
-                            )
-                        if add_vehicle.HasField("update_vehicle_command"):
-                            add_command.update_vehicle_command.MergeFrom(
-                                add_vehicle.update_vehicle_command
-                            )
-
-                    num += 1
-
-        # delete item in updates list
-
-        for y in delete:
-            position = list(map(lambda x: x[1], self.updates)).index(y)
-            # delete element
-            self.updates.pop(position)
-
-        result.append(update_message.SerializeToString())
-
-        return result
+        if messages:
+            update_message.vehicle.time_s = max(
+                message.vehicle.time_s for message in messages
+            )
+        for message in messages:
+            update_message.vehicle.commands.extend(message.vehicle.commands)
+        return [update_message.SerializeToString()]
 
     # Distribute EVI replies to all 3DEnvs
     async def reply(self):
-        print("Start replying to 3DEnv")
-        # message_strings = []
-        final_message = []
-
+        LOG.debug("Start replying to 3DEnv")
         evi_message = []
 
         # construct message to 3DEnv
-        # Fake do while loop
-        continue_loop = True
-        while continue_loop:
+        while True:
             curr_reply = await self.msg_queue_evi.get()
             if curr_reply == "":
-                continue_loop = False
-            else:
-                evi_message.append(curr_reply)
-
-        # Send reply to each client
-        for (client, vehicle_id) in self.client_updated:
-            ego_message = []
-            # add other ego vehicles
-            for (client_adress, msg, id) in self.ego_vehicle_list:
-                if vehicle_id != id:
-                    ego_message.append(msg.SerializeToString())
-
-            intermediate = ego_message + evi_message
-            adress = client
-            final_message.clear()
-            final_message.append(adress)
-            final_message.append(b'')
-
-            final_message = final_message + intermediate
-
-            await asyncio.create_task(self._send_message_set(final_message))
-            # print(
-            #     f"Send Message to 3DEnv: {final_message} "
-            #     f"with length {len(final_message)}"
-            # )
-
-    async def _send_message_set(self, message_strings):
-        await self.connection.send_multipart(message_strings)
+                break
+            evi_message.append(curr_reply)
+
+        # one multipart message per client: other egos, then EVI replies
+        sends = []
+        for address in self.tick_clients:
+            final_message = [address, b""]
+            final_message.extend(
+                client.ego_frame
+                for other, client in self.clients.items()
+                if other != address and client.ego_frame
+            )
+            final_message.extend(evi_message)
+            sends.append(self.connection.send_multipart(final_message))
+        await asyncio.gather(*sends)
@@ -2,6 +2,7 @@
 
 import asyncio
 import argparse
+import logging
 from evi_connector import EVIProtocol
 from env3d_connector import Env3dProtocol
 
@@ -14,7 +15,9 @@ number_of_env3ds = 1
 #  before starting in case of protobuf error
 
 
-async def main(env3d_port, evi_port, total_number_of_env3ds):
+async def main(
+    env3d_port, evi_port, total_number_of_env3ds, quorum, deadline_ms
+):
     print("Started interface")
     shutdown_event = asyncio.Event()
 
@@ -24,7 +27,9 @@ async def main(env3d_port, evi_port, total_number_of_env3ds):
         shutdown_event,
         msg_queue_evi,
         msg_queue_env3d,
-        total_number_of_env3ds
+        total_number_of_env3ds,
+        quorum=quorum,
+        deadline_s=deadline_ms / 1000,
     )
 
     # setup EVI client
@@ -78,9 +83,34 @@ if __name__ == '__main__':
         type=int,
         help='Number of 3DEnv Entities to connect to'
     )
+    parser.add_argument(
+        '--quorum',
+        type=int,
+        help=(
+            'Number of 3DEnv updates that complete a tick '
+            '(default: all connections)'
+        )
+    )
+    parser.add_argument(
+        '--deadline-ms',
+        type=float,
+        default=50.0,
+        help=(
+            'Time after the first update of a tick '
+            'to stop waiting for further updates (default: 50)'
+        )
+    )
+    parser.add_argument(
+        '--log-level',
+        default='WARNING',
+        help='Log level, INFO includes per-client lag metrics'
+    )
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
     asyncio.run(main(
         env3d_port=args.env3d_port,
         evi_port=args.evi_port,
-        total_number_of_env3ds=args.connections
+        total_number_of_env3ds=args.connections,
+        quorum=args.quorum,
+        deadline_ms=args.deadline_ms,
     ))
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Run headless VCE instances for many scenarios and SUMO seeds in parallel.
+
+Every run is an evid process in Headless mode that launches its own SUMO
+(and Veins, if configured in the scenario) on ports allocated for the run.
+Runs are executed in their own working directory, which collects the EVI
+log, the event and vehicle traces, the Veins results and the output of
+evid, and are pinned to their own set of CPU cores, of which there are as
+many as there are runs in parallel.
+A result index with the exit status and artifacts of each run is written
+as json lines to the output directory as runs finish.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from typing import List, NamedTuple, Optional, Sequence
+
+LOG = logging.getLogger(__name__)
+
+EVID = os.path.join(os.path.dirname(os.path.abspath(__file__)), "evid.py")
+
+
+class Scenario(NamedTuple):
+    """EVI config and ego trajectories of runs."""
+
+    name: str
+    config_file: str
+    trajectories: str
+
+
+def parse_seeds(string):
+    """Parse seeds like '1,2,5-8' into a list of ints."""
+    seeds = []
+    for part in string.split(","):
+        first, _, last = part.partition("-")
+        seeds.extend(range(int(first), int(last or first) + 1))
+    return seeds
+
+
+def parse_scenario(string):
+    """Parse a scenario like 'name=config.evi.ini,trajectories.csv'."""
+    name, _, files = string.rpartition("=")
+    config_file, _, trajectories = files.partition(",")
+    if not config_file or not trajectories:
+        raise argparse.ArgumentTypeError(
+            f"expected [NAME=]CONFIG_FILE,TRAJECTORIES, got {string!r}"
+        )
+    return Scenario(
+        name or scenario_name(config_file),
+        os.path.abspath(config_file),
+        os.path.abspath(trajectories),
+    )
+
+
+def scenario_name(config_file):
+    """Name a scenario after its EVI config file."""
+    name = os.path.basename(config_file)
+    return name[: -len(".evi.ini")] if name.endswith(".evi.ini") else name
+
+
+def available_cores() -> List[int]:
+    """Return the CPU cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--config-file", help="EVI config file of a single scenario."
+    )
+    parser.add_argument(
+        "--headless-trajectories",
+        help="Ego trajectories to drive the single scenario with "
+        "(see evi.headless).",
+    )
+    parser.add_argument(
+        "--scenario",
+        type=parse_scenario,
+        action="append",
+        default=[],
+        help="Scenario to run as [NAME=]CONFIG_FILE,TRAJECTORIES, "
+        "may be given multiple times (NAME defaults to the config file name).",
+    )
+    parser.add_argument(
+        "--seeds",
+        type=parse_seeds,
+        default=parse_seeds("1-4"),
+        help="SUMO seeds to run for each scenario, e.g., 1,2,5-8 "
+        "(default: 1-4).",
+    )
+    parser.add_argument(
+        "--cores-per-run",
+        type=int,
+        default=1,
+        help="Number of CPU cores to pin each run (evid, SUMO and Veins) to "
+        "(default: %(default)s).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of runs in parallel "
+        "(default: available CPU cores / cores per run).",
+    )
+    parser.add_argument(
+        "--no-cpu-pinning",
+        action="store_true",
+        help="Let the OS schedule runs on any CPU core.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="headless-results",
+        help="Directory for the outputs of all runs (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--evid-arg",
+        action="append",
+        default=[],
+        help="Additional argument for evid, e.g., --evid-arg=--start-time=0",
+    )
+    parser.add_argument(
+        "--verbosity",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+    )
+    args = parser.parse_args()
+    if args.config_file or args.headless_trajectories:
+        if not (args.config_file and args.headless_trajectories):
+            parser.error(
+                "--config-file and --headless-trajectories go together"
+            )
+        args.scenario.append(
+            parse_scenario(
+                f"{args.config_file},{args.headless_trajectories}"
+            )
+        )
+    if not args.scenario:
+        parser.error("no scenario given")
+    names = [scenario.name for scenario in args.scenario]
+    if len(set(names)) != len(names):
+        parser.error(f"scenario names are not unique: {', '.join(names)}")
+    if args.cores_per_run < 1:
+        parser.error("--cores-per-run must be at least 1")
+    if args.jobs is None:
+        args.jobs = max(1, len(available_cores()) // args.cores_per_run)
+    return args
+
+
+def core_slots(
+    jobs: int, cores_per_run: int, pinning: bool
+) -> "asyncio.Queue[Optional[Sequence[int]]]":
+    """
+    Return a queue with the CPU cores of each of the jobs parallel runs.
+
+    Runs are not pinned (None) if there are not enough cores for all jobs.
+    """
+    cores = available_cores()
+    if pinning and jobs * cores_per_run > len(cores):
+        LOG.warning(
+            "Not pinning runs to CPU cores, %d jobs with %d cores each "
+            "exceed the %d available cores",
+            jobs,
+            cores_per_run,
+            len(cores),
+        )
+        pinning = False
+    if pinning and not hasattr(os, "sched_setaffinity"):
+        LOG.warning("Not pinning runs to CPU cores, unsupported on this OS")
+        pinning = False
+    slots: "asyncio.Queue[Optional[Sequence[int]]]" = asyncio.Queue()
+    for job in range(jobs):
+        slots.put_nowait(
+            cores[job * cores_per_run:(job + 1) * cores_per_run]
+            if pinning
+            else None
+        )
+    return slots
+
+
+_HANDED_OUT_PORTS = set()
+
+
+def unused_port(kind):
+    """Return a free port that was not handed out to another run yet."""
+    while True:
+        with socket.socket(type=kind) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        if port not in _HANDED_OUT_PORTS:
+            _HANDED_OUT_PORTS.add(port)
+            return port
+
+
+def allocate_ports():
+    return {
+        "sumo": unused_port(socket.SOCK_STREAM),
+        "veins": unused_port(socket.SOCK_STREAM),
+        "lanradio": unused_port(socket.SOCK_DGRAM),
+        "evi": unused_port(socket.SOCK_DGRAM),
+    }
+
+
+def evid_command(args, scenario, seed, ports, run_dir):
+    """Return the evid command line of a run with outputs in run_dir."""
+    return [
+        sys.executable,
+        EVID,
+        "--config-file",
+        scenario.config_file,
+        "--rt-simulator",
+        "Headless",
+        "--headless-trajectories",
+        scenario.trajectories,
+        "--sumo-seed",
+        str(seed),
+        "--sumo-port",
+        str(ports["sumo"]),
+        "--veins-port",
+        str(ports["veins"]),
+        "--veins-lanradio-baseport",
+        str(ports["lanradio"]),
+        "--evi-port",
+        str(ports["evi"]),
+        "--veins-result-dir",
+        os.path.join(run_dir, "veins"),
+        "--logfile",
+        os.path.join(run_dir, "evi.log"),
+        "--event-trace-file",
+        os.path.join(run_dir, "trace.json.gz"),
+        "--vehicle-trace-file",
+        os.path.join(run_dir, "vehicles.csv"),
+        "--verbosity",
+        "INFO",
+        *args.evid_arg,
+    ]
+
+
+def list_artifacts(run_dir):
+    """Return the files written by a run, relative to its directory."""
+    return sorted(
+        os.path.relpath(os.path.join(directory, file_name), run_dir)
+        for directory, _, file_names in os.walk(run_dir)
+        for file_name in file_names
+    )
+
+
+async def run_once(args, scenario, seed, slots, index):
+    """Run evid once a slot is free and add its result to the index."""
+    run_dir = os.path.abspath(
+        os.path.join(args.output_dir, scenario.name, f"seed-{seed}")
+    )
+    os.makedirs(run_dir, exist_ok=True)
+    cores = await slots.get()
+    try:
+        ports = allocate_ports()
+        LOG.info(
+            "Starting %s seed %d on cores %s",
+            scenario.name,
+            seed,
+            "any" if cores is None else ",".join(map(str, cores)),
+        )
+        start = time.perf_counter()
+        with open(os.path.join(run_dir, "evid.out"), "wb") as output:
+            process = await asyncio.create_subprocess_exec(
+                *evid_command(args, scenario, seed, ports, run_dir),
+                stdout=output,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=run_dir,
+                preexec_fn=(
+                    None
+                    if cores is None
+                    # inherited by SUMO and Veins launched by evid
+                    else functools.partial(os.sched_setaffinity, 0, cores)
+                ),
+            )
+            try:
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                process.terminate()
+                await process.wait()
+                raise
+        duration = time.perf_counter() - start
+    finally:
+        slots.put_nowait(cores)
+    (LOG.info if returncode == 0 else LOG.error)(
+        "%s seed %d finished with exit code %d after %.1fs",
+        scenario.name,
+        seed,
+        returncode,
+        duration,
+    )
+    result = {
+        "scenario": scenario.name,
+        "config_file": scenario.config_file,
+        "trajectories": scenario.trajectories,
+        "seed": seed,
+        "returncode": returncode,
+        "duration_s": duration,
+        "cores": cores,
+        "ports": ports,
+        "output_dir": run_dir,
+        "artifacts": list_artifacts(run_dir),
+    }
+    index.write(json.dumps(result) + "\n")
+    index.flush()
+    return result
+
+
+async def main():
+    args = parse_args()
+    logging.basicConfig(level=args.verbosity)
+    os.makedirs(args.output_dir, exist_ok=True)
+    slots = core_slots(args.jobs, args.cores_per_run, not args.no_cpu_pinning)
+    with open(os.path.join(args.output_dir, "summary.jsonl"), "w") as index:
+        results = await asyncio.gather(
+            *(
+                run_once(args, scenario, seed, slots, index)
+                for scenario in args.scenario
+                for seed in args.seeds
+            )
+        )
+    failed = [
+        f"{result['scenario']}/{result['seed']}"
+        for result in results
+        if result["returncode"]
+    ]
+    if failed:
+        LOG.error("Failed runs: %s", ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
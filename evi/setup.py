@@ -39,7 +39,12 @@ setup(
     scripts=[
         'scripts/evid.py'
     ],
-    console_scripts=[],
+    entry_points={
+        "console_scripts": [
+            "evi-trace-report = evi.tracereport:main",
+            "evi-synthetic-sumo = evi.syntheticsumo:main",
+        ],
+    },
     classifiers=[
         # complete classifier list:
         # http://pypi.python.org/pypi?%3Aaction=list_classifiers
@@ -64,7 +69,7 @@ setup(
         "scipy",
         "numpy",
         "PyYAML",
-        "rtree",
+        "rtree>=1.1",
     ],
     extras_require={},
 )
@@ -10,7 +10,7 @@ from typing import Optional, Sequence, Tuple
 
 import asmp.asmp_pb2 as asmp
 
-from . import util
+from . import metrics, util
 from .defaultconfig import MAX_MSG_SIZE
 from .request_handlers import RequestDispatcher
 
@@ -201,8 +201,11 @@ class ASMProtocol(asyncio.Protocol):
         for reply in replies:
             reply.id = self._current_id
             self._current_id += 1
-        with util.TRACER.complete("encode", tid="asm"):
+        with util.TRACER.complete(
+            "encode", tid="asm"
+        ), metrics.ASM_ENCODE_SECONDS.time():
             serialized_message = self.codec.encode(replies)
+        metrics.ASM_MESSAGE_BYTES.set(len(serialized_message))
         if len(serialized_message) > MAX_MSG_SIZE:
             LOG.warning(
                 "message exceeds maximum message size (%d of %d bytes)",
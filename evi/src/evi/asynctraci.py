@@ -16,14 +16,20 @@ Though there is still the TODO: test the locking
 
 import asyncio
 import concurrent.futures
+import itertools
 import logging
+import struct
+import time
 from typing import (
     Any,
+    Callable,
     Dict,
     List,
     Iterable,
+    Iterator,
     Mapping,
     NamedTuple,
+    Optional,
     Sequence,
     Tuple,
     Union,
@@ -32,6 +38,7 @@ from typing import (
 import traci
 import traci.constants as tc
 import traci.exceptions
+from traci.storage import Storage
 
 LOG = logging.getLogger(__name__)
 
@@ -128,6 +135,21 @@ class AsyncTraCI:
             ]
         )
 
+    async def sync_time(self) -> int:
+        """
+        Query the current time from Sumo, e.g., if started from a state.
+        """
+        async with self._lock:
+            self._simtime_ms = round(
+                self._connection.simulation.getTime() * 1000
+            )
+        return self._simtime_ms
+
+    async def save_state(self, file_name: str) -> None:
+        """Let Sumo save the simulation state to file_name."""
+        async with self._lock:
+            self._connection.simulation.saveState(file_name)
+
     # subscription control
 
     async def subscribe_vehicle(
@@ -155,6 +177,22 @@ class AsyncTraCI:
         async with self._lock:
             self._connection.trafficlight.subscribe(tls_id, varible_ids)
 
+    async def update_trafficlight_subscriptions(
+        self,
+        subscribe: Iterable[str],
+        unsubscribe: Iterable[str],
+        variable_ids: Sequence[int],
+    ) -> None:
+        """
+        Subscribe and unsubscribe traffic lights in one TraCI exchange.
+        """
+        async with self._lock:
+            self._subscribe_bulk(
+                tc.CMD_SUBSCRIBE_TL_VARIABLE,
+                [(tls_id, variable_ids) for tls_id in subscribe]
+                + [(tls_id, ()) for tls_id in unsubscribe],
+            )
+
     def trafficlight_subscription_results(
         self,
     ) -> Mapping[str, Mapping[int, Any]]:
@@ -254,56 +292,326 @@ class AsyncTraCI:
             bottomleft, topright = self._connection.simulation.getNetBoundary()
         return NetBoundary(bottomleft, topright)
 
+    def _get_variables_bulk(
+        self,
+        cmd_id: int,
+        requests: Sequence[Tuple[int, str, Callable[[Storage], Any]]],
+    ) -> List[Any]:
+        """
+        Query many variables in a single TraCI exchange and return the values.
+
+        Each request is a (variable id, object id, decoder) triple.
+        The plain traci API sends one message per get command.
+        Here, all get commands are packed into one message instead.
+        The server answers them in order (status and result interleaved).
+
+        Relies on internals of traci.Connection (traci is pinned to 1.6.0).
+        Must be called while holding the lock.
+        """
+        if not requests:
+            return []
+        connection = self._connection
+        message = b""
+        for var_id, object_id, _decoder in requests:
+            encoded_id = object_id.encode("latin1")
+            length = 1 + 1 + 1 + 4 + len(encoded_id)
+            if length <= 255:
+                message += struct.pack("!BB", length, cmd_id)
+            else:
+                message += struct.pack("!BiB", 0, length + 4, cmd_id)
+            message += struct.pack("!Bi", var_id, len(encoded_id))
+            message += encoded_id
+        # pylint: disable=protected-access
+        connection._socket.send(struct.pack("!i", len(message) + 4) + message)
+        result = connection._recvExact()
+        if not result:
+            raise traci.exceptions.FatalTraCIError("connection closed by SUMO")
+        values = []
+        for var_id, object_id, decoder in requests:
+            self._read_status(result)
+            result.readLength()
+            response, ret_var_id = result.read("!BB")
+            ret_object_id = result.readString()
+            if (
+                response - cmd_id != 16
+                or ret_var_id != var_id
+                or ret_object_id != object_id
+            ):
+                raise traci.exceptions.FatalTraCIError(
+                    f"Received answer {response},{ret_var_id},{ret_object_id} "
+                    f"for command {cmd_id},{var_id},{object_id}."
+                )
+            result.read("!B")  # return type of the variable
+            values.append(decoder(result))
+        return values
+
+    @staticmethod
+    def _read_status(result: Storage) -> None:
+        """Read a command status from result and raise on errors."""
+        _, status_cmd_id, status = result.read("!BBB")
+        error = result.readString()
+        if status or error:
+            raise traci.exceptions.TraCIException(error, status_cmd_id)
+
+    def _subscribe_bulk(
+        self,
+        cmd_id: int,
+        subscriptions: Sequence[Tuple[str, Sequence[int]]],
+    ) -> None:
+        """
+        Change many variable subscriptions in a single TraCI exchange.
+
+        Each subscription is an (object id, variable ids) pair.
+        Empty variable ids remove the subscription of the object.
+        See _get_variables_bulk for the caveats.
+        """
+        if not subscriptions:
+            return
+        connection = self._connection
+        message = b""
+        for object_id, var_ids in subscriptions:
+            encoded_id = object_id.encode("latin1")
+            length = 1 + 1 + 8 + 8 + 4 + len(encoded_id) + 1 + len(var_ids)
+            if length <= 255:
+                message += struct.pack("!B", length)
+            else:
+                message += struct.pack("!Bi", 0, length + 4)
+            message += struct.pack(
+                "!Bddi",
+                cmd_id,
+                tc.INVALID_DOUBLE_VALUE,
+                tc.INVALID_DOUBLE_VALUE,
+                len(encoded_id),
+            )
+            message += encoded_id
+            message += struct.pack("!B", len(var_ids))
+            message += bytes(var_ids)
+        # pylint: disable=protected-access
+        connection._socket.send(struct.pack("!i", len(message) + 4) + message)
+        result = connection._recvExact()
+        if not result:
+            raise traci.exceptions.FatalTraCIError("connection closed by SUMO")
+        for object_id, var_ids in subscriptions:
+            self._read_status(result)
+            if var_ids:
+                # stores the initial values with the subscription results
+                ret_object_id, response = connection._readSubscription(result)
+                if response - cmd_id != 16 or ret_object_id != object_id:
+                    raise traci.exceptions.FatalTraCIError(
+                        f"Received answer {response},{ret_object_id} "
+                        f"for subscription {cmd_id},{object_id}."
+                    )
+
+    def _set_variables_bulk(
+        self,
+        cmd_id: int,
+        commands: Sequence[Tuple[int, str, bytes]],
+    ) -> List[str]:
+        """
+        Send many set commands in a single TraCI exchange.
+
+        Each command is a (variable id, object id, encoded value) triple.
+        Returns the error message of each command (empty on success).
+        See _get_variables_bulk for the caveats.
+        """
+        if not commands:
+            return []
+        connection = self._connection
+        message = b""
+        for var_id, object_id, value in commands:
+            encoded_id = object_id.encode("latin1")
+            length = 1 + 1 + 1 + 4 + len(encoded_id) + len(value)
+            if length <= 255:
+                message += struct.pack("!BB", length, cmd_id)
+            else:
+                message += struct.pack("!BiB", 0, length + 4, cmd_id)
+            message += struct.pack("!Bi", var_id, len(encoded_id))
+            message += encoded_id
+            message += value
+        # pylint: disable=protected-access
+        connection._socket.send(struct.pack("!i", len(message) + 4) + message)
+        result = connection._recvExact()
+        if not result:
+            raise traci.exceptions.FatalTraCIError("connection closed by SUMO")
+        errors = []
+        for _command in commands:
+            _, _status_cmd_id, status = result.read("!BBB")
+            error = result.readString()
+            errors.append(error or (f"status {status}" if status else ""))
+        return errors
+
     async def get_all_polygons(self) -> Sequence[Mapping]:
         """Return a list of all polygons as dicts with id, type, and shape."""
         # TODO: add type for polygon entry (e.g., via NamedTuple)
         async with self._lock:
-            return [
-                {
-                    "id": p_id,
-                    "type": self._connection.polygon.getType(p_id),
-                    "shape": self._connection.polygon.getShape(p_id),
-                }
-                for p_id in self._connection.polygon.getIDList()
-            ]
+            polygon_ids = self._connection.polygon.getIDList()
+            values = self._get_variables_bulk(
+                tc.CMD_GET_POLYGON_VARIABLE,
+                [
+                    (var_id, p_id, decoder)
+                    for p_id in polygon_ids
+                    for var_id, decoder in (
+                        (tc.VAR_TYPE, Storage.readString),
+                        (tc.VAR_SHAPE, Storage.readShape),
+                    )
+                ],
+            )
+        return [
+            {"id": p_id, "type": p_type, "shape": p_shape}
+            for p_id, p_type, p_shape in zip(
+                polygon_ids, values[0::2], values[1::2]
+            )
+        ]
 
     async def get_trafficlight_id_list(self) -> Sequence[str]:
         """Return a list of all traffig lights' ids."""
         async with self._lock:
             return self._connection.trafficlight.getIDList()
 
+    async def get_trafficlight_positions(
+        self,
+    ) -> Dict[str, Tuple[float, float]]:
+        """
+        Return a position for every traffic light.
+
+        The position is the mean of the stop lines of all controlled lanes.
+        """
+        async with self._lock:
+            tls_ids = self._connection.trafficlight.getIDList()
+            controlled_lanes = self._get_variables_bulk(
+                tc.CMD_GET_TL_VARIABLE,
+                [
+                    (tc.TL_CONTROLLED_LANES, tls_id, Storage.readStringList)
+                    for tls_id in tls_ids
+                ],
+            )
+            lane_ids = sorted(
+                {lane for lanes in controlled_lanes for lane in lanes}
+            )
+            lane_shapes = dict(
+                zip(
+                    lane_ids,
+                    self._get_variables_bulk(
+                        tc.CMD_GET_LANE_VARIABLE,
+                        [
+                            (tc.VAR_SHAPE, lane_id, Storage.readShape)
+                            for lane_id in lane_ids
+                        ],
+                    ),
+                )
+            )
+        positions = {}
+        for tls_id, lanes in zip(tls_ids, controlled_lanes):
+            stop_lines = [lane_shapes[lane][-1] for lane in lanes]
+            if stop_lines:
+                positions[tls_id] = (
+                    sum(x for x, _ in stop_lines) / len(stop_lines),
+                    sum(y for _, y in stop_lines) / len(stop_lines),
+                )
+        return positions
+
     # annotation drawing
 
+    async def has_gui(self) -> bool:
+        """Return whether the TraCI server is a SUMO GUI instance."""
+        async with self._lock:
+            try:
+                return bool(self._connection.gui.getIDList())
+            except traci.exceptions.TraCIException:
+                # the gui domain is not implemented by plain sumo
+                return False
+
+    @staticmethod
+    def _encode_poi(
+        x: float,
+        y: float,
+        color: Sequence[int],
+        poiType: str = "",
+        layer: int = 0,
+        imgFile: str = "",
+        width: float = 1,
+        height: float = 1,
+        angle: float = 0,
+    ) -> bytes:
+        """Encode the value of a POI add command (as traci's poi.add)."""
+        # pylint: disable=invalid-name
+        return (
+            struct.pack("!Bi", tc.TYPE_COMPOUND, 8)
+            + struct.pack("!Bi", tc.TYPE_STRING, len(poiType))
+            + poiType.encode("latin1")
+            + struct.pack(
+                "!BBBBB",
+                tc.TYPE_COLOR,
+                *(int(channel) for channel in color[:3]),
+                int(color[3]) if len(color) > 3 else 255,
+            )
+            + struct.pack("!Bi", tc.TYPE_INTEGER, layer)
+            + struct.pack("!Bdd", tc.POSITION_2D, x, y)
+            + struct.pack("!Bi", tc.TYPE_STRING, len(imgFile))
+            + imgFile.encode("latin1")
+            + struct.pack("!Bd", tc.TYPE_DOUBLE, width)
+            + struct.pack("!Bd", tc.TYPE_DOUBLE, height)
+            + struct.pack("!Bd", tc.TYPE_DOUBLE, angle)
+        )
+
+    async def update_pois(
+        self,
+        remove: Iterable[str] = (),
+        move: Iterable[Tuple[str, Tuple[float, float]]] = (),
+        add: Iterable[dict] = (),
+    ) -> List[str]:
+        """
+        Remove, move, and add POIs in a single TraCI exchange.
+
+        POIs to add are given as keyword arguments of traci's poi.add.
+        Returns the ids of all POIs for which a command failed.
+        """
+        commands = [
+            (tc.REMOVE, poi_id, struct.pack("!Bi", tc.TYPE_INTEGER, 0))
+            for poi_id in remove
+        ]
+        commands.extend(
+            (
+                tc.VAR_POSITION,
+                poi_id,
+                struct.pack("!Bdd", tc.POSITION_2D, x, y),
+            )
+            for poi_id, (x, y) in move
+        )
+        commands.extend(
+            (
+                tc.ADD,
+                poi["poiID"],
+                self._encode_poi(
+                    **{key: val for key, val in poi.items() if key != "poiID"}
+                ),
+            )
+            for poi in add
+        )
+        async with self._lock:
+            errors = self._set_variables_bulk(
+                tc.CMD_SET_POI_VARIABLE, commands
+            )
+        failed_poi_ids = []
+        for (_var_id, poi_id, _value), error in zip(commands, errors):
+            if error:
+                LOG.warning(
+                    "Could not update POI '%s', TracCI says: %s", poi_id, error
+                )
+                failed_poi_ids.append(poi_id)
+        return failed_poi_ids
+
     async def remove_pois(self, poi_ids: Iterable[str]) -> Iterable[str]:
         """Remove a collection of POIs."""
-        removed_poi_ids = []
-        async with self._lock:
-            for poi_id in poi_ids:
-                try:
-                    self._connection.poi.remove(poi_id)
-                    removed_poi_ids.append(poi_id)
-                except traci.exceptions.TraCIException as ex:
-                    LOG.warning(
-                        "Could not remove POI '%s', TracCI says: %s",
-                        poi_id,
-                        ex,
-                    )
-        return removed_poi_ids
+        poi_ids = list(poi_ids)
+        failed = set(await self.update_pois(remove=poi_ids))
+        return [poi_id for poi_id in poi_ids if poi_id not in failed]
 
     async def add_pois(self, pois: Iterable[dict]) -> Iterable[str]:
-        successful_poi_ids = []
-        async with self._lock:
-            for poi in pois:
-                try:
-                    self._connection.poi.add(**poi)
-                    successful_poi_ids.append(poi["poiID"])
-                except traci.exceptions.TraCIException as ex:
-                    LOG.warning(
-                        "Could not add POI '%s', TracCI says: %s",
-                        poi["poiID"],
-                        ex,
-                    )
-        return successful_poi_ids
+        """Add a collection of POIs (given as arguments of poi.add)."""
+        pois = list(pois)
+        failed = set(await self.update_pois(add=pois))
+        return [poi["poiID"] for poi in pois if poi["poiID"] not in failed]
 
 
 class PoiTracer:
@@ -311,21 +619,53 @@ class PoiTracer:
     Helper class to trace Point of Interest in Sumo GUI.
 
     Mostly for debugging, modeled after Veins' annotation modules.
+
+    Only the difference to the previous coordinates of an owner is sent,
+    moving POIs of vanished coordinates to new ones, in a single exchange.
+    Updates of an owner within min_interval_s of the last one are dropped.
+    Without a GUI attached to Sumo, nothing is traced at all.
     """
 
     _atraci: AsyncTraCI
-    _poi: Dict[str, List[str]]
-    _colors: Dict[str, Tuple[float, float, float, float]]
+    _poi: Dict[Any, Dict[Tuple[float, float], str]]
+    _poi_nrs: Dict[Any, Iterator[int]]
+    _colors: Dict[Any, Tuple[int, int, int, int]]
+    _last_update: Dict[Any, float]
+    min_interval_s: float
+    enabled: Optional[bool]
 
-    def __init__(self, atraci: AsyncTraCI) -> None:
+    def __init__(
+        self,
+        atraci: AsyncTraCI,
+        min_interval_s: float = 1.0,
+        enabled: Optional[bool] = None,
+    ) -> None:
+        """
+        Set up tracing to atraci.
+
+        If enabled is None, tracing is enabled if Sumo runs with a GUI.
+        """
         self._atraci = atraci
         self._poi = {}
+        self._poi_nrs = {}
         self._colors = {}
+        self._last_update = {}
+        self.min_interval_s = min_interval_s
+        self.enabled = enabled
 
     async def update(self, coords, owner=None) -> None:
-        # find and clear previous pois for owner
-        last_poi = list(self._poi.get(owner, []) if owner is not None else [])
-        await self._atraci.remove_pois(last_poi)
+        """Trace coords (replacing the previous ones of owner)."""
+        if self.enabled is None:
+            self.enabled = await self._atraci.has_gui()
+            if not self.enabled:
+                LOG.info("Sumo runs without GUI, disabling POI tracing.")
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        last_update = self._last_update.get(owner)
+        if last_update is not None and now - last_update < self.min_interval_s:
+            return
+        self._last_update[owner] = now
 
         # find or set up color for owner
         if owner not in self._colors:
@@ -338,15 +678,40 @@ class PoiTracer:
             )
         color = self._colors[owner]
 
-        # create pois for coords
-        new_poi = [
+        # diff against the previous pois of owner
+        last_poi = self._poi.get(owner, {})
+        new_coords = list(dict.fromkeys(coords))
+        new_poi = {
+            coord: last_poi[coord] for coord in new_coords if coord in last_poi
+        }
+        vacant_ids = [
+            poi_id
+            for coord, poi_id in last_poi.items()
+            if coord not in new_poi
+        ]
+        added_coords = [coord for coord in new_coords if coord not in new_poi]
+        poi_nrs = self._poi_nrs.setdefault(owner, itertools.count())
+        move = list(zip(vacant_ids, added_coords))
+        remove = vacant_ids[len(move):]
+        add = [
             {
                 "x": coord[0],
                 "y": coord[1],
-                "poiID": f"{str(owner)}-{nr}",
+                "poiID": f"{str(owner)}-{next(poi_nrs)}",
                 "color": color,
                 "layer": 6,
             }
-            for nr, coord in enumerate(coords)
+            for coord in added_coords[len(move):]
         ]
-        self._poi[owner] = list(await self._atraci.add_pois(new_poi))
+        new_poi.update((coord, poi_id) for poi_id, coord in move)
+        new_poi.update(((poi["x"], poi["y"]), poi["poiID"]) for poi in add)
+        if not (remove or move or add):
+            return
+        failed = set(
+            await self._atraci.update_pois(remove=remove, move=move, add=add)
+        )
+        self._poi[owner] = {
+            coord: poi_id
+            for coord, poi_id in new_poi.items()
+            if poi_id not in failed
+        }
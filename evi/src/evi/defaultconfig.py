@@ -1,9 +1,14 @@
 """
 Common configuration options for the Ego Vehicle Interface.
 """
+import os
 
 DEFAULT_EVI_PORT = 12346
 MAX_MSG_SIZE = 1500
+# bump to invalidate cached warm start states (see evid --warm-start)
+WARM_START_CACHE_VERSION = 1
+# bump to invalidate cached network init data for Veins
+NETWORK_INIT_CACHE_VERSION = 1
 DEFAULT_SUMO_OPTS = [
     "--no-step-log",
     "--no-duration-log",
@@ -22,6 +27,12 @@ DEFAULTS = {
     "rt_fellow_filter": "statically_distributed",
     "rt_override_remote_port": -1,
     "rt_override_remote_host": "",
+    "tls_visibility_radius": "500",
+    "tls_full_refresh_interval": "50",
+    "horizon_poi_interval": "1.0",
+    "horizon_workers": 0,
+    "metrics_port": "None",
+    "metrics_host": "127.0.0.1",
     "sumo_port": 8813,
     "sumo_host": "127.0.0.1",
     "sumo_binary": "sumo",
@@ -31,6 +42,8 @@ DEFAULTS = {
     "sync_interval_ms": 100,
     "veins_max_vehicles": "None",
     "veins_fellow_filter": "statically_distributed",
+    "event_trace_format": "json",
+    "event_trace_sampling": "",
     "verbosity": "WARNING",
     "ego_ids": ["ego-0"],
     "ego_type": "ego-type",
@@ -39,4 +52,8 @@ DEFAULTS = {
     "veins_config_name": "LanradioDisabled",
     "veins_scenario_dir": "./veins",
     "veins_runnr": 0,
+    "cache_dir": os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+        "evi",
+    ),
 }
@@ -166,3 +166,69 @@ class TrafficFilter:
         for mod_vehicle in traffic_changes["mod"]:
             assert mod_vehicle.id in last_ids
         return True
+
+
+class TrafficLightFilter:
+    """
+    Stateful filter to derive traffic light changes for the rt simulator.
+
+    Only traffic lights close to any ego vehicle (within visibility_radius)
+    are considered, and of these only the ones whose state changed.
+    Every full_refresh_interval updates, all visible ones are returned.
+    """
+
+    def __init__(
+        self,
+        positions=None,
+        visibility_radius=None,
+        full_refresh_interval=None,
+    ):
+        self._positions = positions if positions is not None else dict()
+        self._visibility_radius = visibility_radius
+        self._full_refresh_interval = full_refresh_interval
+        self._last_states = dict()
+        self._updates = 0
+
+    def reset(self):
+        """Return all visible traffic lights on the next call again."""
+        self._last_states = dict()
+
+    def is_visible(self, tls_id, ego_vehicles):
+        """Check if the traffic light is close to any ego vehicle."""
+        position = self._positions.get(tls_id)
+        if self._visibility_radius is None or position is None:
+            return True
+        return any(
+            math.hypot(
+                ego.position.x - position[0], ego.position.y - position[1]
+            )
+            <= self._visibility_radius
+            for ego in ego_vehicles
+        )
+
+    def derive_changes(self, trafficlights, ego_vehicles, time_s):
+        """
+        Return the visible traffic lights that changed since the last call.
+        """
+        full_refresh = (
+            self._full_refresh_interval is not None
+            and self._updates % self._full_refresh_interval == 0
+        )
+        self._updates += 1
+        changes = set()
+        states = dict()
+        for trafficlight in trafficlights:
+            if not self.is_visible(trafficlight.id, ego_vehicles):
+                continue
+            # time to switch counts down, compare the absolute switch time
+            state = (
+                trafficlight.signals,
+                trafficlight.phase_nr,
+                trafficlight.program_id,
+                round(time_s + trafficlight.time_to_switch, 3),
+            )
+            if full_refresh or self._last_states.get(trafficlight.id) != state:
+                changes.add(trafficlight)
+            states[trafficlight.id] = state
+        self._last_states = states
+        return frozenset(changes)
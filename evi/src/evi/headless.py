@@ -0,0 +1,223 @@
+"""
+Drive EVI headless from ego trajectories instead of a real-time simulator.
+
+Trajectories are read from csv files (optionally compressed), either
+- scripted trajectories with columns time_s,vehicle_id,x,y,angle,speed,
+- vehicle traces written by evid (see --vehicle-trace-file), or
+- ASM traces as written by pcapreplay.py, whose messages are replayed as is.
+Ego states of trajectories are sampled every sync interval, holding the
+last state of an ego until its trajectory ends. The resulting vehicle
+messages are processed by the request handlers one after another,
+as fast as possible.
+"""
+
+import asyncio
+import binascii
+import bisect
+import collections
+import csv
+import logging
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Sequence
+
+import asmp.asmp_pb2 as asmp
+
+from .asm import ASMCodec
+from .defaultconfig import DEFAULT_EVI_PORT
+from .util import ID_MAPPER, TRACER, flex_open
+
+LOG = logging.getLogger(__name__)
+
+SCRIPTED_COLUMNS = ("time_s", "vehicle_id", "x", "y", "angle", "speed")
+
+
+class EgoSample(NamedTuple):
+    """State of an ego vehicle at a point in time of its trajectory."""
+
+    time_s: float
+    vehicle_id: str
+    x: float
+    y: float
+    angle: float
+    speed: float
+
+
+def _read_scripted(rows: Iterable[Dict[str, str]]) -> Iterator[EgoSample]:
+    for row in rows:
+        yield EgoSample(
+            float(row["time_s"]),
+            row["vehicle_id"],
+            float(row["x"]),
+            float(row["y"]),
+            float(row["angle"]),
+            float(row["speed"]),
+        )
+
+
+def _read_vehicle_trace(
+    rows: Iterable[Dict[str, str]]
+) -> Iterator[EgoSample]:
+    for row in rows:
+        if row["callName"] != "sumoResult":
+            continue
+        yield EgoSample(
+            int(row["moduleSimTimeMs"]) / 1000,
+            row["vehicleId"],
+            float(row["x"]),
+            float(row["y"]),
+            float(row["angle"]),
+            float(row["speed"]),
+        )
+
+
+def _read_asm_trace(rows: Iterable[Dict[str, str]]) -> Iterator[asmp.Message]:
+    codec = ASMCodec()
+    for row in rows:
+        if int(row["sport"]) == DEFAULT_EVI_PORT:
+            # reply of EVI
+            continue
+        for message in codec.decode(binascii.unhexlify(row["payload"])):
+            if message.HasField("vehicle"):
+                yield message
+
+
+def sample_trajectories(
+    samples: Iterable[EgoSample], interval_s: float
+) -> Iterator[asmp.Message]:
+    """
+    Yield vehicle messages with the ego states every interval_s.
+
+    Egos are registered at their first sample and unregistered after their
+    last one. An ego is held (instead of unregistered) if no other ego would
+    be left before the end, as EVI shuts down once all egos unregistered.
+    """
+    trajectories: Dict[str, List[EgoSample]] = collections.defaultdict(list)
+    for sample in samples:
+        trajectories[sample.vehicle_id].append(sample)
+    if not trajectories:
+        return
+    for trajectory in trajectories.values():
+        trajectory.sort()
+    times = {
+        ego_id: [sample.time_s for sample in trajectory]
+        for ego_id, trajectory in trajectories.items()
+    }
+    begin_s = min(trajectory[0].time_s for trajectory in trajectories.values())
+    end_s = max(trajectory[-1].time_s for trajectory in trajectories.values())
+    # tolerate rounding errors of the sample times
+    epsilon_s = interval_s * 1e-6
+
+    registered: Dict[str, EgoSample] = {}
+    step = 0
+    while begin_s + step * interval_s <= end_s + epsilon_s:
+        time_s = begin_s + step * interval_s
+        step += 1
+        current = {}
+        for ego_id, trajectory in trajectories.items():
+            index = bisect.bisect_right(times[ego_id], time_s + epsilon_s)
+            if index > 0 and time_s <= trajectory[-1].time_s + epsilon_s:
+                current[ego_id] = trajectory[index - 1]
+        if not current:
+            if not registered:
+                continue
+            current = registered
+        message = asmp.Message()
+        message.vehicle.time_s = time_s
+        for ego_id in sorted(registered.keys() - current.keys()):
+            command = message.vehicle.commands.add()
+            command.unregister_vehicle_command.vehicle_id = ID_MAPPER.to_uint(
+                ego_id
+            )
+        for ego_id, sample in sorted(current.items()):
+            command = message.vehicle.commands.add()
+            vehicle = (
+                command.update_vehicle_command
+                if ego_id in registered
+                else command.register_vehicle_command
+            )
+            vehicle.vehicle_id = ID_MAPPER.to_uint(ego_id)
+            vehicle.is_ego_vehicle = True
+            vehicle.state.position.px = sample.x
+            vehicle.state.position.py = sample.y
+            vehicle.state.position.angle = sample.angle
+            vehicle.state.speed_mps = sample.speed
+        registered = current
+        yield message
+
+    message = asmp.Message()
+    message.vehicle.time_s = begin_s + step * interval_s
+    for ego_id in sorted(registered):
+        command = message.vehicle.commands.add()
+        command.unregister_vehicle_command.vehicle_id = ID_MAPPER.to_uint(
+            ego_id
+        )
+    yield message
+
+
+def read_vehicle_messages(
+    file_name: str, interval_s: float
+) -> Iterator[asmp.Message]:
+    """Read a trajectory file and yield the vehicle messages to process."""
+    with flex_open(file_name, "rt") as csv_file:
+        reader = csv.DictReader(csv_file)
+        fields = set(reader.fieldnames or ())
+        if "payload" in fields:
+            yield from _read_asm_trace(reader)
+            return
+        if "moduleSimTimeMs" in fields:
+            samples = list(_read_vehicle_trace(reader))
+        elif fields.issuperset(SCRIPTED_COLUMNS):
+            samples = list(_read_scripted(reader))
+        else:
+            raise ValueError(
+                f"Unknown trajectory format of {file_name} "
+                f"(columns: {', '.join(sorted(fields))})"
+            )
+    yield from sample_trajectories(samples, interval_s)
+
+
+class HeadlessDriver:
+    """
+    Feed vehicle messages into a request dispatcher, one after another.
+
+    Sets the shutdown event once all messages were processed.
+    """
+
+    def __init__(
+        self,
+        dispatcher,
+        shutdown_event: asyncio.Event,
+        messages: Iterable[asmp.Message],
+    ) -> None:
+        self.dispatcher = dispatcher
+        self.shutdown_event = shutdown_event
+        self.messages = messages
+        self.steps = 0
+        self.replies = 0
+
+    def _count_replies(self, replies: Sequence) -> None:
+        self.replies += len(replies)
+
+    async def run(self) -> None:
+        """Process all messages as fast as possible."""
+        start = time.perf_counter()
+        try:
+            for message in self.messages:
+                if self.shutdown_event.is_set():
+                    LOG.warning("Shutdown before all trajectories were driven")
+                    break
+                with TRACER.complete("headlessStep", tid="headless"):
+                    await self.dispatcher.process(
+                        message, self._count_replies
+                    )
+                self.steps += 1
+        finally:
+            duration = time.perf_counter() - start
+            LOG.info(
+                "Drove %d steps in %.1fs (%.1f steps/s, %d replies)",
+                self.steps,
+                duration,
+                self.steps / duration if duration else 0.0,
+                self.replies,
+            )
+            self.shutdown_event.set()
@@ -0,0 +1,320 @@
+"""
+Live metrics of the EVI in the Prometheus text exposition format.
+
+Metrics are registered in the shared METRICS registry
+and served via HTTP by serve_metrics (see evid --metrics-port).
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+LOG = logging.getLogger(__name__)
+
+# seconds, from sub-millisecond encoding to (too) slow simulation steps
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(
+                key,
+                value.replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for key, value in labels
+        )
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing count, e.g., of dropped requests."""
+
+    TYPE = "counter"
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        return [
+            f"{name}_total{_format_labels(labels)} "
+            f"{_format_value(self.value)}"
+        ]
+
+
+class Gauge:
+    """Current value, e.g., of the number of vehicles."""
+
+    TYPE = "gauge"
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class _Timer:
+    """Context manager observing its duration in a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "Histogram") -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    """Distribution of observed values (by default durations in seconds)."""
+
+    TYPE = "histogram"
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.bounds = sorted(buckets)
+        # last bucket is +Inf, counts are not cumulative
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """Return a context manager observing the duration of its body."""
+        return _Timer(self)
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(
+            [*self.bounds, float("inf")], self.counts
+        ):
+            cumulative += count
+            samples.append(
+                f"{name}_bucket"
+                f"{_format_labels(labels + (('le', _format_value(bound)),))}"
+                f" {cumulative}"
+            )
+        samples.append(
+            f"{name}_sum{_format_labels(labels)} {_format_value(self.sum)}"
+        )
+        samples.append(f"{name}_count{_format_labels(labels)} {self.count}")
+        return samples
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class MetricsRegistry:
+    """
+    Collection of metric families, each with metrics per set of labels.
+    """
+
+    _families: Dict[str, Tuple[str, str, Dict[Labels, Metric]]]
+
+    def __init__(self) -> None:
+        self._families = {}
+
+    def _get(
+        self,
+        metric_type,
+        name: str,
+        help_text: str,
+        labels: Optional[Dict[str, str]],
+        **kwargs,
+    ):
+        type_name, _, children = self._families.setdefault(
+            name, (metric_type.TYPE, help_text, {})
+        )
+        assert type_name == metric_type.TYPE, f"{name} is a {type_name}"
+        key = tuple(sorted((labels or {}).items()))
+        if key not in children:
+            children[key] = metric_type(**kwargs)
+        return children[key]
+
+    def counter(
+        self,
+        name: str,
+        help_text: str,
+        labels: Optional[Dict[str, str]] = None,
+    ) -> Counter:
+        """Return the counter name (with labels), create it if needed."""
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        labels: Optional[Dict[str, str]] = None,
+    ) -> Gauge:
+        """Return the gauge name (with labels), create it if needed."""
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        """Return the histogram name (with labels), create it if needed."""
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, (type_name, help_text, children) in sorted(
+            self._families.items()
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for labels, metric in children.items():
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(
+    registry: "MetricsRegistry", host: str, port: int
+) -> asyncio.AbstractServer:
+    """Serve GET /metrics of registry via HTTP, return the started server."""
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), 5.0
+            )
+            method, path, *_ = request.split(b"\r\n", 1)[0].split(b" ")
+            if method == b"GET" and path.split(b"?")[0] == b"/metrics":
+                status = b"200 OK"
+                body = registry.render().encode()
+            else:
+                status = b"404 Not Found"
+                body = b"Metrics are served at /metrics\n"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            asyncio.TimeoutError,
+            ConnectionError,
+            ValueError,
+        ) as exc:
+            LOG.debug("Invalid metrics request: %s", exc)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    LOG.info("Serving metrics at http://%s:%d/metrics", host, port)
+    return server
+
+
+# default metrics registry
+METRICS = MetricsRegistry()
+
+# metrics of the EVI components
+EGO_REQUEST_SECONDS = METRICS.histogram(
+    "evi_ego_request_seconds", "Time to process an ego vehicle update."
+)
+SUMO_STEP_SECONDS = METRICS.histogram(
+    "evi_sumo_step_seconds",
+    "Time of a SUMO step incl. ego updates and traffic retrieval.",
+)
+VEINS_ROUNDTRIP_SECONDS = METRICS.histogram(
+    "evi_veins_roundtrip_seconds",
+    "Time from sending traffic to Veins until its reply.",
+)
+ASM_ENCODE_SECONDS = METRICS.histogram(
+    "evi_encode_seconds", "Time to encode messages.", {"protocol": "asm"}
+)
+UNITY_ENCODE_SECONDS = METRICS.histogram(
+    "evi_encode_seconds", "Time to encode messages.", {"protocol": "unity"}
+)
+VEINS_ENCODE_SECONDS = METRICS.histogram(
+    "evi_encode_seconds", "Time to encode messages.", {"protocol": "veins"}
+)
+EGO_VEHICLES = METRICS.gauge(
+    "evi_ego_vehicles", "Number of active ego vehicles."
+)
+SUBSCRIBED_VEHICLES = METRICS.gauge(
+    "evi_subscribed_vehicles", "Number of vehicles subscribed to in SUMO."
+)
+FELLOW_VEHICLES = METRICS.gauge(
+    "evi_fellow_vehicles", "Number of fellow vehicles in the last reply."
+)
+ASM_MESSAGE_BYTES = METRICS.gauge(
+    "evi_message_bytes", "Size of the last sent message.", {"protocol": "asm"}
+)
+UNITY_MESSAGE_BYTES = METRICS.gauge(
+    "evi_message_bytes",
+    "Size of the last sent message.",
+    {"protocol": "unity"},
+)
+VEINS_MESSAGE_BYTES = METRICS.gauge(
+    "evi_message_bytes",
+    "Size of the last sent message.",
+    {"protocol": "veins"},
+)
+DROPPED_REQUESTS = METRICS.counter(
+    "evi_dropped_requests", "Requests not (completely) processed."
+)
+COALESCED_REQUESTS = METRICS.counter(
+    "evi_coalesced_requests",
+    "Vehicle updates merged into the update of another client.",
+)
+DISPATCHER_QUEUE_DEPTH = METRICS.gauge(
+    "evi_dispatcher_queue_depth", "Requests currently being processed."
+)
@@ -0,0 +1,252 @@
+"""
+Sumo network model shared by all EVI components.
+
+The network file is parsed at most once per process (see get_network_model).
+Index data derived from it is persisted in a DiskCache
+keyed by the contents of the network file.
+"""
+
+import functools
+import logging
+import os
+import pickle
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import sumolib
+
+from . import routehelper
+from .util import TRACER, DiskCache, extract_projection_data, hash_files
+
+LOG = logging.getLogger(__name__)
+
+NETWORK_MODEL_CACHE_VERSION = 3
+
+
+class NetworkIndexData(NamedTuple):
+    """Derived data of a Sumo network that is expensive to recompute."""
+
+    projection_params: str
+    offset: Tuple[float, float]
+    lane_ids: List[str]
+    lane_index: Tuple[np.ndarray, np.ndarray, np.ndarray]
+    junction_ids: List[str]
+    junction_index: Tuple[np.ndarray, np.ndarray, np.ndarray]
+    routing_index: routehelper.RoutingIndexData
+    tls_link_table: routehelper.TLSLinkTableData
+
+
+class NetworkModel:
+    """
+    A Sumo network and the indices built on top of it.
+
+    Everything is loaded lazily on first access.
+    Indices are set up from the index data alone and only look up
+    the objects of the network (and thus parse it) when they return them.
+    Without a cache, all index data is recomputed from the network.
+    """
+
+    net_file: str
+    cache: Optional[DiskCache]
+
+    def __init__(
+        self, net_file: str, cache_dir: Optional[str] = None
+    ) -> None:
+        self.net_file = net_file
+        self.cache = (
+            DiskCache(cache_dir, "netmodel", NETWORK_MODEL_CACHE_VERSION)
+            if cache_dir is not None
+            else None
+        )
+        self._cache_key: Optional[str] = None
+        self._cached_index_data: Optional[NetworkIndexData] = None
+
+    @property
+    def cache_key(self) -> str:
+        """Hash of the network file."""
+        if self._cache_key is None:
+            self._cache_key = hash_files([self.net_file])
+        return self._cache_key
+
+    def _load_cached_index_data(self) -> Optional[NetworkIndexData]:
+        if self.cache is None:
+            return None
+        if self._cached_index_data is None:
+            data = self.cache.load(self.cache_key)
+            if data is not None:
+                LOG.debug("Using cached index data for %s", self.net_file)
+                self._cached_index_data = NetworkIndexData(
+                    *pickle.loads(data)
+                )
+        return self._cached_index_data
+
+    @functools.cached_property
+    def net(self) -> sumolib.net.Net:
+        """The sumolib network (with internal edges and tls programs)."""
+        with TRACER.complete("readNet", tid="network"):
+            return sumolib.net.readNet(
+                self.net_file, withInternal=True, withPrograms=True
+            )
+
+    @functools.cached_property
+    def index_data(self) -> NetworkIndexData:
+        """
+        Derived index data, loaded from the cache if possible.
+
+        The cache key is the hash of the network file,
+        so cached data is used without reading the network.
+        """
+        index_data = self._load_cached_index_data()
+        if index_data is not None:
+            return index_data
+        with TRACER.complete("buildNetworkIndex", tid="network"):
+            lanes = [
+                lane
+                for edge in self.net.getEdges()
+                for lane in edge.getLanes()
+                if not lane.getID().startswith(":")
+            ]
+            junctions = [
+                node
+                for node in self.net.getNodes()
+                if node.getType() != "dead_end"
+            ]
+            index_data = NetworkIndexData(
+                *self.projection,
+                lane_ids=[lane.getID() for lane in lanes],
+                lane_index=routehelper.LaneFinder.index_data(lanes),
+                junction_ids=[junction.getID() for junction in junctions],
+                junction_index=routehelper.JunctionFinder.index_data(
+                    junctions
+                ),
+                routing_index=routehelper.RoutingIndex.index_data(
+                    routehelper.RoutingIndex.routed_edges(self.net)
+                ),
+                tls_link_table=routehelper.TLSLinkTable.index_data(self.net),
+            )
+        if self.cache is not None:
+            self.cache.store(
+                self.cache_key,
+                pickle.dumps(tuple(index_data), pickle.HIGHEST_PROTOCOL),
+            )
+        return index_data
+
+    @functools.cached_property
+    def projection(self) -> Tuple[str, Tuple[float, float]]:
+        """Geo projection parameters and offset of the network."""
+        index_data = self._load_cached_index_data()
+        if index_data is not None:
+            return index_data.projection_params, index_data.offset
+        # only reads the location element, not the whole network
+        return extract_projection_data(self.net_file)
+
+    @functools.cached_property
+    def lanes(self) -> routehelper.NetObjects[sumolib.net.lane.Lane]:
+        """All non-internal lanes of the network."""
+        return routehelper.NetObjects(
+            self.index_data.lane_ids, lambda lane_id: self.net.getLane(lane_id)
+        )
+
+    @functools.cached_property
+    def junctions(self) -> routehelper.NetObjects[sumolib.net.node.Node]:
+        """All junctions of the network, except for dead ends."""
+        return routehelper.NetObjects(
+            self.index_data.junction_ids,
+            lambda junction_id: self.net.getNode(junction_id),
+        )
+
+    @functools.cached_property
+    def edges(self) -> routehelper.NetObjects[sumolib.net.edge.Edge]:
+        """All edges of the routing index (i.e., non-internal edges)."""
+        return routehelper.NetObjects(
+            self.index_data.routing_index.edge_ids,
+            lambda edge_id: self.net.getEdge(edge_id),
+        )
+
+    @functools.cached_property
+    def tlss(self) -> routehelper.NetObjects[sumolib.net.TLS]:
+        """All traffic lights of the tls link table."""
+        return routehelper.NetObjects(
+            self.index_data.tls_link_table.tls_ids,
+            lambda tls_id: self.net.getTLS(tls_id),
+        )
+
+    def _make_lane_finder(self) -> routehelper.LaneFinder:
+        return routehelper.LaneFinder(
+            self.lanes, index_data=self.index_data.lane_index
+        )
+
+    def _make_junction_finder(self) -> routehelper.JunctionFinder:
+        return routehelper.JunctionFinder(
+            self.junctions, index_data=self.index_data.junction_index
+        )
+
+    def _make_routing_index(self) -> routehelper.RoutingIndex:
+        return routehelper.RoutingIndex(
+            edges=self.edges, index_data=self.index_data.routing_index
+        )
+
+    @functools.cached_property
+    def lane_finder(self) -> routehelper.LaneFinder:
+        return self._make_lane_finder()
+
+    @functools.cached_property
+    def junction_finder(self) -> routehelper.JunctionFinder:
+        return self._make_junction_finder()
+
+    @functools.cached_property
+    def tls_link_table(self) -> routehelper.TLSLinkTable:
+        return routehelper.TLSLinkTable(
+            tlss=self.tlss, index_data=self.index_data.tls_link_table
+        )
+
+    @functools.cached_property
+    def routing_index(self) -> routehelper.RoutingIndex:
+        return self._make_routing_index()
+
+    def preload(
+        self, with_indices: bool = True, with_net: bool = True
+    ) -> None:
+        """
+        Load the indices and/or the network now instead of on first use.
+
+        With cached index data, the indices do not need the network.
+        """
+        if with_indices:
+            _ = (
+                self.lane_finder,
+                self.junction_finder,
+                self.tls_link_table,
+                self.routing_index,
+            )
+        if with_net:
+            _ = self.net
+
+    def make_route_tracker(self) -> routehelper.RouteTracker:
+        """
+        Return a RouteTracker with its own copies of all indices it uses.
+
+        Such trackers can be used in other threads than the shared indices.
+        """
+        return routehelper.RouteTracker(
+            self._make_lane_finder(),
+            self._make_junction_finder(),
+            self._make_routing_index(),
+        )
+
+
+_NETWORK_MODELS: Dict[str, NetworkModel] = {}
+
+
+def get_network_model(
+    net_file: str, cache_dir: Optional[str] = None
+) -> NetworkModel:
+    """
+    Return the shared model of net_file.
+
+    The cache_dir is only used by the first call for a net_file.
+    """
+    key = os.path.realpath(net_file)
+    if key not in _NETWORK_MODELS:
+        _NETWORK_MODELS[key] = NetworkModel(net_file, cache_dir)
+    return _NETWORK_MODELS[key]
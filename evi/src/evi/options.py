@@ -0,0 +1,138 @@
+"""
+Command line options of the EVI components.
+
+Kept apart from the components, so parsing arguments does not import
+their (heavy) dependencies.
+"""
+
+import argparse
+
+from .filtering import FELLOW_FILTERS
+
+
+def sumo_parser(defaults) -> argparse.ArgumentParser:
+    """Return argument parser for the Sumo interface configuration."""
+    parser = argparse.ArgumentParser(add_help=False)
+    sumo_group = parser.add_argument_group("Sumo Interface")
+    # config to connect to running sumo instance or start sumo ourselves
+    sumo_group.add_argument(
+        "--sumo-host",
+        help=(
+            "Host running SUMO to connect to (if not launched by evi, "
+            "default: {}).".format(defaults["sumo_host"])
+        ),
+    )
+    sumo_group.add_argument(
+        "--sumo-port",
+        type=int,
+        help="Port to use for connection to SUMO (default: {}).".format(
+            defaults["sumo_port"]
+        ),
+    )
+    sumo_group.add_argument(
+        "--sumo-keep-route",
+        type=int,
+        choices=[0, 1, 2],
+        help=(
+            "Always keep on roads and route (see move to XY, "
+            "default: {})?".format(defaults["sumo_keep_route"])
+        ),
+    )
+    evi_group = parser.add_argument_group("Ego vehicle")
+    evi_group.add_argument(
+        "--ego-type",
+        help="Ego vehicle type in SUMO (default: {}).".format(
+            defaults["ego_type"]
+        ),
+    )
+    evi_group.add_argument(
+        "--ego-route-name",
+        help="Name of ego vehicle route in SUMO (default: {}).".format(
+            defaults["ego_route_name"]
+        ),
+    )
+    evi_group.add_argument(
+        "--triggers-file",
+        "--dynamic-spawn-points-file",  # for backwards compatibility
+        help=(
+            "A YAML file defining trigger locations on the map. "
+            "If the ego vehicle passes one of the locations, "
+            "new vehicles will be spawned in the defined locations. "
+            "Requires sumo_network_file."
+        )
+    )
+    evi_group.add_argument(
+        "--record-traffic",
+        help=(
+            "Record the traffic (without egos) and all traffic lights "
+            "to this directory for --playback-traffic."
+        ),
+    )
+    return parser
+
+
+def playback_parser(defaults) -> argparse.ArgumentParser:
+    """Return argument parser for the traffic playback configuration."""
+    parser = argparse.ArgumentParser(add_help=False)
+    group = parser.add_argument_group("Traffic Playback")
+    group.add_argument(
+        "--playback-traffic",
+        help=(
+            "Replay the traffic recording in this directory "
+            "(see --record-traffic) instead of running SUMO."
+        ),
+    )
+    return parser
+
+
+def veins_parser(defaults) -> argparse.ArgumentParser:
+    """Return argument parser for the Veins interface configuration."""
+    parser = argparse.ArgumentParser(add_help=False)
+    veins_group = parser.add_argument_group("Veins Interface")
+    veins_group.add_argument(
+        "--veins-host",
+        help=(
+            "Host running the Veins server. "
+            "If omitted, no connection to Veins is made."
+        ),
+    )
+    veins_group.add_argument(
+        "--veins-port",
+        type=int,
+        help="Port of the Veins server (default: {}).".format(
+            defaults["veins_port"]
+        ),
+    )
+    veins_group.add_argument(
+        "--sync-interval-ms",
+        type=int,
+        help=(
+            "Synchronization interval length in milliseconds "
+            "(default: {}).".format(defaults["sync_interval_ms"])
+        ),
+    )
+    veins_group.add_argument(
+        "--veins-max-vehicles",
+        type=lambda string: int(string) if string != "None" else None,
+        help=(
+            "Maximum number for vehicles synced to Veins, "
+            "None means unlimited "
+            "(default: {}).".format(defaults["veins_max_vehicles"])
+        ),
+    )
+    veins_group.add_argument(
+        "--veins-fellow-filter",
+        choices=list(FELLOW_FILTERS.keys()),
+        default=defaults["veins_fellow_filter"],
+        help="Filter mechanism to select fellow vehicles.",
+    )
+    veins_group.add_argument(
+        "--veins-threshold",
+        type=lambda string: float(string) if string != "None" else None,
+        default=None,
+        help=(
+            "Computation time veins should not exceed, "
+            "used to adapt number of vehicles, ratio of the sync interval."
+        ),
+    )
+    return parser
@@ -0,0 +1,483 @@
+"""
+Playback of recorded background traffic in place of a live SUMO.
+
+A recording is a directory of numpy columns (one row per vehicle or
+traffic light and step) plus a json file with string tables and network
+data. SumoInterface writes recordings (see --record-traffic),
+PlaybackInterface replays them with the same interface, memory-mapped and
+deterministically, without running SUMO. Ego vehicle updates are accepted
+but do not influence the recorded traffic.
+"""
+
+import argparse
+import array
+import bisect
+import functools
+import json
+import logging
+import os
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from . import options
+from .state import (
+    Position,
+    SignalState,
+    TrafficLight,
+    Vehicle,
+    VehicleSignal,
+    VehicleStopState,
+    VehicleType,
+)
+from .util import TRACER
+
+LOG = logging.getLogger(__name__)
+
+RECORDING_VERSION = 1
+META_FILE = "recording.json"
+
+# column name -> (numpy dtype, array.array typecode)
+STEP_COLUMNS = {
+    "time_ms": ("<i8", "q"),
+    "vehicle_offset": ("<i8", "q"),
+    "trafficlight_offset": ("<i8", "q"),
+}
+VEHICLE_COLUMNS = {
+    "id": ("<i4", "i"),
+    "road": ("<i4", "i"),
+    "s_frac": ("<f8", "d"),
+    "lane": ("<i4", "i"),
+    "x": ("<f8", "d"),
+    "y": ("<f8", "d"),
+    "angle": ("<f8", "d"),
+    "height": ("<f8", "d"),
+    "slope": ("<f8", "d"),
+    "speed": ("<f8", "d"),
+    "route": ("<i4", "i"),
+    "signals": ("<i4", "i"),
+    "veh_type": ("<i4", "i"),
+    "stop_states": ("<i4", "i"),
+}
+TRAFFICLIGHT_COLUMNS = {
+    "id": ("<i4", "i"),
+    "signals": ("<i4", "i"),
+    "phase_nr": ("<i4", "i"),
+    "program": ("<i4", "i"),
+    "next_switch_s": ("<f8", "d"),
+}
+
+_VEHICLE_TYPES = {veh_type.value: veh_type for veh_type in VehicleType}
+
+
+def _column_file(directory: str, table: str, column: str) -> str:
+    return os.path.join(directory, f"{table}.{column}.npy")
+
+
+def _encode_signals(signals: Iterable[SignalState]) -> str:
+    return "".join(str(signal.value) for signal in signals)
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_signals(encoded: str) -> Tuple[SignalState, ...]:
+    return tuple(SignalState(int(char)) for char in encoded)
+
+
+@functools.lru_cache(maxsize=1024)
+def _decode_vehicle_signals(bits: int) -> FrozenSet[VehicleSignal]:
+    return frozenset(signal for signal in VehicleSignal if bits & signal.value)
+
+
+@functools.lru_cache(maxsize=256)
+def _decode_stop_states(bits: int) -> FrozenSet[VehicleStopState]:
+    return frozenset(state for state in VehicleStopState if bits & state.value)
+
+
+class TrafficRecorder:
+    """
+    Record traffic and traffic light states step by step.
+
+    Rows are buffered in compact arrays and written as columns on close.
+    Strings (ids, roads, routes, programs, signal states) are stored once.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._strings: Dict[str, int] = {}
+        self._columns = {
+            table: {
+                column: array.array(typecode)
+                for column, (_dtype, typecode) in columns.items()
+            }
+            for table, columns in (
+                ("step", STEP_COLUMNS),
+                ("vehicle", VEHICLE_COLUMNS),
+                ("trafficlight", TRAFFICLIGHT_COLUMNS),
+            )
+        }
+        self._network: Dict[str, Any] = {}
+        self._closed = False
+
+    def _string(self, string: Optional[str]) -> int:
+        if string is None:
+            return -1
+        return self._strings.setdefault(string, len(self._strings))
+
+    def set_network(
+        self,
+        network_init_data: Dict[str, Any],
+        trafficlight_positions: Dict[str, Tuple[float, float]],
+    ) -> None:
+        """Store the scenario data PlaybackInterface has to provide."""
+        self._network = {
+            "netbounds": [
+                list(point) for point in network_init_data["netbounds"]
+            ],
+            "polygons": [
+                {
+                    "id": polygon["id"],
+                    "type": polygon["type"],
+                    "shape": [list(point) for point in polygon["shape"]],
+                }
+                for polygon in network_init_data["polygons"]
+            ],
+            "trafficlight_positions": {
+                tls_id: list(position)
+                for tls_id, position in trafficlight_positions.items()
+            },
+        }
+
+    def add_step(
+        self,
+        time_ms: int,
+        vehicles: Iterable[Vehicle],
+        trafficlights: Iterable[TrafficLight],
+    ) -> None:
+        """Append the state of all vehicles and traffic lights at time_ms."""
+        steps = self._columns["step"]
+        steps["time_ms"].append(time_ms)
+        steps["vehicle_offset"].append(len(self._columns["vehicle"]["id"]))
+        steps["trafficlight_offset"].append(
+            len(self._columns["trafficlight"]["id"])
+        )
+        columns = self._columns["vehicle"]
+        for vehicle in sorted(vehicles, key=lambda vehicle: vehicle.id):
+            position = vehicle.position
+            columns["id"].append(self._string(vehicle.id))
+            columns["road"].append(self._string(position.road_id))
+            columns["s_frac"].append(position.s_frac)
+            columns["lane"].append(position.lane_id)
+            columns["x"].append(position.x)
+            columns["y"].append(position.y)
+            columns["angle"].append(position.angle)
+            columns["height"].append(position.height)
+            columns["slope"].append(position.slope)
+            columns["speed"].append(vehicle.speed)
+            columns["route"].append(self._string(vehicle.route))
+            columns["signals"].append(
+                sum(signal.value for signal in vehicle.signals)
+            )
+            columns["veh_type"].append(vehicle.veh_type.value)
+            columns["stop_states"].append(
+                sum(state.value for state in vehicle.stop_states)
+            )
+        columns = self._columns["trafficlight"]
+        time_s = time_ms / 1000
+        for tls in sorted(trafficlights, key=lambda tls: tls.id):
+            columns["id"].append(self._string(tls.id))
+            columns["signals"].append(
+                self._string(_encode_signals(tls.signals))
+            )
+            columns["phase_nr"].append(tls.phase_nr)
+            columns["program"].append(self._string(tls.program_id))
+            columns["next_switch_s"].append(time_s + tls.time_to_switch)
+
+    def close(self) -> None:
+        """Write the recording to its directory."""
+        if self._closed:
+            return
+        self._closed = True
+        os.makedirs(self.directory, exist_ok=True)
+        for table, columns in (
+            ("step", STEP_COLUMNS),
+            ("vehicle", VEHICLE_COLUMNS),
+            ("trafficlight", TRAFFICLIGHT_COLUMNS),
+        ):
+            for column, (dtype, _typecode) in columns.items():
+                np.save(
+                    _column_file(self.directory, table, column),
+                    np.frombuffer(self._columns[table][column], dtype=dtype),
+                )
+        with open(os.path.join(self.directory, META_FILE), "w") as meta:
+            json.dump(
+                {
+                    "version": RECORDING_VERSION,
+                    "strings": list(self._strings),
+                    **self._network,
+                },
+                meta,
+            )
+        LOG.info(
+            "Recorded %d steps with %d vehicle states to %s",
+            len(self._columns["step"]["time_ms"]),
+            len(self._columns["vehicle"]["id"]),
+            self.directory,
+        )
+
+
+class TrafficRecording:
+    """
+    Memory-mapped, read-only access to a recording by step or time.
+    """
+
+    def __init__(self, directory: str) -> None:
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != RECORDING_VERSION:
+            raise ValueError(
+                f"Unsupported traffic recording version in {directory}: "
+                f"{meta.get('version')} (expected {RECORDING_VERSION})"
+            )
+        self.strings: List[str] = meta["strings"]
+        self.netbounds = tuple(tuple(point) for point in meta["netbounds"])
+        self.polygons = [
+            {
+                **polygon,
+                "shape": tuple(tuple(point) for point in polygon["shape"]),
+            }
+            for polygon in meta["polygons"]
+        ]
+        self.trafficlight_positions = {
+            tls_id: tuple(position)
+            for tls_id, position in meta["trafficlight_positions"].items()
+        }
+        self._columns = {
+            table: {
+                column: np.load(
+                    _column_file(directory, table, column), mmap_mode="r"
+                )
+                for column in columns
+            }
+            for table, columns in (
+                ("step", STEP_COLUMNS),
+                ("vehicle", VEHICLE_COLUMNS),
+                ("trafficlight", TRAFFICLIGHT_COLUMNS),
+            )
+        }
+        self.times_ms: List[int] = self._columns["step"]["time_ms"].tolist()
+        if not self.times_ms:
+            raise ValueError(f"Traffic recording {directory} has no steps")
+
+    def __len__(self) -> int:
+        return len(self.times_ms)
+
+    def step_at(self, time_ms: int) -> int:
+        """Return the index of the first step at or after time_ms."""
+        return min(
+            bisect.bisect_left(self.times_ms, time_ms), len(self.times_ms) - 1
+        )
+
+    def _rows(self, table: str, step: int) -> slice:
+        offsets = self._columns["step"][f"{table}_offset"]
+        end = (
+            offsets[step + 1]
+            if step + 1 < len(offsets)
+            else len(self._columns[table]["id"])
+        )
+        return slice(int(offsets[step]), int(end))
+
+    def _table(self, table: str, step: int) -> Dict[str, list]:
+        rows = self._rows(table, step)
+        return {
+            column: values[rows].tolist()
+            for column, values in self._columns[table].items()
+        }
+
+    def vehicles(self, step: int) -> FrozenSet[Vehicle]:
+        """Return all vehicles of step."""
+        strings = self.strings
+        columns = self._table("vehicle", step)
+        return frozenset(
+            Vehicle(
+                strings[id_],
+                Position(
+                    strings[road], s_frac, lane, x, y, angle, height, slope
+                ),
+                speed,
+                strings[route] if route >= 0 else None,
+                _decode_vehicle_signals(signals),
+                _VEHICLE_TYPES[veh_type],
+                _decode_stop_states(stop_states),
+            )
+            for (
+                id_,
+                road,
+                s_frac,
+                lane,
+                x,
+                y,
+                angle,
+                height,
+                slope,
+                speed,
+                route,
+                signals,
+                veh_type,
+                stop_states,
+            ) in zip(*(columns[column] for column in VEHICLE_COLUMNS))
+        )
+
+    def trafficlights(self, step: int) -> FrozenSet[TrafficLight]:
+        """Return all traffic lights of step."""
+        strings = self.strings
+        time_s = self.times_ms[step] / 1000
+        columns = self._table("trafficlight", step)
+        return frozenset(
+            TrafficLight(
+                id=strings[id_],
+                signals=_decode_signals(strings[signals]),
+                phase_nr=phase_nr,
+                program_id=strings[program],
+                time_to_switch=round(next_switch_s - time_s, 3),
+            )
+            for id_, signals, phase_nr, program, next_switch_s in zip(
+                *(columns[column] for column in TRAFFICLIGHT_COLUMNS)
+            )
+        )
+
+
+class PlaybackInterface:
+    """
+    Drop-in replacement of SumoInterface replaying a traffic recording.
+
+    Like SumoInterface, advance returns the traffic of the last step and
+    moves on to the next one. After the last recorded step, its traffic
+    is returned again. Ego vehicles are not fed back into the traffic.
+    """
+
+    _recording: TrafficRecording
+    _step: int
+    _ended: bool
+    _required_trafficlights: Dict[str, FrozenSet[str]]
+    _subscribed_trafficlights: FrozenSet[str]
+
+    def __init__(
+        self, *, playback_traffic: str, triggers_file=None, **ignored_kwargs
+    ) -> None:
+        with TRACER.complete("loadRecording", tid="sumo"):
+            self._recording = TrafficRecording(playback_traffic)
+        self._step = 0
+        self._ended = False
+        self._required_trafficlights = {}
+        self._subscribed_trafficlights = frozenset()
+        self._trafficlight_tree = None
+        self._trafficlight_tree_ids: List[str] = []
+        if triggers_file is not None:
+            LOG.warning("Triggers are not supported in traffic playback.")
+        LOG.info(
+            "Playing back %d recorded steps (%d ms to %d ms) from %s",
+            len(self._recording),
+            self._recording.times_ms[0],
+            self._recording.times_ms[-1],
+            playback_traffic,
+        )
+
+    @classmethod
+    def get_parser(cls, defaults) -> argparse.ArgumentParser:
+        """Return argument parser for this interface's configuration."""
+        return options.playback_parser(defaults)
+
+    def seek(self, time_ms: int) -> None:
+        """Continue playback at the first step at or after time_ms."""
+        self._step = self._recording.step_at(time_ms)
+        self._ended = False
+
+    async def warm_up_traffic(self, start_time_ms=0) -> FrozenSet[Vehicle]:
+        """Seek to the start time and return the traffic there."""
+        self.seek(start_time_ms)
+        if self._recording.times_ms[self._step] != start_time_ms:
+            LOG.warning(
+                "Start time %d ms not recorded, starting at %d ms",
+                start_time_ms,
+                self._recording.times_ms[self._step],
+            )
+        return self._recording.vehicles(self._step)
+
+    async def teardown(self) -> None:
+        """Nothing to tear down, the recording is closed with its maps."""
+
+    async def advance(
+        self, ego_vehicles: FrozenSet[Vehicle]
+    ) -> FrozenSet[Vehicle]:
+        """Return the traffic of the current step and move to the next."""
+        with TRACER.complete("playback", tid="sumo"):
+            traffic = self._recording.vehicles(self._step)
+        if self._step + 1 < len(self._recording):
+            self._step += 1
+        elif not self._ended:
+            LOG.warning("End of traffic recording reached, holding last step")
+            self._ended = True
+        return traffic
+
+    async def network_init_data(self) -> Dict[str, Any]:
+        """Return the recorded network initialization data."""
+        return {
+            "netbounds": self._recording.netbounds,
+            "polygons": self._recording.polygons,
+        }
+
+    async def subscribe_to_trafficlights(
+        self, whitelist: Optional[Iterable[str]] = None
+    ) -> None:
+        """Provide traffic lights in whitelist or all if it is None."""
+        if whitelist is None:
+            whitelist = self._recording.trafficlight_positions
+        await self.require_trafficlights("all", whitelist)
+
+    async def require_trafficlights(
+        self, owner: str, tls_ids: Iterable[str]
+    ) -> None:
+        """Set the traffic lights needed by owner."""
+        self._required_trafficlights[owner] = frozenset(tls_ids)
+        self._subscribed_trafficlights = frozenset().union(
+            *self._required_trafficlights.values()
+        )
+
+    async def trafficlights_near(
+        self, coords: Iterable[Tuple[float, float]], radius: float
+    ) -> FrozenSet[str]:
+        """Return ids of traffic lights within radius of any of coords."""
+        coords = list(coords)
+        if not coords:
+            return frozenset()
+        if self._trafficlight_tree is None:
+            from scipy.spatial import cKDTree
+
+            positions = await self.trafficlight_positions()
+            self._trafficlight_tree_ids = list(positions)
+            self._trafficlight_tree = cKDTree(
+                np.array(list(positions.values())).reshape(-1, 2)
+            )
+        return frozenset(
+            self._trafficlight_tree_ids[index]
+            for indices in self._trafficlight_tree.query_ball_point(
+                coords, radius
+            )
+            for index in indices
+        )
+
+    def time_ms(self) -> int:
+        """Return the time of the current step in milliseconds."""
+        return self._recording.times_ms[self._step]
+
+    async def trafficlight_positions(self) -> Dict[str, Tuple[float, float]]:
+        """Return the recorded positions of all traffic lights."""
+        return self._recording.trafficlight_positions
+
+    async def update_trafficlights(self) -> FrozenSet[TrafficLight]:
+        """Return the current states of the required traffic lights."""
+        return frozenset(
+            tls
+            for tls in self._recording.trafficlights(self._step)
+            if tls.id in self._subscribed_trafficlights
+        )
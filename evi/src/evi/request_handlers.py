@@ -3,17 +3,23 @@ Collection of handlers that process incoming requests.
 """
 
 import asyncio
-import itertools as it
 import logging
+import time
 from typing import (
     Callable,
     Dict,
     FrozenSet,
+    Hashable,
+    Iterable,
     Iterator,
     List,
+    Mapping,
+    NamedTuple,
     Optional,
     Sequence,
+    Set,
     Tuple,
+    Union,
 )
 
 import asmp.asmp.horizon_pb2 as horizon_pb2
@@ -21,16 +27,17 @@ import asmp.asmp_pb2 as asmp
 import sumolib
 import typing_extensions
 
-from . import routehelper
+from . import metrics, routehelper
 from .asynctraci import PoiTracer
-from .filtering import FELLOW_FILTERS, TrafficFilter
+from .filtering import FELLOW_FILTERS, TrafficFilter, TrafficLightFilter
+from .network import get_network_model
 from .proto import (
     build_horizon_tls_response,
     build_traffic_message,
     build_trafficlight_message,
     protobuf_to_vehicle,
 )
-from .state import Vehicle
+from .state import TrafficLight, Vehicle
 from .sumo import SumoInterface
 from .util import ID_MAPPER, TRACER, trace
 from .veins import VeinsInterface, VeinsResult
@@ -40,6 +47,16 @@ LOG = logging.getLogger(__name__)
 GeoProjection = Callable[[float, float], Tuple[float, float]]
 
 
+class ClientReply(NamedTuple):
+    """Reply addressed to a single client of a multi-client protocol."""
+
+    client: Hashable
+    message: asmp.Message
+
+
+Reply = Union[asmp.Message, ClientReply]
+
+
 class RequestHandler(typing_extensions.Protocol):
     """
     Handler for protocols to process certain requests sent to the EVI.
@@ -50,7 +67,7 @@ class RequestHandler(typing_extensions.Protocol):
         """Return true if this handler is response to process message."""
         ...
 
-    async def process(self, message: asmp.Message) -> Sequence[asmp.Message]:
+    async def process(self, message: asmp.Message) -> Sequence[Reply]:
         """Process message and return replies."""
         ...
 
@@ -173,6 +190,7 @@ class RequestDispatcher:
             if self.shutdown_wait_task in done:
                 # shutdown was triggered before the request was completed
                 LOG.warning("Shutdown triggered while processing request.")
+                metrics.DROPPED_REQUESTS.inc()
                 for task in pending:
                     task.cancel()
                 return
@@ -183,7 +201,7 @@ class RequestDispatcher:
     async def process(
         self,
         message: asmp.Message,
-        send_function: Callable[[Sequence[asmp.Message]], None],
+        send_function: Callable[[Sequence[Reply]], None],
     ) -> None:
         """Process a request and send back the reply."""
         TRACER.begin("process", tid="request")
@@ -197,19 +215,24 @@ class RequestDispatcher:
                 "Could not process message of type %s, no handler responsible",
                 message.WhichOneof("message_oneof"),
             )
+            metrics.DROPPED_REQUESTS.inc()
             return
 
-        async for done_task in self.yield_tasks(running):
-            TRACER.instant("taskDone", tid="request")
-            try:
-                replies = done_task.result()
-            except Exception as exc:
-                LOG.critical("Task procesing failed, shutting down!")
-                self.shutdown_event.set()
-                raise exc
-
-            if replies:
-                send_function(replies)
+        metrics.DISPATCHER_QUEUE_DEPTH.inc()
+        try:
+            async for done_task in self.yield_tasks(running):
+                TRACER.instant("taskDone", tid="request")
+                try:
+                    replies = done_task.result()
+                except Exception as exc:
+                    LOG.critical("Task procesing failed, shutting down!")
+                    self.shutdown_event.set()
+                    raise exc
+
+                if replies:
+                    send_function(replies)
+        finally:
+            metrics.DISPATCHER_QUEUE_DEPTH.dec()
         TRACER.end(
             "process",
             tid="request",
@@ -250,37 +273,93 @@ class HorizonDummyHandler:
         return [reply]
 
 
+class HorizonRoute(NamedTuple):
+    """Traffic lights along a requested route and distances to them."""
+
+    route_tls: List[Tuple[sumolib.net.TLS, int, int]]
+    """Traffic lights, passed link indices, and edge nrs along the route."""
+    route_distances: List[float]
+    """Road distance from the start of the route to the end of each edge."""
+    first_edge_offset: float
+    """Position of the first coordinate on the first edge."""
+
+
 class HorizonEgoTrafficLightHandler:
     """
     Handles incoming Horizon requests for traffic lights along an ego's route.
     """
 
     def __init__(
-        self, sumo_network_file: str, sumo_interface: SumoInterface
+        self,
+        sumo_network_file: str,
+        sumo_interface: SumoInterface,
+        horizon_poi_interval: Optional[float] = 1.0,
+        horizon_workers: int = 0,
     ) -> None:
-        self.poitracer = PoiTracer(sumo_interface._atraci)
+        """
+        Set up the handler for the network in sumo_network_file.
+
+        Requested routes are traced as POIs in the Sumo GUI (if any),
+        at most every horizon_poi_interval seconds per vehicle
+        (None disables tracing).
+        Routes of requests are processed by horizon_workers threads
+        in parallel, or on the event loop if horizon_workers is 0.
+        """
+        # traffic playback has no SUMO (GUI) to trace POIs in
+        atraci = getattr(sumo_interface, "_atraci", None)
+        self.poitracer = PoiTracer(
+            atraci,
+            min_interval_s=horizon_poi_interval or 0.0,
+            enabled=(
+                False
+                if horizon_poi_interval is None or atraci is None
+                else None
+            ),
+        )
         self.sumo_interface = sumo_interface
         # TODO: extract all sumo(lib)-specific code into other class/module
-        self.sumo_net = sumolib.net.readNet(
-            sumo_network_file,
-            withInternal=True,
-            withPrograms=True,
+        network_model = get_network_model(sumo_network_file)
+        # the sumolib network itself is only parsed when first needed
+        self.network_model = network_model
+        self.lane_finder = network_model.lane_finder
+        self.junction_finder = network_model.junction_finder
+        self.tls_link_table = network_model.tls_link_table
+        self.tls_timing = routehelper.TLSTiming()
+        self.route_tracker = routehelper.RouteTracker(
+            self.lane_finder,
+            self.junction_finder,
+            network_model.routing_index,
+        )
+        self.route_workers = (
+            routehelper.RouteWorkerPool(
+                network_model.make_route_tracker, horizon_workers
+            )
+            if horizon_workers > 0
+            else None
         )
-        lanes = [
-            lane
-            for edge in self.sumo_net.getEdges()
-            for lane in edge.getLanes()
-            if not lane.getID().startswith(":")
-        ]
-        junctions = [
-            node
-            for node in self.sumo_net.getNodes()
-            if node.getType() != "dead_end"
-        ]
-        self.lane_finder = routehelper.LaneFinder(lanes=lanes)
-        self.junction_finder = routehelper.JunctionFinder(junctions)
         self._last_pois: List[str] = []
-        self._is_subscribed = False  # FIXME: refactor / clean up
+
+    def plan_route(
+        self,
+        route_tracker: routehelper.RouteTracker,
+        vehicle_id: int,
+        coords: List[Tuple[float, float]],
+    ) -> HorizonRoute:
+        """
+        Reconstruct the route along coords and find its traffic lights.
+
+        Only uses read-only data of this handler besides route_tracker.
+        Thus, it can run in any thread that owns route_tracker.
+        """
+        route_edges = route_tracker.reconstruct(vehicle_id, coords)
+        _, first_edge_offset, _ = route_edges[0].getClosestLanePosDist(
+            coords[0]
+        )
+        return HorizonRoute(
+            route_tls=self.tls_link_table.find_tls_in_route(route_edges),
+            route_distances=self.tls_link_table.route_distances(route_edges),
+            first_edge_offset=first_edge_offset,
+        )
 
     @staticmethod
     def is_ego_tls_request(request: horizon_pb2.Request) -> bool:
@@ -289,19 +368,53 @@ class HorizonEgoTrafficLightHandler:
             request.variables & horizon_pb2.NEXT_TLS_GREEN_PHASES
         )
 
+    @staticmethod
+    def unregistered_vehicle_ids(message: asmp.Message) -> List[int]:
+        """Return the ids of vehicles unregistered by a vehicle message."""
+        if not message.HasField("vehicle"):
+            return []
+        return [
+            cmd.unregister_vehicle_command.vehicle_id
+            for cmd in message.vehicle.commands
+            if cmd.HasField("unregister_vehicle_command")
+        ]
+
     @staticmethod
     def is_responsible(message: asmp.Message) -> bool:
         """Return true if this handler is response to process message."""
+        if message.HasField("vehicle"):
+            # to forget the routes of unregistered vehicles
+            return bool(
+                HorizonEgoTrafficLightHandler.unregistered_vehicle_ids(message)
+            )
         return message.HasField("horizon") and any(
             HorizonEgoTrafficLightHandler.is_ego_tls_request(req)
             for req in message.horizon.requests
         )
 
+    def forget_vehicles(self, vehicle_ids: Iterable[int]) -> None:
+        """Drop the route state of vehicles (in the thread that owns it)."""
+        for vehicle_id in vehicle_ids:
+            if self.route_workers is not None:
+                self.route_workers.submit(
+                    vehicle_id, routehelper.RouteTracker.forget, vehicle_id
+                )
+            else:
+                self.route_tracker.forget(vehicle_id)
+
+    async def teardown(self) -> None:
+        """Stop the route workers (after their pending computations)."""
+        if self.route_workers is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.route_workers.shutdown
+            )
+
     async def process(self, message: asmp.Message) -> Sequence[asmp.Message]:
         """Process ego vehicle request for traffic lights along a route."""
+        if message.HasField("vehicle"):
+            self.forget_vehicles(self.unregistered_vehicle_ids(message))
+            return []
         num_green_phases = 3  # FIXME: make this a config param
-        if not self._is_subscribed:  # FIXME: refactor / clean up
-            await self.sumo_interface.subscribe_to_trafficlights()
 
         tls_requests = [
             request
@@ -310,70 +423,78 @@ class HorizonEgoTrafficLightHandler:
         ]
         LOG.debug("Received %d TLS Horizon requests.", len(tls_requests))
 
+        requests = [
+            (tls_request, [(point.x, point.y) for point in tls_request.points])
+            for tls_request in tls_requests
+        ]
+        planned = None
+        if self.route_workers is not None:
+            # plan routes in parallel while tracing them in the GUI
+            planned = [
+                asyncio.wrap_future(
+                    self.route_workers.submit(
+                        tls_request.vehicle_id,
+                        self.plan_route,
+                        tls_request.vehicle_id,
+                        coords,
+                    )
+                )
+                for tls_request, coords in requests
+            ]
+        for tls_request, coords in requests:
+            await self.poitracer.update(coords, owner=tls_request.vehicle_id)
+        if planned is not None:
+            routes = await asyncio.gather(*planned)
+        else:
+            routes = [
+                self.plan_route(
+                    self.route_tracker, tls_request.vehicle_id, coords
+                )
+                for tls_request, coords in requests
+            ]
+
+        # only keep traffic lights along the requested routes subscribed
+        await self.sumo_interface.require_trafficlights(
+            "horizon",
+            {
+                tls.getID()
+                for route in routes
+                for tls, _, _ in route.route_tls
+            },
+        )
+        # a single snapshot of the tls states for all requests
         all_tls_state = {
             tls.id: tls
             for tls in await self.sumo_interface.update_trafficlights()
         }
 
         responses = []
-        for tls_request in tls_requests:
-            coords = [(point.x, point.y) for point in tls_request.points]
-            await self.poitracer.update(coords, owner=tls_request.vehicle_id)
-
+        for (tls_request, _coords), route in zip(requests, routes):
             # prepare response to individual request
-
-            route_edges = routehelper.reconstruct_route(
-                coords=coords,
-                lane_finder=self.lane_finder,
-                junction_finder=self.junction_finder,
-            )
-            route_tls = routehelper.find_tls_in_route(
-                route_edges=route_edges,
-                sumo_net=self.sumo_net,
-            )
-
             tls_responses = []
-            for tls, link_index in route_tls:
+            for tls, link_index, edge_nr in route.route_tls:
                 tls_state = all_tls_state[tls.getID()]
-                program = tls.getPrograms()[tls_state.program_id]
-                phase = program.getPhases()[tls_state.phase_nr]
-                absolute_green_times = routehelper.get_next_green_phase_times(
-                    program=program,
-                    link_index=link_index,
-                    current_phase_nr=tls_state.phase_nr,
-                    green_phases=num_green_phases,
-                )
+                # relative to now, an ongoing green begins at or before 0;
+                # actuated and delay based programs yield at most one window
                 relative_green_times = [
                     (round(begin, 3), round(end, 3))
-                    for begin, end in routehelper.offset_green_phase_times(
-                        green_times=absolute_green_times,
-                        passed_time=phase.duration - tls_state.time_to_switch,
+                    for begin, end in self.tls_timing.next_green_windows(
+                        tls=tls,
+                        link_index=link_index,
+                        program_id=tls_state.program_id,
+                        phase_nr=tls_state.phase_nr,
+                        time_to_switch=tls_state.time_to_switch,
+                        green_phases=num_green_phases,
+                        time_s=self.sumo_interface.time_ms() / 1000,
                     )
                 ]
-                tls_coord = self.sumo_net.getNode(tls.getID()).getCoord()
-
-                # compute road distance to junction
-                _, first_edge_offset, _ = route_edges[0].getClosestLanePosDist(
-                    coords[0]
-                )
-                edges_till_tls = list(
-                    it.takewhile(
-                        lambda e: e.getFromNode().getID() != tls.getID(),
-                        route_edges,
-                    )
-                )
-                via_lanes_till_tls = (
-                    self.sumo_net.getLane(
-                        from_edge.getConnections(to_edge)[0].getViaLaneID()
-                    )
-                    for from_edge, to_edge in zip(
-                        edges_till_tls[:-1], edges_till_tls[1:]
-                    )
+                tls_coord = (
+                    self.network_model.net.getNode(tls.getID()).getCoord()
                 )
+
+                # road distance to junction
                 road_distance = (
-                    sum(edge.getLength() for edge in edges_till_tls)
-                    + sum(lane.getLength() for lane in via_lanes_till_tls)
-                    - first_edge_offset
+                    route.route_distances[edge_nr] - route.first_edge_offset
                 )
                 tls_responses.append(
                     {
@@ -403,6 +524,8 @@ class EgoVehicleUpdateHandler:
     shutdown_event: asyncio.Event
     _ego_vehicles: FrozenSet[Vehicle]
     _filter: TrafficFilter
+    _fellow_filter: str
+    _max_vehicles: Optional[int]
     _register_from_update: bool
     _geo_projection: Optional[GeoProjection]
     _last_veins_result: Optional[VeinsResult]
@@ -422,22 +545,28 @@ class EgoVehicleUpdateHandler:
         self.sumo_interface = sumo_interface
         self.veins_interface = veins_interface
         self.shutdown_event = shutdown_event
-        self._filter = TrafficFilter(
-            filter_function=FELLOW_FILTERS[rt_fellow_filter],
-            prune_egos=True,
-            filter_kwargs={"max_vehicles": rt_max_vehicles},
-        )
+        self._fellow_filter = rt_fellow_filter
+        self._max_vehicles = rt_max_vehicles
+        self._filter = self.make_filter()
         self._register_from_update = register_from_update
         self._ego_vehicles = frozenset()
         self._geo_projection = geo_projection
         self._last_veins_result = None
 
+    def make_filter(self) -> TrafficFilter:
+        """Create a new fellow filter based on the handler's settings."""
+        return TrafficFilter(
+            filter_function=FELLOW_FILTERS[self._fellow_filter],
+            prune_egos=True,
+            filter_kwargs={"max_vehicles": self._max_vehicles},
+        )
+
     @staticmethod
     def is_responsible(message: asmp.Message) -> bool:
         """Return true if this handler is response to process message."""
         return message.HasField("vehicle")
 
-    async def process(self, message: asmp.Message) -> Sequence[asmp.Message]:
+    async def process(self, message: asmp.Message) -> Sequence[Reply]:
         """
         Forward ego updates to other simulators and return traffic update.
         """
@@ -452,6 +581,7 @@ class EgoVehicleUpdateHandler:
         )
 
         TRACER.begin("egohandler", tid="request")
+        start_time = time.perf_counter()
         ego_vehicles = extract_vehicle_updates(
             message.vehicle.commands,
             self._ego_vehicles,
@@ -477,11 +607,36 @@ class EgoVehicleUpdateHandler:
 
         # prepare fellow traffic to send
         ego_ids = {ego.id for ego in ego_vehicles}
+        replies = self.make_fellow_replies(
+            frozenset(
+                vehicle for vehicle in traffic if vehicle.id not in ego_ids
+            ),
+            ego_vehicles,
+            time_s,
+        )
+
+        # update local state
+        self._ego_vehicles = ego_vehicles
+
+        metrics.EGO_VEHICLES.set(len(ego_vehicles))
+        metrics.EGO_REQUEST_SECONDS.observe(time.perf_counter() - start_time)
+        TRACER.end("egohandler", tid="request")
+        return replies
+
+    def make_fellow_replies(
+        self,
+        traffic: FrozenSet[Vehicle],
+        ego_vehicles: FrozenSet[Vehicle],
+        time_s: float,
+    ) -> List[Reply]:
+        """
+        Select fellows from traffic (without egos) and build traffic replies.
+        """
         with TRACER.complete("filterFellows", tid="request"):
-            fellow_changes = self._filter.derive_changes(
-                {vehicle for vehicle in traffic if vehicle.id not in ego_ids},
-                ego_vehicles,
-            )
+            fellow_changes = self._filter.derive_changes(traffic, ego_vehicles)
+        metrics.FELLOW_VEHICLES.set(
+            len(fellow_changes["add"]) + len(fellow_changes["mod"])
+        )
         LOG.info(
             "Sending fellow traffic at %.1fs (%d new, %d updated, %d removed)",
             time_s,
@@ -491,16 +646,11 @@ class EgoVehicleUpdateHandler:
         )
 
         # build message / serialize data
-        fellow_message = build_traffic_message(
-            fellow_changes, time_s, self._geo_projection
-        )
-        replies: Sequence[asmp.Message] = [fellow_message]
-
-        # update local state
-        self._ego_vehicles = ego_vehicles
-
-        TRACER.end("egohandler", tid="request")
-        return replies
+        return [
+            build_traffic_message(
+                fellow_changes, time_s, self._geo_projection
+            )
+        ]
 
 
 class UnityEgoVehicleUpdateHandler(EgoVehicleUpdateHandler):
@@ -509,8 +659,21 @@ class UnityEgoVehicleUpdateHandler(EgoVehicleUpdateHandler):
 
     Main protocol interaction point to synchronize traffic.
     Includes TrafficLight data for Unity.
+
+    With `client_egos` (client -> ego ids, maintained by the protocol),
+    fellows are filtered per client relative to the client's own egos.
+    Only traffic lights close to egos and with changed state are sent.
+    As replies are broadcast, all visible ones are sent again
+    whenever clients or egos join or leave.
     """
 
+    _client_egos: Optional[Mapping[Hashable, FrozenSet[str]]]
+    _client_filters: Dict[Hashable, TrafficFilter]
+    _tls_filter: Optional[TrafficLightFilter]
+    _tls_audience: Optional[Tuple[FrozenSet[Hashable], FrozenSet[str]]]
+    _tls_visibility_radius: Optional[float]
+    _tls_full_refresh_interval: Optional[int]
+
     def __init__(
         self,
         sumo_interface: SumoInterface,
@@ -521,6 +684,9 @@ class UnityEgoVehicleUpdateHandler(EgoVehicleUpdateHandler):
         register_from_update: bool = False,
         rt_max_vehicles: Optional[int] = None,
         geo_projection: Optional[GeoProjection] = None,
+        client_egos: Optional[Mapping[Hashable, FrozenSet[str]]] = None,
+        tls_visibility_radius: Optional[float] = None,
+        tls_full_refresh_interval: Optional[int] = None,
         **_ignored_kwargs: Dict,
     ) -> None:
         super().__init__(
@@ -533,7 +699,68 @@ class UnityEgoVehicleUpdateHandler(EgoVehicleUpdateHandler):
             geo_projection=geo_projection,
             **_ignored_kwargs,
         )
-        asyncio.create_task(self.sumo_interface.subscribe_to_trafficlights())
+        self._client_egos = client_egos
+        self._client_filters = {}
+        self._tls_filter = None
+        self._tls_audience = None
+        self._tls_visibility_radius = tls_visibility_radius
+        self._tls_full_refresh_interval = tls_full_refresh_interval
+        if tls_visibility_radius is None:
+            asyncio.create_task(
+                self.sumo_interface.subscribe_to_trafficlights()
+            )
+
+    def make_fellow_replies(
+        self,
+        traffic: FrozenSet[Vehicle],
+        ego_vehicles: FrozenSet[Vehicle],
+        time_s: float,
+    ) -> List[Reply]:
+        """
+        Select fellows per client and build traffic replies for each client.
+
+        Clients with identical changes share one message (serialized once).
+        """
+        if self._client_egos is None:
+            return super().make_fellow_replies(traffic, ego_vehicles, time_s)
+
+        # forget filters of clients that left
+        for client in set(self._client_filters) - set(self._client_egos):
+            del self._client_filters[client]
+
+        replies: List[Reply] = []
+        messages: Dict[Tuple, asmp.Message] = {}
+        fellows: Set[Vehicle] = set()
+        for client, ego_ids in list(self._client_egos.items()):
+            client_egos = frozenset(
+                ego for ego in ego_vehicles if ego.id in ego_ids
+            )
+            if not client_egos:
+                continue
+            if client not in self._client_filters:
+                self._client_filters[client] = self.make_filter()
+            with TRACER.complete("filterFellows", tid="request"):
+                fellow_changes = self._client_filters[client].derive_changes(
+                    traffic, client_egos
+                )
+            change_key = tuple(
+                frozenset(fellow_changes[kind])
+                for kind in ("add", "mod", "rem")
+            )
+            fellows.update(change_key[0], change_key[1])
+            if change_key not in messages:
+                messages[change_key] = build_traffic_message(
+                    fellow_changes, time_s, self._geo_projection
+                )
+            replies.append(ClientReply(client, messages[change_key]))
+        metrics.FELLOW_VEHICLES.set(len(fellows))
+        LOG.info(
+            "Sending fellow traffic at %.1fs to %d clients (%d messages)",
+            time_s,
+            len(replies),
+            len(messages),
+        )
+        return replies
 
     def serialize_veins_results(self, time_s: float) -> Iterator[asmp.Message]:
         """
@@ -569,7 +796,46 @@ class UnityEgoVehicleUpdateHandler(EgoVehicleUpdateHandler):
             )
             yield vehicle_message
 
-    async def process(self, message: asmp.Message) -> Sequence[asmp.Message]:
+    async def update_trafficlights(self) -> FrozenSet[TrafficLight]:
+        """Return visible traffic lights that changed since the last update."""
+        if self._tls_filter is None:
+            self._tls_filter = TrafficLightFilter(
+                positions=(
+                    await self.sumo_interface.trafficlight_positions()
+                    if self._tls_visibility_radius is not None
+                    else None
+                ),
+                visibility_radius=self._tls_visibility_radius,
+                full_refresh_interval=self._tls_full_refresh_interval,
+            )
+        if self._tls_visibility_radius is not None:
+            # only keep traffic lights close to egos subscribed
+            await self.sumo_interface.require_trafficlights(
+                "unity",
+                await self.sumo_interface.trafficlights_near(
+                    (
+                        (ego.position.x, ego.position.y)
+                        for ego in self._ego_vehicles
+                    ),
+                    self._tls_visibility_radius,
+                ),
+            )
+        # new clients or egos do not know the state of unchanged lights
+        audience = (
+            frozenset(self._client_egos or ()),
+            frozenset(ego.id for ego in self._ego_vehicles),
+        )
+        if audience != self._tls_audience:
+            self._tls_filter.reset()
+            self._tls_audience = audience
+        trafficlights = await self.sumo_interface.update_trafficlights()
+        return self._tls_filter.derive_changes(
+            trafficlights,
+            self._ego_vehicles,
+            self.sumo_interface.time_ms() / 1000,
+        )
+
+    async def process(self, message: asmp.Message) -> Sequence[Reply]:
         """
         Forward ego updates to other simulators and return traffic update.
         """
@@ -578,12 +844,15 @@ class UnityEgoVehicleUpdateHandler(EgoVehicleUpdateHandler):
         replies = list(await super().process(message=message))
 
         # get trafficlight datat
-        trafficlights = await self.sumo_interface.update_trafficlights()
+        trafficlights = await self.update_trafficlights()
         trace(LOG, "Sending trafficlight updates: %s", trafficlights)
 
-        replies.append(
-            build_trafficlight_message(trafficlights, message.vehicle.time_s)
-        )
+        if trafficlights:
+            replies.append(
+                build_trafficlight_message(
+                    trafficlights, message.vehicle.time_s
+                )
+            )
 
         replies.extend(self.serialize_veins_results(message.vehicle.time_s))
 
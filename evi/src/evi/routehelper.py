@@ -4,33 +4,95 @@ Vehicle route and location helpers.
 Tooling to find and reconcstruct routes from coordinate sequences.
 """
 
-from typing import Dict, Iterable, List, Sequence, Tuple
+import bisect
+import concurrent.futures
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
+import numpy as np
 import rtree
 import shapely.geometry
 import sumolib
 
-from .util import drop_consecutive_duplicates
+from .util import SomeType, drop_consecutive_duplicates
 
 FPoint = Tuple[float, float]
 
 
+class NetObjects(Sequence[SomeType]):
+    """
+    Sequence of Sumo network objects that are only looked up when accessed.
+
+    All objects are looked up by their ids on the first item access.
+    Thus, indices can be set up from cached data without the network.
+    """
+
+    ids: Sequence[str]
+
+    def __init__(
+        self, ids: Sequence[str], lookup: Callable[[str], SomeType]
+    ) -> None:
+        self.ids = ids
+        self._lookup = lookup
+        self._objects: Optional[List[SomeType]] = None
+        self._lock = threading.Lock()
+
+    def _resolve(self) -> List[SomeType]:
+        if self._objects is None:
+            with self._lock:
+                if self._objects is None:
+                    self._objects = [
+                        self._lookup(object_id) for object_id in self.ids
+                    ]
+        return self._objects
+
+    def __getitem__(self, index):
+        return self._resolve()[index]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _bulk_load_rtree(bboxes: np.ndarray) -> rtree.index.Index:
+    """Return an rtree of bboxes (one per row) indexed by row number."""
+    if not len(bboxes):
+        return rtree.index.Index()
+    # stream loading is several times faster than inserting one by one
+    return rtree.index.Index(
+        (nr, tuple(bbox), None) for nr, bbox in enumerate(bboxes.tolist())
+    )
+
+
 class LaneFinder:
     """
     Helper to find lanes by x/y coordinates in a Sumo network.
 
-    Uses an rtree with bounding boxes for a fast, imprecise lookup.
-    Then does the final decision using shapely LineStrings.
-    This is aroung 100x faster than shapely.strtree.STRtree.
+    Uses an rtree with bounding boxes of lane segments for a fast lookup
+    of candidate segments within search_radius.
+    Then does the final decision by the (vectorized) distance of the point
+    to each candidate segment.
+    Points farther away from all lanes only consider the segments
+    with the nearest bounding boxes (imprecise).
 
     However, rtree only supports numerical indices (nr).
-    Thus, an additional mapping from nr to lane ids (lid) is used.
+    Thus, an additional mapping from segment nr to lane nr is used.
     This is twice as fast as storing the lane id as an object in the rtree.
     """
 
-    linestrings: Dict[str, shapely.geometry.LineString]
-    nr2lane: Dict[int, sumolib.net.lane.Lane]
+    lanes: Sequence[sumolib.net.lane.Lane]
     rtree: rtree.index.Index
+    search_radius: float
 
     @staticmethod
     def shape2segments(shape: Sequence[FPoint]) -> List[Tuple[FPoint, FPoint]]:
@@ -50,24 +112,74 @@ class LaneFinder:
         (px1, py1), (px2, py2) = segment
         return (min(px1, px2), min(py1, py2), max(px1, px2), max(py1, py2))
 
-    def __init__(self, lanes: Iterable[sumolib.net.lane.Lane]) -> None:
+    @staticmethod
+    def index_data(
+        lanes: Sequence[sumolib.net.lane.Lane],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return lane nr, coordinates, and lane offset of each lane segment.
+
+        Lane nrs refer to the position in lanes.
+        Coordinates are given as rows of (x1, y1, x2, y2).
+        The offset is the distance from the start of the lane shape
+        to the start of the segment.
+        """
+        segments: Dict[Tuple[FPoint, FPoint], Tuple[int, float]] = {}
+        for lane_nr, lane in enumerate(lanes):
+            offset = 0.0
+            for segment in LaneFinder.shape2segments(lane.getShape(True)):
+                segments[segment] = (lane_nr, offset)
+                (px1, py1), (px2, py2) = segment
+                offset += float(np.hypot(px2 - px1, py2 - py1))
+        segment_lanes = np.array(
+            [lane_nr for lane_nr, _ in segments.values()], dtype=np.int32
+        )
+        segment_offsets = np.array(
+            [offset for _, offset in segments.values()], dtype=float
+        )
+        segment_coords = np.array(
+            [(*start, *end) for start, end in segments], dtype=float
+        ).reshape(-1, 4)
+        return segment_lanes, segment_coords, segment_offsets
+
+    def __init__(
+        self,
+        lanes: Iterable[sumolib.net.lane.Lane],
+        search_radius: float = 10.0,
+        index_data: Optional[
+            Tuple[np.ndarray, np.ndarray, np.ndarray]
+        ] = None,
+    ) -> None:
         """
         Set up mapper for Sumo network given in sumo_net_file.
+
+        Precomputed index_data (see LaneFinder.index_data) of the same lanes
+        can be given to skip the segmentation of the lane shapes.
+        Then, the lanes are not accessed before the first lookup
+        (e.g., NetObjects are only looked up then).
         """
-        segments = {
-            segment: lane
-            for lane in lanes
-            for segment in LaneFinder.shape2segments(lane.getShape(True))
-        }
-        self.linestrings = {
-            lane.getID(): shapely.geometry.LineString(lane.getShape(True))
-            for lane in lanes
-        }
-        self.rtree = rtree.index.Index()
-        self.nr2lane = {}
-        for lane_nr, (segment, lane) in enumerate(segments.items()):
-            self.rtree.insert(lane_nr, LaneFinder.segment2bbox(segment))
-            self.nr2lane[lane_nr] = lane
+        self.lanes = lanes if isinstance(lanes, Sequence) else list(lanes)
+        self.search_radius = search_radius
+        if index_data is None:
+            index_data = LaneFinder.index_data(self.lanes)
+        self._segment_lanes, segment_coords, self._segment_offsets = (
+            index_data
+        )
+        self._segment_starts = segment_coords[:, :2]
+        self._segment_vectors = segment_coords[:, 2:] - segment_coords[:, :2]
+        self._segment_lengths2 = np.einsum(
+            "ij,ij->i", self._segment_vectors, self._segment_vectors
+        )
+        # plain lists are much faster to index from python than numpy arrays
+        self._segment_lane_nrs = self._segment_lanes.tolist()
+        self.rtree = _bulk_load_rtree(
+            np.hstack(
+                [
+                    np.minimum(segment_coords[:, :2], segment_coords[:, 2:]),
+                    np.maximum(segment_coords[:, :2], segment_coords[:, 2:]),
+                ]
+            )
+        )
 
     def nearest_lane(self, coord: FPoint) -> sumolib.net.lane.Lane:
         """
@@ -75,15 +187,92 @@ class LaneFinder:
 
         Result undefined for coords inside junctions.
         """
-        point = shapely.geometry.Point(coord)
-        # nearest may yield more than one candidate of similar distance
-        candidates = {self.nr2lane[nr] for nr in self.rtree.nearest(coord, 1)}
-        return min(
-            candidates,
-            key=lambda candidate: self.linestrings[candidate.getID()].distance(
-                point
-            ),
+        segment_nrs, _ = self._nearest_segments(np.array([coord], dtype=float))
+        return self.lanes[self._segment_lane_nrs[int(segment_nrs[0])]]
+
+    def nearest_lanes(
+        self, coords: np.ndarray
+    ) -> Tuple[List[sumolib.net.lane.Lane], np.ndarray]:
+        """
+        Return the nearest lane and the offset on it for each x/y coord.
+
+        Coords are given as an array of shape (N, 2).
+        Offsets are measured along the lane shape from its start.
+        Same results as nearest_lane, but looked up for all coords at once.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if not len(coords):
+            return [], np.empty(0)
+        segment_nrs, fractions = self._nearest_segments(coords)
+        offsets = self._segment_offsets[segment_nrs] + fractions * np.sqrt(
+            self._segment_lengths2[segment_nrs]
         )
+        lane_nrs = self._segment_lane_nrs
+        return [
+            self.lanes[lane_nrs[nr]] for nr in segment_nrs.tolist()
+        ], offsets
+
+    def _nearest_segments(
+        self, coords: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the nearest segment for each coord (and the fraction of it).
+
+        Candidates are all segments with bounding boxes within search_radius.
+        Coords without a candidate that close fall back to the segments
+        with the nearest bounding boxes.
+        """
+        radius = self.search_radius
+        candidates, counts = self.rtree.intersection_v(
+            coords - radius, coords + radius
+        )
+        segment_nrs, fractions, distances2 = self._pick_nearest(
+            coords, candidates, counts
+        )
+        far = distances2 > radius * radius
+        if far.any():
+            far_coords = coords[far]
+            segment_nrs[far], fractions[far], _ = self._pick_nearest(
+                far_coords, *self.rtree.nearest_v(far_coords, far_coords)
+            )
+        return segment_nrs, fractions
+
+    def _pick_nearest(
+        self, coords: np.ndarray, candidates: np.ndarray, counts: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pick the nearest of the candidate segments for each coord.
+
+        Candidates are grouped by coord, with counts candidates per coord.
+        Returns segment nrs, fractions, and squared distances (inf if none).
+        """
+        candidates = candidates.astype(np.intp)
+        counts = counts.astype(np.intp)
+        point_nrs = np.repeat(np.arange(len(coords)), counts)
+        points = coords[point_nrs]
+        starts = self._segment_starts[candidates]
+        vectors = self._segment_vectors[candidates]
+        lengths2 = self._segment_lengths2[candidates]
+        # project the points onto the candidate segments
+        fractions = np.clip(
+            np.einsum("ij,ij->i", points - starts, vectors)
+            / np.where(lengths2 > 0, lengths2, 1.0),
+            0.0,
+            1.0,
+        )
+        deltas = starts + fractions[:, np.newaxis] * vectors - points
+        distances2 = np.einsum("ij,ij->i", deltas, deltas)
+        # first candidate with the least distance per coord
+        order = np.lexsort((distances2, point_nrs))
+        found = counts > 0
+        firsts = order[(np.cumsum(counts) - counts)[found]]
+        result_nrs = np.zeros(len(coords), dtype=np.intp)
+        result_fractions = np.zeros(len(coords))
+        result_distances2 = np.full(len(coords), np.inf)
+        result_nrs[found] = candidates[firsts]
+        result_fractions[found] = fractions[firsts]
+        result_distances2[found] = distances2[firsts]
+        return result_nrs, result_fractions, result_distances2
 
 
 class JunctionFinder:
@@ -103,15 +292,54 @@ class JunctionFinder:
             max(point[1] for point in shape),
         )
 
-    def __init__(self, junctions: Iterable[sumolib.net.node.Node]) -> None:
-        self.rtree = rtree.index.Index()
-        self.nr2junction = dict(enumerate(junctions))
-        self.polygons = {
-            junction.getID(): shapely.geometry.Polygon(junction.getShape())
-            for junction in junctions
-        }
-        for j_nr, junction in self.nr2junction.items():
-            self.rtree.add(j_nr, JunctionFinder.poly_bbox(junction.getShape()))
+    @staticmethod
+    def index_data(
+        junctions: Sequence[sumolib.net.node.Node],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return the bounding boxes and shapes of the junctions.
+
+        The shape points of junction nr i are
+        shape_coords[shape_indptr[i]:shape_indptr[i+1]].
+        """
+        shapes = [junction.getShape() for junction in junctions]
+        bboxes = np.array(
+            [JunctionFinder.poly_bbox(shape) for shape in shapes],
+            dtype=float,
+        ).reshape(-1, 4)
+        shape_indptr = np.zeros(len(shapes) + 1, dtype=np.int32)
+        shape_indptr[1:] = np.cumsum([len(shape) for shape in shapes])
+        shape_coords = np.array(
+            [point[:2] for shape in shapes for point in shape], dtype=float
+        ).reshape(-1, 2)
+        return bboxes, shape_coords, shape_indptr
+
+    def __init__(
+        self,
+        junctions: Iterable[sumolib.net.node.Node],
+        index_data: Optional[
+            Tuple[np.ndarray, np.ndarray, np.ndarray]
+        ] = None,
+    ) -> None:
+        """
+        Set up finder for junctions.
+
+        Precomputed index_data (see JunctionFinder.index_data) of the same
+        junctions can be given to skip reading their shapes.
+        Then, the junctions are not accessed before the first hit.
+        """
+        self.junctions = (
+            junctions if isinstance(junctions, Sequence) else list(junctions)
+        )
+        if index_data is None:
+            index_data = JunctionFinder.index_data(self.junctions)
+        bboxes, shape_coords, shape_indptr = index_data
+        shape_bounds = shape_indptr.tolist()
+        self.polygons = [
+            shapely.geometry.Polygon(shape_coords[begin:end])
+            for begin, end in zip(shape_bounds[:-1], shape_bounds[1:])
+        ]
+        self.rtree = _bulk_load_rtree(bboxes)
 
     def hit_junctions(
         self, coords: List[FPoint]
@@ -119,18 +347,26 @@ class JunctionFinder:
         """Return list of junctions hit by path along points."""
         segments = LaneFinder.shape2segments(coords)
         points = {coord: shapely.geometry.Point(coord) for coord in coords}
-        candidate_junctions = {
-            self.nr2junction[j_nr]
+        candidate_nrs = {
+            j_nr
             for segment in segments
             for j_nr in self.rtree.intersection(self.poly_bbox(segment))
         }
         return {
-            coord: junction
+            coord: self.junctions[j_nr]
             for coord, point in points.items()
-            for junction in candidate_junctions
-            if self.polygons[junction.getID()].contains(point)
+            for j_nr in candidate_nrs
+            if self.polygons[j_nr].contains(point)
         }
 
+    def hit_junction(self, coord: FPoint) -> Optional[sumolib.net.node.Node]:
+        """Return the junction containing coord (or None)."""
+        point = shapely.geometry.Point(coord)
+        for j_nr in self.rtree.intersection((*coord, *coord)):
+            if self.polygons[j_nr].contains(point):
+                return self.junctions[j_nr]
+        return None
+
 
 def are_connected(
     from_edge: sumolib.net.edge.Edge, to_edge: sumolib.net.edge.Edge
@@ -167,6 +403,231 @@ def find_connection(
     )
 
 
+class RoutingIndexData(NamedTuple):
+    """Edge ids and connectivity of a RoutingIndex (see there)."""
+
+    edge_ids: List[str]
+    lengths: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    reverse_indptr: np.ndarray
+    reverse_indices: np.ndarray
+
+
+class RoutingIndex:
+    """
+    Edge connectivity of a Sumo network for fast connector searches.
+
+    Holds the successors (and predecessors) of all edges as CSR arrays,
+    i.e., the successors of edge nr i are indices[indptr[i]:indptr[i+1]].
+    Internal edges are not part of the index (as with Edge.getOutgoing).
+    Connectors between recurring edge pairs are cached.
+    """
+
+    edges: Sequence[sumolib.net.edge.Edge]
+    edge_nrs: Dict[str, int]
+    indptr: np.ndarray
+    indices: np.ndarray
+    reverse_indptr: np.ndarray
+    reverse_indices: np.ndarray
+    lengths: np.ndarray
+    max_hops: int
+    max_length: Optional[float]
+    cache_size: int
+
+    @staticmethod
+    def routed_edges(
+        sumo_net: sumolib.net.Net,
+    ) -> List[sumolib.net.edge.Edge]:
+        """Return the edges of sumo_net that are part of the index."""
+        return [
+            edge for edge in sumo_net.getEdges() if edge.getFunction() == ""
+        ]
+
+    @staticmethod
+    def index_data(edges: Sequence[sumolib.net.edge.Edge]) -> RoutingIndexData:
+        """Return ids, lengths, and CSR connectivity of edges."""
+        edge_nrs = {edge.getID(): nr for nr, edge in enumerate(edges)}
+        successors = [
+            [
+                edge_nrs[next_edge.getID()]
+                for next_edge in edge.getOutgoing().keys()
+                if next_edge.getID() in edge_nrs
+            ]
+            for edge in edges
+        ]
+        predecessors: List[List[int]] = [[] for _ in edges]
+        for nr, next_nrs in enumerate(successors):
+            for next_nr in next_nrs:
+                predecessors[next_nr].append(nr)
+        return RoutingIndexData(
+            list(edge_nrs),
+            np.array([edge.getLength() for edge in edges], dtype=float),
+            *RoutingIndex._to_csr(successors),
+            *RoutingIndex._to_csr(predecessors),
+        )
+
+    def __init__(
+        self,
+        sumo_net: Optional[sumolib.net.Net] = None,
+        max_hops: int = 16,
+        max_length: Optional[float] = None,
+        cache_size: int = 10000,
+        edges: Optional[Sequence[sumolib.net.edge.Edge]] = None,
+        index_data: Optional[RoutingIndexData] = None,
+    ) -> None:
+        """
+        Set up the index for the edges of sumo_net.
+
+        Alternatively, the edges and their precomputed index_data
+        (see RoutingIndex.index_data) can be given instead of sumo_net.
+        Then, the edges are not accessed before the first search.
+        """
+        if edges is None:
+            assert sumo_net is not None, "Needs either sumo_net or edges."
+            edges = self.routed_edges(sumo_net)
+        if index_data is None:
+            index_data = self.index_data(edges)
+        self.edges = edges
+        self.edge_nrs = {
+            edge_id: nr for nr, edge_id in enumerate(index_data.edge_ids)
+        }
+        self.lengths = index_data.lengths
+        self.indptr, self.indices = index_data.indptr, index_data.indices
+        self.reverse_indptr = index_data.reverse_indptr
+        self.reverse_indices = index_data.reverse_indices
+        # plain lists are much faster to index from python than numpy arrays
+        self._successors = self._from_csr(self.indptr, self.indices)
+        self._predecessors = self._from_csr(
+            self.reverse_indptr, self.reverse_indices
+        )
+        self._lengths = self.lengths.tolist()
+        self.max_hops = max_hops
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _to_csr(neighbors: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        indptr = np.zeros(len(neighbors) + 1, dtype=np.int32)
+        indptr[1:] = np.cumsum([len(nrs) for nrs in neighbors])
+        indices = np.array(
+            [nr for nrs in neighbors for nr in nrs], dtype=np.int32
+        )
+        return indptr, indices
+
+    @staticmethod
+    def _from_csr(indptr: np.ndarray, indices: np.ndarray) -> List[List[int]]:
+        indptr_list = indptr.tolist()
+        indices_list = indices.tolist()
+        return [
+            indices_list[begin:end]
+            for begin, end in zip(indptr_list[:-1], indptr_list[1:])
+        ]
+
+    def shortest_connector(
+        self, from_edge: sumolib.net.edge.Edge, to_edge: sumolib.net.edge.Edge
+    ) -> List[sumolib.net.edge.Edge]:
+        """
+        Find the sequence of edges with fewest hops from from_edge to to_edge.
+
+        Same result as find_connection, but searches within max_hops and
+        max_length first and falls back to a bidirectional search.
+        """
+        if from_edge == to_edge:
+            raise ValueError("from_edge and to_edge can not be the same!")
+        key = (from_edge.getID(), to_edge.getID())
+        route = self._cache.get(key)
+        if route is not None:
+            self._cache.move_to_end(key)
+            return route
+        from_nr = self.edge_nrs[from_edge.getID()]
+        to_nr = self.edge_nrs[to_edge.getID()]
+        route_nrs = self._bounded_search(from_nr, to_nr)
+        if route_nrs is None:
+            route_nrs = self._bidirectional_search(from_nr, to_nr)
+        if route_nrs is None:
+            raise RuntimeError(
+                f"No route from {from_edge.getID()} "
+                f"to {to_edge.getID()} found."
+            )
+        route = [self.edges[nr] for nr in route_nrs]
+        self._cache[key] = route
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return route
+
+    @staticmethod
+    def _path(parents: Dict[int, int], nr: int) -> List[int]:
+        path = [nr]
+        while parents[nr] != -1:
+            nr = parents[nr]
+            path.append(nr)
+        path.reverse()
+        return path
+
+    def _bounded_search(self, from_nr: int, to_nr: int) -> Optional[List[int]]:
+        """Breadth-first search within max_hops and max_length."""
+        parents = {from_nr: -1}
+        distances = {from_nr: 0.0}
+        frontier = [from_nr]
+        for _ in range(self.max_hops):
+            next_frontier = []
+            for nr in frontier:
+                for next_nr in self._successors[nr]:
+                    if next_nr in parents:
+                        continue
+                    parents[next_nr] = nr
+                    if next_nr == to_nr:
+                        return self._path(parents, to_nr)
+                    distance = distances[nr] + self._lengths[next_nr]
+                    if (
+                        self.max_length is not None
+                        and distance > self.max_length
+                    ):
+                        continue
+                    distances[next_nr] = distance
+                    next_frontier.append(next_nr)
+            if not next_frontier:
+                return None
+            frontier = next_frontier
+        return None
+
+    def _bidirectional_search(
+        self, from_nr: int, to_nr: int
+    ) -> Optional[List[int]]:
+        """Unbounded breadth-first search from both ends."""
+        parents = {from_nr: -1}
+        children = {to_nr: -1}
+        forward, backward = [from_nr], [to_nr]
+        while forward and backward:
+            # always expand the smaller frontier
+            expand_forward = len(forward) <= len(backward)
+            frontier = forward if expand_forward else backward
+            neighbors = (
+                self._successors if expand_forward else self._predecessors
+            )
+            seen, other = (
+                (parents, children) if expand_forward else (children, parents)
+            )
+            next_frontier = []
+            for nr in frontier:
+                for next_nr in neighbors[nr]:
+                    if next_nr in seen:
+                        continue
+                    seen[next_nr] = nr
+                    if next_nr in other:
+                        head = self._path(parents, next_nr)
+                        tail = self._path(children, next_nr)
+                        return head + tail[::-1][1:]
+                    next_frontier.append(next_nr)
+            if expand_forward:
+                forward = next_frontier
+            else:
+                backward = next_frontier
+        return None
+
+
 def reconstruct_route(
     coords: List[FPoint],
     lane_finder: LaneFinder,
@@ -183,7 +644,7 @@ def reconstruct_route(
     road_coords = [coord for coord in coords if coord not in junction_coords]
 
     # extract lanes under coordinates
-    found_lanes = [lane_finder.nearest_lane(coord) for coord in road_coords]
+    found_lanes, _ = lane_finder.nearest_lanes(np.array(road_coords))
 
     # convert to edges and remove consecutive duplicates
     unique_consecutive_edges = list(
@@ -203,6 +664,158 @@ def reconstruct_route(
     return complete_edges
 
 
+class RouteTracker:
+    """
+    Incrementally reconstruct the routes of vehicles from their coordinates.
+
+    Successive requests of a vehicle mostly share the same coordinates.
+    Thus, edges matched to coordinates and connectors between edges are kept
+    from the previous request of each vehicle and only computed for new ones.
+    Results are the same as reconstruct_route.
+    """
+
+    lane_finder: LaneFinder
+    junction_finder: JunctionFinder
+    routing_index: Optional[RoutingIndex]
+    _coord_edges: Dict[int, Dict[FPoint, Optional[sumolib.net.edge.Edge]]]
+    _connectors: Dict[int, Dict[Tuple, List[sumolib.net.edge.Edge]]]
+
+    def __init__(
+        self,
+        lane_finder: LaneFinder,
+        junction_finder: JunctionFinder,
+        routing_index: Optional[RoutingIndex] = None,
+    ) -> None:
+        self.lane_finder = lane_finder
+        self.junction_finder = junction_finder
+        self.routing_index = routing_index
+        self._coord_edges = {}
+        self._connectors = {}
+
+    def _match_edges(
+        self, coords: Iterable[FPoint]
+    ) -> Dict[FPoint, Optional[sumolib.net.edge.Edge]]:
+        """Return the edge under each coord (None for coords in junctions)."""
+        coord_edges: Dict[FPoint, Optional[sumolib.net.edge.Edge]] = {}
+        road_coords = []
+        for coord in coords:
+            if self.junction_finder.hit_junction(coord) is not None:
+                coord_edges[coord] = None
+            else:
+                road_coords.append(coord)
+        if road_coords:
+            lanes, _ = self.lane_finder.nearest_lanes(np.array(road_coords))
+            for coord, lane in zip(road_coords, lanes):
+                coord_edges[coord] = lane.getEdge()
+        return coord_edges
+
+    def reconstruct(
+        self, vehicle_id: int, coords: List[FPoint]
+    ) -> List[sumolib.net.edge.Edge]:
+        """
+        Reconstruct the complete route of vehicle_id along coords.
+
+        Returns a list of edges, including internal edges.
+        """
+        assert len(coords) >= 2, "Route recontruction needs at least 2 points."
+        last_coord_edges = self._coord_edges.get(vehicle_id, {})
+        coord_edges = {
+            coord: last_coord_edges[coord]
+            for coord in coords
+            if coord in last_coord_edges
+        }
+        # look up all new coordinates at once
+        coord_edges.update(
+            self._match_edges(
+                coord for coord in coords if coord not in coord_edges
+            )
+        )
+        unique_consecutive_edges = list(
+            drop_consecutive_duplicates(
+                coord_edges[coord]
+                for coord in coords
+                if coord_edges[coord] is not None
+            )
+        )
+
+        last_connectors = self._connectors.get(vehicle_id, {})
+        connectors = {}
+        complete_edges = [unique_consecutive_edges[0]]
+        for edge_pair in zip(
+            unique_consecutive_edges[:-1], unique_consecutive_edges[1:]
+        ):
+            if edge_pair not in connectors:
+                connectors[edge_pair] = (
+                    last_connectors[edge_pair]
+                    if edge_pair in last_connectors
+                    else self._find_connection(*edge_pair)[1:]  # w/o from
+                )
+            complete_edges.extend(connectors[edge_pair])
+
+        # only keep what is needed for the next (overlapping) request
+        self._coord_edges[vehicle_id] = coord_edges
+        self._connectors[vehicle_id] = connectors
+        return complete_edges
+
+    def _find_connection(
+        self, from_edge: sumolib.net.edge.Edge, to_edge: sumolib.net.edge.Edge
+    ) -> List[sumolib.net.edge.Edge]:
+        if self.routing_index is not None:
+            return self.routing_index.shortest_connector(from_edge, to_edge)
+        return find_connection(from_edge, to_edge)
+
+    def forget(self, vehicle_id: int) -> None:
+        """Drop all cached data for vehicle_id."""
+        self._coord_edges.pop(vehicle_id, None)
+        self._connectors.pop(vehicle_id, None)
+
+
+class RouteWorkerPool:
+    """
+    Run route computations of vehicles in parallel worker threads.
+
+    Every worker holds its own RouteTracker (and thus its own copies of the
+    lane, junction, and routing indices), so workers never share state.
+    Vehicles are assigned to workers by their id.
+    Thus, the route state of a vehicle stays with one worker
+    and its requests are processed in order.
+    """
+
+    _executors: List[concurrent.futures.ThreadPoolExecutor]
+    _route_trackers: List[RouteTracker]
+
+    def __init__(
+        self, make_route_tracker: Callable[[], RouteTracker], workers: int
+    ) -> None:
+        """Set up workers with route trackers from make_route_tracker."""
+        if workers < 1:
+            raise ValueError("RouteWorkerPool needs at least one worker.")
+        self._route_trackers = [make_route_tracker() for _ in range(workers)]
+        self._executors = [
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"route-worker-{nr}"
+            )
+            for nr in range(workers)
+        ]
+
+    def submit(
+        self,
+        vehicle_id: int,
+        function: Callable[..., SomeType],
+        *args: Any,
+    ) -> "concurrent.futures.Future[SomeType]":
+        """Run function(route_tracker, *args) in the worker of vehicle_id."""
+        worker_nr = vehicle_id % len(self._executors)
+        return self._executors[worker_nr].submit(
+            function, self._route_trackers[worker_nr], *args
+        )
+
+    def shutdown(self) -> None:
+        """Stop all workers (after finishing submitted computations)."""
+        for executor in self._executors:
+            executor.shutdown()
+
+
 def find_tls_in_route(
     route_edges: List[sumolib.net.edge.Edge],
     sumo_net: sumolib.net.Net,
@@ -239,6 +852,143 @@ def find_tls_in_route(
     return result
 
 
+class ConnectionInfo(NamedTuple):
+    """Static data of the connection between two consecutive edges."""
+
+    tls_nr: int  # position in TLSLinkTable.tlss, -1 without tls
+    link_index: int
+    via_length: float
+
+
+class TLSLinkTableData(NamedTuple):
+    """Traffic light ids and connections of a TLSLinkTable (see there)."""
+
+    tls_ids: List[str]
+    connections: Dict[Tuple[str, str], ConnectionInfo]
+
+
+class TLSLinkTable:
+    """
+    Precomputed lookup of connections between edges of a Sumo network.
+
+    Maps each (from_edge, to_edge) id pair to the controlling tls (if any),
+    the link index of the connection, and the length of its via lane.
+    """
+
+    tlss: Sequence[sumolib.net.TLS]
+    connections: Dict[Tuple[str, str], ConnectionInfo]
+
+    @staticmethod
+    def index_data(sumo_net: sumolib.net.Net) -> TLSLinkTableData:
+        """Return the tls ids and connections of all edges of sumo_net."""
+        tls_ids: List[str] = []
+        links: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for junction in sumo_net.getNodes():
+            if junction.getType() != "traffic_light":
+                continue
+            tls = sumo_net.getTLS(junction.getID())
+            tls_ids.append(tls.getID())
+            for lane_in, lane_out, link_index in tls.getConnections():
+                # the first link of an edge pair is used (as in
+                # find_tls_in_route), signals are the same for all of them
+                links.setdefault(
+                    (lane_in.getEdge().getID(), lane_out.getEdge().getID()),
+                    (len(tls_ids) - 1, link_index),
+                )
+        connections = {}
+        for edge in sumo_net.getEdges():
+            if edge.getFunction() == "internal":
+                continue
+            for next_edge, edge_connections in edge.getOutgoing().items():
+                via_lane_id = edge_connections[0].getViaLaneID()
+                key = (edge.getID(), next_edge.getID())
+                tls_nr, link_index = (
+                    links.get(key, (-1, -1))
+                    if edge.getToNode().getType() == "traffic_light"
+                    else (-1, -1)
+                )
+                connections[key] = ConnectionInfo(
+                    tls_nr=tls_nr,
+                    link_index=link_index,
+                    via_length=(
+                        sumo_net.getLane(via_lane_id).getLength()
+                        if via_lane_id
+                        else 0.0
+                    ),
+                )
+        return TLSLinkTableData(tls_ids, connections)
+
+    def __init__(
+        self,
+        sumo_net: Optional[sumolib.net.Net] = None,
+        tlss: Optional[Sequence[sumolib.net.TLS]] = None,
+        index_data: Optional[TLSLinkTableData] = None,
+    ) -> None:
+        """
+        Set up the table for sumo_net.
+
+        Alternatively, the tlss and their precomputed index_data
+        (see TLSLinkTable.index_data) can be given instead of sumo_net.
+        Then, the tlss are not accessed before the first tls is found.
+        """
+        if index_data is None:
+            assert sumo_net is not None, "Needs either sumo_net or index_data."
+            index_data = self.index_data(sumo_net)
+        if tlss is None:
+            assert sumo_net is not None, "Needs either sumo_net or tlss."
+            tlss = [sumo_net.getTLS(tls_id) for tls_id in index_data.tls_ids]
+        self.tlss = tlss
+        self.connections = index_data.connections
+
+    def find_tls_in_route(
+        self, route_edges: List[sumolib.net.edge.Edge]
+    ) -> List[Tuple[sumolib.net.TLS, int, int]]:
+        """
+        Find traffic lights, passed links, and their position along a route.
+
+        Same as find_tls_in_route, but additionally returns the index of the
+        edge in route_edges that ends at the tls.
+        """
+        result = []
+        for edge_nr, (edge, next_edge) in enumerate(
+            zip(route_edges[:-1], route_edges[1:])
+        ):
+            connection = self.connections[(edge.getID(), next_edge.getID())]
+            if connection.tls_nr >= 0:
+                result.append(
+                    (
+                        self.tlss[connection.tls_nr],
+                        connection.link_index,
+                        edge_nr,
+                    )
+                )
+            else:
+                assert edge.getToNode().getType() != "traffic_light"
+        return result
+
+    def route_distances(
+        self, route_edges: List[sumolib.net.edge.Edge]
+    ) -> List[float]:
+        """
+        Return prefix sums of edge and via lane lengths along a route.
+
+        Entry i is the road distance from the start of the first edge
+        to the end of route_edges[i].
+        """
+        distances = []
+        distance = 0.0
+        previous_edge = None
+        for edge in route_edges:
+            if previous_edge is not None:
+                distance += self.connections[
+                    (previous_edge.getID(), edge.getID())
+                ].via_length
+            distance += edge.getLength()
+            distances.append(distance)
+            previous_edge = edge
+        return distances
+
+
 def get_next_green_phase_times(
     program: sumolib.net.TLSProgram,
     link_index: int,
@@ -282,6 +1032,213 @@ def get_next_green_phase_times(
     return result
 
 
+class GreenPhaseTable(NamedTuple):
+    """Green intervals of one link of a tls program over one cycle."""
+
+    cycle_time: float
+    phase_starts: Tuple[float, ...]
+    intervals: Tuple[Tuple[float, float], ...]
+    """Green intervals of three consecutive cycles, starting at -cycle_time."""
+    interval_ends: Tuple[float, ...]
+
+
+def make_green_phase_table(
+    program: sumolib.net.TLSProgram, link_index: int
+) -> GreenPhaseTable:
+    """
+    Compute the (merged) green intervals of link_index within a cycle.
+
+    Phase durations are taken from the program.
+    """
+    phases = program.getPhases()
+    phase_starts = []
+    intervals: List[Tuple[float, float]] = []
+    cycle_time = 0.0
+    for phase in phases:
+        phase_starts.append(cycle_time)
+        end_time = cycle_time + phase.duration
+        if phase.state[link_index] in {"g", "G"}:
+            if intervals and intervals[-1][1] == cycle_time:
+                intervals[-1] = (intervals[-1][0], end_time)
+            else:
+                intervals.append((cycle_time, end_time))
+        cycle_time = end_time
+    if (
+        len(intervals) > 1
+        and intervals[0][0] == 0
+        and intervals[-1][1] == cycle_time
+    ):
+        # green phase across the end of the cycle
+        first = intervals.pop(0)
+        intervals[-1] = (intervals[-1][0], cycle_time + first[1])
+    unrolled = tuple(
+        (begin + offset, end + offset)
+        for offset in (-cycle_time, 0, cycle_time)
+        for begin, end in intervals
+    )
+    return GreenPhaseTable(
+        cycle_time=cycle_time,
+        phase_starts=tuple(phase_starts),
+        intervals=unrolled,
+        interval_ends=tuple(end for _, end in unrolled),
+    )
+
+
+def next_switch_green_windows(
+    program: sumolib.net.TLSProgram,
+    link_index: int,
+    phase_nr: int,
+    time_to_switch: float,
+) -> List[Tuple[float, float]]:
+    """
+    Return the green window of link_index that is certain from the next switch.
+
+    Phases of actuated and delay based programs vary in duration, so only
+    the end of the current phase (next switch, from SUMO) is known. Green
+    lasts at least until then and through the minimum durations of the
+    green phases following it. If the current phase is not green, only a
+    green phase directly after the next switch is certain.
+    Windows are relative to now. As for static programs, an ongoing one
+    begins at the start of the current phase, assuming it ran its nominal
+    duration (but not after now, if SUMO extended the phase beyond it).
+    """
+    phases = program.getPhases()
+
+    def following(nr: int) -> Optional[int]:
+        # the phase after nr, unless its choice depends on detectors
+        next_nrs = phases[nr].next or [(nr + 1) % len(phases)]
+        return next_nrs[0] if len(next_nrs) == 1 else None
+
+    def is_green(nr: int) -> bool:
+        return phases[nr].state[link_index] in {"g", "G"}
+
+    def min_duration(nr: int) -> float:
+        # SUMO runs phases without minDur for their duration
+        phase = phases[nr]
+        return phase.minDur if phase.minDur >= 0 else phase.duration
+
+    if is_green(phase_nr):
+        begin = min(0.0, time_to_switch - phases[phase_nr].duration)
+        end = time_to_switch
+    else:
+        phase_nr = following(phase_nr)
+        if phase_nr is None or not is_green(phase_nr):
+            return []
+        begin = time_to_switch
+        end = time_to_switch + min_duration(phase_nr)
+    for _ in range(len(phases) - 1):
+        phase_nr = following(phase_nr)
+        if phase_nr is None or not is_green(phase_nr):
+            break
+        end += min_duration(phase_nr)
+    return [(begin, end)]
+
+
+class TLSTiming:
+    """
+    Predict green phases of tls links from precomputed cycle tables.
+
+    Tables are built per (tls, program, link index) on first use.
+    The remaining time of the current phase is taken from SUMO
+    (next switch), subsequent phases use the program's phase durations.
+    Durations of phases of actuated and delay based programs vary,
+    so only the green window certain from the next switch is predicted
+    for them (see next_switch_green_windows).
+    Results are cached until the simulation time changes.
+    """
+
+    _tables: Dict[Tuple[str, str, int], GreenPhaseTable]
+    _cache: Dict[Tuple, List[Tuple[float, float]]]
+    _cache_time: Optional[float]
+
+    def __init__(self) -> None:
+        self._tables = {}
+        self._cache = {}
+        self._cache_time = None
+
+    def table(
+        self, tls: sumolib.net.TLS, program_id: str, link_index: int
+    ) -> GreenPhaseTable:
+        """Return the (cached) cycle table for a tls link."""
+        key = (tls.getID(), program_id, link_index)
+        if key not in self._tables:
+            self._tables[key] = make_green_phase_table(
+                tls.getPrograms()[program_id], link_index
+            )
+        return self._tables[key]
+
+    def next_green_windows(
+        self,
+        tls: sumolib.net.TLS,
+        link_index: int,
+        program_id: str,
+        phase_nr: int,
+        time_to_switch: float,
+        green_phases: int,
+        time_s: Optional[float] = None,
+    ) -> List[Tuple[float, float]]:
+        """
+        Return begin/end of the next green_phases windows relative to now.
+
+        An ongoing green window begins at the start of the current phase
+        (same as get_next_green_phase_times and offset_green_phase_times),
+        regardless of the program type. For non-static programs, at most
+        the one window certain from the next switch is returned.
+        Results for the same tls state are cached while time_s is the same.
+        """
+        if time_s != self._cache_time:
+            self._cache.clear()
+            self._cache_time = time_s
+        key = (
+            tls.getID(),
+            link_index,
+            program_id,
+            phase_nr,
+            time_to_switch,
+            green_phases,
+        )
+        if key in self._cache:
+            return self._cache[key]
+
+        program = tls.getPrograms()[program_id]
+        if program.getType() != "static":
+            self._cache[key] = next_switch_green_windows(
+                program, link_index, phase_nr, time_to_switch
+            )
+            return self._cache[key]
+
+        table = self.table(tls, program_id, link_index)
+        phase_start = table.phase_starts[phase_nr]
+        phase_duration = (
+            table.phase_starts[phase_nr + 1]
+            if phase_nr + 1 < len(table.phase_starts)
+            else table.cycle_time
+        ) - phase_start
+        # time since phase start (as it would be with nominal duration)
+        passed_time = phase_duration - time_to_switch
+
+        result: List[Tuple[float, float]] = []
+        cycle_intervals = len(table.intervals) // 3
+        if cycle_intervals:
+            index = bisect.bisect_right(table.interval_ends, phase_start)
+            offset = 0.0
+            while len(result) < green_phases:
+                if index >= len(table.intervals):
+                    index -= cycle_intervals
+                    offset += table.cycle_time
+                begin, end = table.intervals[index]
+                begin = max(begin + offset, phase_start)
+                result.append(
+                    (
+                        begin - phase_start - passed_time,
+                        end + offset - phase_start - passed_time,
+                    )
+                )
+                index += 1
+        self._cache[key] = result
+        return result
+
+
 def offset_green_phase_times(
     green_times: List[Tuple[float, float]],
     passed_time: float,
@@ -5,7 +5,9 @@ import os
 import argparse
 import asyncio
 import concurrent.futures
+import functools
 import logging
+import time
 from typing import (
     Any,
     Dict,
@@ -14,13 +16,17 @@ from typing import (
     Mapping,
     NamedTuple,
     Optional,
+    Tuple,
+    TYPE_CHECKING,
 )
 
 import traci.constants as tc
 import traci.exceptions
 
 from .asynctraci import AsyncTraCI
+from . import metrics, options
 from .defaultconfig import DEFAULTS
+from .playback import TrafficRecorder
 from .state import (
     Position,
     SignalState,
@@ -41,11 +47,14 @@ from .triggers import (
     Trigger,
 )
 
-from sumolib.net import readNet
-from scipy.spatial import cKDTree
 # TODO: switch to rtree, which is already in use elsewhere in evi?
 import numpy as np
 
+if TYPE_CHECKING:
+    # scipy and the network model are slow to import,
+    # only load them once traffic lights or triggers are actually used
+    from scipy.spatial import cKDTree
+
 LOG = logging.getLogger(__name__)
 TRACE = logging.getLogger("trace." + __name__)
 
@@ -68,6 +77,16 @@ TLS_SUMO_MAPPING = {
 }
 
 
+@functools.lru_cache(maxsize=4096)
+def decode_tls_state(state: str) -> Tuple[SignalState, ...]:
+    """
+    Decode a SUMO traffic light state string to signal states.
+
+    Cached, as the number of distinct state strings in a network is small.
+    """
+    return tuple(TLS_SUMO_MAPPING[char.lower()] for char in state)
+
+
 class EgoVehicleConfig(NamedTuple):
     """Sumo configuration set for ego vehicles."""
 
@@ -169,6 +188,12 @@ class SumoInterface:
     _last_step: Optional[asyncio.Task]
     _start_time_ms: int
     _subscribed_vehicles: FrozenSet[str]
+    _trafficlight_positions: Optional[Dict[str, Tuple[float, float]]]
+    _trafficlight_tree: Optional["cKDTree"]
+    _required_trafficlights: Dict[str, FrozenSet[str]]
+    _subscribed_trafficlights: FrozenSet[str]
+    _recorder: Optional[TrafficRecorder]
+    _real_time: bool
 
     VEHICLE_SUBSCRIPTION_VAR_IDS = (
         tc.VAR_ROAD_ID,
@@ -204,6 +229,8 @@ class SumoInterface:
         triggers_file=None,
         config_file=None,
         sumo_network_file=None,
+        record_traffic=None,
+        rt_simulator=None,
         **ignored_kwargs
     ) -> None:
         # TODO: individual configs for each ego vehicle
@@ -215,7 +242,17 @@ class SumoInterface:
         self._ego_vehicle_ids = frozenset()
         self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         self._subscribed_vehicles = frozenset()
+        self._trafficlight_positions = None
+        self._trafficlight_tree = None
+        self._trafficlight_tree_ids = []
+        self._required_trafficlights = {}
+        self._subscribed_trafficlights = frozenset()
         self._last_step = None
+        self._recorder = (
+            TrafficRecorder(record_traffic) if record_traffic else None
+        )
+        # headless runs do not wait for real time, steps are expected to lag
+        self._real_time = rt_simulator != "Headless"
 
         self._dynamic_traffic_spawning_manager = SumoTrafficSpawningManager(
             sumo_interface=self,
@@ -243,56 +280,7 @@ class SumoInterface:
     @classmethod
     def get_parser(cls, defaults) -> argparse.ArgumentParser:
         """Return argument parser for this interface's configuration."""
-        sumo_parser = argparse.ArgumentParser(add_help=False)
-        sumo_group = sumo_parser.add_argument_group("Sumo Interface")
-        # config to connect to running sumo instance or start sumo ourselves
-        sumo_group.add_argument(
-            "--sumo-host",
-            help=(
-                "Host running SUMO to connect to (if not launched by evi, "
-                "default: {}).".format(defaults["sumo_host"])
-            ),
-        )
-        sumo_group.add_argument(
-            "--sumo-port",
-            type=int,
-            help="Port to use for connection to SUMO (default: {}).".format(
-                defaults["sumo_port"]
-            ),
-        )
-        sumo_group.add_argument(
-            "--sumo-keep-route",
-            type=int,
-            choices=[0, 1, 2],
-            help=(
-                "Always keep on roads and route (see move to XY, "
-                "default: {})?".format(defaults["sumo_keep_route"])
-            ),
-        )
-        evi_group = sumo_parser.add_argument_group("Ego vehicle")
-        evi_group.add_argument(
-            "--ego-type",
-            help="Ego vehicle type in SUMO (default: {}).".format(
-                defaults["ego_type"]
-            ),
-        )
-        evi_group.add_argument(
-            "--ego-route-name",
-            help="Name of ego vehicle route in SUMO (default: {}).".format(
-                defaults["ego_route_name"]
-            ),
-        )
-        evi_group.add_argument(
-            "--triggers-file",
-            "--dynamic-spawn-points-file",  # for backwards compatibility
-            help=(
-                "A YAML file defining trigger locations on the map. "
-                "If the ego vehicle passes one of the locations, "
-                "new vehicles will be spawned in the defined locations. "
-                "Requires sumo_network_file."
-            )
-        )
-        return sumo_parser
+        return options.sumo_parser(defaults)
 
     async def warm_up_traffic(self, start_time_ms=0) -> FrozenSet[Vehicle]:
         """
@@ -303,7 +291,8 @@ class SumoInterface:
             "Advancing traffic simulation to sync start time (%s ms)",
             start_time_ms,
         )
-        if start_time_ms != 0:
+        # Sumo already is at start time if started from a saved state
+        if start_time_ms != await self._atraci.sync_time():
             # with step == 0 simulationStep performs one step, no matter what
             with TRACER.complete("advanceInitialTraffic", tid="sumo"):
                 await self._atraci.simulate_step(start_time_ms)
@@ -314,11 +303,41 @@ class SumoInterface:
         self._start_time_ms = start_time_ms
         LOG.info("Sync start time %d ms reached", self._atraci.time_ms())
 
+        if self._recorder is not None:
+            await self.require_trafficlights(
+                "recorder", await self._atraci.get_trafficlight_id_list()
+            )
+            self._recorder.set_network(
+                await self.network_init_data(),
+                await self.trafficlight_positions(),
+            )
+
         # get initial traffic and make it available to advance
         self._last_step = asyncio.create_task(self._update_traffic())
         await self._last_step
+        if self._recorder is not None:
+            self._recorder.add_step(
+                start_time_ms,
+                self._last_step.result(),
+                await self.update_trafficlights(),
+            )
         return self._last_step.result()
 
+    async def save_state(self, file_name: str) -> None:
+        """
+        Save the simulation state (e.g., after warm up) for --load-state.
+
+        Ego vehicles and subscriptions are not restored from the state,
+        warm_up_traffic subscribes to the loaded vehicles again.
+        """
+        with TRACER.complete("saveState", tid="sumo"):
+            await self._atraci.save_state(file_name)
+        LOG.info(
+            "Saved Sumo state at %d ms to %s",
+            self._atraci.time_ms(),
+            file_name,
+        )
+
     async def teardown(self) -> None:
         """
         Tear down the interface and undelying connection
@@ -326,6 +345,8 @@ class SumoInterface:
         LOG.debug("Sumo teardown started...")
         with TRACER.complete("teardown", tid="sumo"):
             await self._atraci.close()
+            if self._recorder is not None:
+                self._recorder.close()
         LOG.info("Sumo teardown complete.")
 
     async def advance(
@@ -337,7 +358,7 @@ class SumoInterface:
         # fetch last traffic results
         assert self._last_step is not None
         if not self._last_step.done():
-            LOG.error(
+            (LOG.error if self._real_time else LOG.debug)(
                 "Last step in Sumo did not finish before next call to advance."
             )
             await asyncio.wait([self._last_step])
@@ -352,6 +373,7 @@ class SumoInterface:
         """
         Instruct SUMO to perform a simulation step and process traffic updates.
         """
+        start_time = time.perf_counter()
         with TRACER.complete("updateEgos", tid="sumo"):
             await self._update_ego_vehicles(ego_vehicles)
         current_sumo_time_ms = self._atraci.time_ms()
@@ -393,6 +415,14 @@ class SumoInterface:
             trace_vehicles(ego_vehicles, current_sumo_time_ms)
 
         traffic = vehicles - ego_vehicles
+        if self._recorder is not None:
+            with TRACER.complete("recordTraffic", tid="sumo"):
+                self._recorder.add_step(
+                    self._atraci.time_ms(),
+                    traffic,
+                    await self.update_trafficlights(),
+                )
+        metrics.SUMO_STEP_SECONDS.observe(time.perf_counter() - start_time)
         return traffic
 
     async def _update_traffic(self) -> FrozenSet[Vehicle]:
@@ -417,6 +447,7 @@ class SumoInterface:
                 new_vehicle_id, self.VEHICLE_SUBSCRIPTION_VAR_IDS
             )
         self._subscribed_vehicles = active_vehicle_ids
+        metrics.SUBSCRIBED_VEHICLES.set(len(active_vehicle_ids))
 
         # don't just use subscription_results as is here
         # there may be other subscriptions in it, e.g. ID_LIST
@@ -519,11 +550,68 @@ class SumoInterface:
         """
         if whitelist is None:
             whitelist = await self._atraci.get_trafficlight_id_list()
-        LOG.debug("Subscribing to trafficlignts: %s", whitelist)
-        for tls_id in whitelist:
-            await self._atraci.subscribe_trafficlight(
-                tls_id, self.TRAFFICLIGHT_SUBSCRIPTION_VAR_IDS
+        await self.require_trafficlights("all", whitelist)
+
+    async def require_trafficlights(
+        self, owner: str, tls_ids: Iterable[str]
+    ) -> None:
+        """
+        Set the traffic lights needed by owner and update subscriptions.
+
+        Traffic lights not needed by any owner any more are unsubscribed.
+        All changes are sent to SUMO in one batch.
+        """
+        self._required_trafficlights[owner] = frozenset(tls_ids)
+        required = frozenset().union(*self._required_trafficlights.values())
+        subscribe = required - self._subscribed_trafficlights
+        unsubscribe = self._subscribed_trafficlights - required
+        if not subscribe and not unsubscribe:
+            return
+        LOG.debug(
+            "Subscribing to trafficlights: %s, unsubscribing from: %s",
+            sorted(subscribe),
+            sorted(unsubscribe),
+        )
+        with TRACER.complete("tlsSubscriptions", tid="sumo"):
+            await self._atraci.update_trafficlight_subscriptions(
+                subscribe, unsubscribe, self.TRAFFICLIGHT_SUBSCRIPTION_VAR_IDS
+            )
+        self._subscribed_trafficlights = required
+
+    async def trafficlights_near(
+        self, coords: Iterable[Tuple[float, float]], radius: float
+    ) -> FrozenSet[str]:
+        """Return ids of traffic lights within radius of any of coords."""
+        coords = list(coords)
+        if not coords:
+            return frozenset()
+        if self._trafficlight_tree is None:
+            from scipy.spatial import cKDTree
+
+            positions = await self.trafficlight_positions()
+            self._trafficlight_tree_ids = list(positions)
+            self._trafficlight_tree = cKDTree(
+                np.array(list(positions.values())).reshape(-1, 2)
+            )
+        return frozenset(
+            self._trafficlight_tree_ids[index]
+            for indices in self._trafficlight_tree.query_ball_point(
+                coords, radius
             )
+            for index in indices
+        )
+
+    def time_ms(self) -> int:
+        """Return current time in Sumo in milliseconds."""
+        return self._atraci.time_ms()
+
+    async def trafficlight_positions(self) -> Dict[str, Tuple[float, float]]:
+        """Return (cached) positions of all traffic lights."""
+        if self._trafficlight_positions is None:
+            self._trafficlight_positions = (
+                await self._atraci.get_trafficlight_positions()
+            )
+        return self._trafficlight_positions
 
     async def update_trafficlights(self) -> FrozenSet[TrafficLight]:
         """Update trafficlight subscriptions and return current states."""
@@ -532,9 +620,8 @@ class SumoInterface:
         result = frozenset(
             TrafficLight(
                 id=tls_id,
-                signals=tuple(
-                    TLS_SUMO_MAPPING[char.lower()]
-                    for char in context[tc.TL_RED_YELLOW_GREEN_STATE]
+                signals=decode_tls_state(
+                    context[tc.TL_RED_YELLOW_GREEN_STATE]
                 ),
                 phase_nr=context[tc.TL_CURRENT_PHASE],
                 program_id=context[tc.TL_CURRENT_PROGRAM],
@@ -621,7 +708,10 @@ class SumoTrafficSpawningManager:
         # Since some of the trigger points are given only by an edge and a
         # position on this edge, we need to convert all positions to Cartesian
         # coordinates first for the kd-tree to work:
-        net = readNet(sumo_network_file)
+        from .network import get_network_model
+        from scipy.spatial import cKDTree
+
+        net = get_network_model(sumo_network_file).net
 
         for trigger in self.trigger_collection.triggers:
             pos = (
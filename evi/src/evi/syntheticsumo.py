@@ -0,0 +1,795 @@
+"""
+Synthetic stand-in for a SUMO TraCI server.
+
+Serves a seeded population of vehicles driving on a grid of straight
+roads, traffic lights at grid crossings and building polygons.
+Only the TraCI commands used by the EVI (see AsyncTraCI and SumoInterface)
+are implemented, so EVI's own throughput can be measured without a
+(large) SUMO scenario dominating the step time.
+
+SUMO's command line options are accepted (and ignored),
+so evid can launch it in place of SUMO:
+    evid.py … --sumo-binary evi-synthetic-sumo
+If -c/--configuration-file is an ini file (e.g., the EVI config),
+the scenario is read from its [synthetic-sumo] section (if present).
+
+Run `evi-synthetic-sumo --help` for usage.
+"""
+
+import argparse
+import configparser
+import logging
+import math
+import random
+import socket
+import struct
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import traci.constants as tc
+
+LOG = logging.getLogger(__name__)
+
+TRACI_API_VERSION = 20
+SUMO_VERSION = "SUMO 1.6.0 (synthetic)"
+
+ID_LIST = tc.ID_LIST if hasattr(tc, "ID_LIST") else tc.TRACI_ID_LIST
+
+RTYPE_OK = 0x00
+RTYPE_NOTIMPLEMENTED = 0x01
+RTYPE_ERR = 0xFF
+
+VEHICLE_CLASSES = (
+    ("passenger", 0.8),
+    ("truck", 0.05),
+    ("bus", 0.05),
+    ("bicycle", 0.1),
+)
+
+# signal states and durations (s) of every traffic light's program
+TLS_PHASES = (("Gr", 30.0), ("yr", 3.0), ("rG", 30.0), ("ry", 3.0))
+TLS_CYCLE_S = sum(duration for _, duration in TLS_PHASES)
+
+
+class SyntheticScenario(NamedTuple):
+    """Parameters of the synthetic traffic."""
+
+    vehicles: int = 1000
+    churn_rate: float = 0.01
+    step_length_s: float = 0.1
+    step_delay_s: float = 0.0
+    size_m: float = 2000.0
+    block_m: float = 100.0
+    trafficlights: int = 50
+    polygons: int = 100
+    seed: int = 42
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode("latin1")
+    return struct.pack("!i", len(encoded)) + encoded
+
+
+def _typed_string(value: str) -> bytes:
+    return struct.pack("!B", tc.TYPE_STRING) + _string(value)
+
+
+def _typed_string_list(values: Sequence[str]) -> bytes:
+    return struct.pack("!Bi", tc.TYPE_STRINGLIST, len(values)) + b"".join(
+        map(_string, values)
+    )
+
+
+def _typed_int(value: int) -> bytes:
+    return struct.pack("!Bi", tc.TYPE_INTEGER, value)
+
+
+def _typed_double(value: float) -> bytes:
+    return struct.pack("!Bd", tc.TYPE_DOUBLE, value)
+
+
+def _typed_shape(points: Sequence[Tuple[float, float]]) -> bytes:
+    return struct.pack("!BB", tc.TYPE_POLYGON, len(points)) + b"".join(
+        struct.pack("!dd", x, y) for x, y in points
+    )
+
+
+def _with_length(content: bytes) -> bytes:
+    """Prefix a response with its (extended) length."""
+    return struct.pack("!Bi", 0, len(content) + 5) + content
+
+
+def _status(cmd_id: int, result: int = RTYPE_OK, description: str = ""):
+    return (
+        struct.pack("!BBB", 1 + 1 + 1 + 4 + len(description), cmd_id, result)
+        + _string(description)
+    )
+
+
+def _split_edge(edge: str) -> Tuple[str, int]:
+    """Split a grid road id into direction (e.g. -h) and line number."""
+    direction = edge.rstrip("0123456789")
+    return direction, int(edge[len(direction) :])
+
+
+class TraCIError(Exception):
+    """Error answered with a failure status instead of a result."""
+
+    def __init__(self, message: str, result: int = RTYPE_ERR) -> None:
+        super().__init__(message)
+        self.result = result
+
+
+class _Vehicle:
+    """A vehicle driving along a grid road or placed by moveToXY (ego)."""
+
+    __slots__ = (
+        "id",
+        "edge",
+        "pos",
+        "x",
+        "y",
+        "angle",
+        "speed",
+        "vclass",
+        "route",
+        "ego",
+        "static",
+        "template",
+    )
+
+    def __init__(
+        self,
+        id_: str,
+        edge: str,
+        pos: float,
+        speed: float,
+        vclass: str,
+        ego: bool = False,
+    ) -> None:
+        self.id = id_
+        self.edge = edge
+        self.pos = pos
+        self.x = self.y = self.angle = 0.0
+        self.speed = speed
+        self.vclass = vclass
+        self.route = f"route_{edge}"
+        self.ego = ego
+        # encoded values of variables not changing every step
+        self.static: Dict[int, bytes] = {}
+        # subscribed variable ids, static parts and dynamic encoders
+        self.template: Optional[Tuple] = None
+
+    def invalidate(self, var_id: Optional[int] = None) -> None:
+        """Drop cached encodings of var_id (or all variables)."""
+        if var_id is None:
+            self.static.clear()
+        else:
+            self.static.pop(var_id, None)
+        self.template = None
+
+
+class SyntheticTraffic:
+    """
+    Grid road network with traffic lights, polygons and moving vehicles.
+
+    Roads are named h<row> (eastbound), -h<row> (westbound),
+    v<column> (northbound) and -v<column> (southbound), with one lane each.
+    Vehicles keep their road and wrap around at the network boundary.
+    Every step, churn_rate * vehicles * step_length vehicles
+    (on average) are replaced by new ones.
+    """
+
+    def __init__(self, scenario: SyntheticScenario) -> None:
+        self.scenario = scenario
+        self.rng = random.Random(scenario.seed)
+        self.time_ms = 0
+        self.lines = max(int(scenario.size_m // scenario.block_m), 1)
+        self.vehicles: Dict[str, _Vehicle] = {}
+        self.pending_vehicles: Dict[str, _Vehicle] = {}
+        self._next_vehicle_nr = 0
+        for _ in range(scenario.vehicles):
+            self._spawn()
+        crossings = [
+            (row, column)
+            for row in range(self.lines)
+            for column in range(self.lines)
+        ]
+        self.trafficlights = {
+            f"tls{row}_{column}": (
+                (column + 0.5) * scenario.block_m,
+                (row + 0.5) * scenario.block_m,
+                self.rng.uniform(0, TLS_CYCLE_S),
+            )
+            for row, column in sorted(
+                self.rng.sample(
+                    crossings, min(scenario.trafficlights, len(crossings))
+                )
+            )
+        }
+        self.polygons = {}
+        for number in range(scenario.polygons):
+            x = self.rng.uniform(0, scenario.size_m)
+            y = self.rng.uniform(0, scenario.size_m)
+            width = self.rng.uniform(5, 30)
+            self.polygons[f"poly{number}"] = (
+                (x, y),
+                (x + width, y),
+                (x + width, y + width),
+                (x, y + width),
+                (x, y),
+            )
+
+    def _spawn(self) -> None:
+        direction = self.rng.choice(("h", "-h", "v", "-v"))
+        vclass = self.rng.choices(
+            [name for name, _ in VEHICLE_CLASSES],
+            [weight for _, weight in VEHICLE_CLASSES],
+        )[0]
+        speed = self.rng.uniform(3, 6) if vclass == "bicycle" else (
+            self.rng.uniform(8, 16)
+        )
+        vehicle = _Vehicle(
+            f"synth{self._next_vehicle_nr}",
+            f"{direction}{self.rng.randrange(self.lines)}",
+            self.rng.uniform(0, self.scenario.size_m),
+            speed,
+            vclass,
+        )
+        self._next_vehicle_nr += 1
+        self._place(vehicle)
+        self.vehicles[vehicle.id] = vehicle
+
+    def _place(self, vehicle: _Vehicle) -> None:
+        """Set x, y and angle of a grid vehicle from its road position."""
+        direction, line = _split_edge(vehicle.edge)
+        offset = (line + 0.5) * self.scenario.block_m
+        along = vehicle.pos
+        if direction.startswith("-"):
+            along = self.scenario.size_m - vehicle.pos
+        if direction.endswith("h"):
+            vehicle.x, vehicle.y = along, offset
+            vehicle.angle = 270.0 if direction.startswith("-") else 90.0
+        else:
+            vehicle.x, vehicle.y = offset, along
+            vehicle.angle = 180.0 if direction.startswith("-") else 0.0
+
+    def lane_shape(self, lane_id: str) -> List[Tuple[float, float]]:
+        """Return the shape of a road lane or a traffic light approach."""
+        size, block = self.scenario.size_m, self.scenario.block_m
+        if lane_id.startswith("tls"):
+            tls_id, approach, _ = lane_id.rsplit("_", 2)
+            if tls_id in self.trafficlights:
+                x, y, _ = self.trafficlights[tls_id]
+                if approach == "h":
+                    return [(x - block / 2, y), (x, y)]
+                return [(x, y - block / 2), (x, y)]
+        else:
+            try:
+                direction, line = _split_edge(lane_id.rsplit("_", 1)[0])
+            except ValueError:
+                direction, line = "", -1
+            if direction in ("h", "-h", "v", "-v") and line < self.lines:
+                offset = (line + 0.5) * block
+                start, end = (size, 0.0) if direction[0] == "-" else (0, size)
+                if direction.endswith("h"):
+                    return [(start, offset), (end, offset)]
+                return [(offset, start), (offset, end)]
+        raise TraCIError(f"Lane '{lane_id}' is not known")
+
+    def snap_to_road(self, x: float, y: float, angle: float) -> Tuple:
+        """Return edge and position of the road closest to x/y."""
+        block = self.scenario.block_m
+        row = min(max(round(y / block - 0.5), 0), self.lines - 1)
+        column = min(max(round(x / block - 0.5), 0), self.lines - 1)
+        heading_east = math.sin(math.radians(angle)) >= 0
+        heading_north = math.cos(math.radians(angle)) >= 0
+        if abs(y - (row + 0.5) * block) <= abs(x - (column + 0.5) * block):
+            if heading_east:
+                return f"h{row}", x
+            return f"-h{row}", self.scenario.size_m - x
+        if heading_north:
+            return f"v{column}", y
+        return f"-v{column}", self.scenario.size_m - y
+
+    def trafficlight_state(self, tls_id: str) -> Tuple[int, str, float]:
+        """Return current phase, state string and next switch time (s)."""
+        time_s = self.time_ms / 1000
+        in_cycle = (time_s + self.trafficlights[tls_id][2]) % TLS_CYCLE_S
+        for phase, (state, duration) in enumerate(TLS_PHASES):
+            if in_cycle < duration:
+                return phase, state, time_s - in_cycle + duration
+            in_cycle -= duration
+        return 0, TLS_PHASES[0][0], time_s
+
+    def step(self) -> None:
+        """Advance the simulation by one step."""
+        scenario = self.scenario
+        self.time_ms += round(scenario.step_length_s * 1000)
+        churn = scenario.churn_rate * len(self.vehicles)
+        churn *= scenario.step_length_s
+        removed = int(churn) + (self.rng.random() < churn % 1)
+        grid_ids = [
+            vehicle.id for vehicle in self.vehicles.values() if not vehicle.ego
+        ]
+        for vehicle_id in self.rng.sample(
+            grid_ids, min(removed, len(grid_ids))
+        ):
+            del self.vehicles[vehicle_id]
+            self._spawn()
+        for vehicle in self.vehicles.values():
+            if not vehicle.ego:
+                vehicle.pos = (
+                    vehicle.pos + vehicle.speed * scenario.step_length_s
+                ) % scenario.size_m
+                self._place(vehicle)
+        # like SUMO, added vehicles are inserted with the next step
+        self.vehicles.update(self.pending_vehicles)
+        self.pending_vehicles.clear()
+
+
+def _vehicle_static(vehicle: _Vehicle, var_id: int) -> Optional[bytes]:
+    """Return the encoding of a variable that does not change every step."""
+    encoded = vehicle.static.get(var_id)
+    if encoded is None:
+        if var_id == tc.VAR_ROAD_ID:
+            encoded = _typed_string(vehicle.edge)
+        elif var_id == tc.VAR_LANE_ID:
+            encoded = _typed_string(f"{vehicle.edge}_0")
+        elif var_id == tc.VAR_ROUTE_INDEX:
+            encoded = _typed_int(0)
+        elif var_id == tc.VAR_EDGES:
+            encoded = _typed_string_list([vehicle.edge])
+        elif var_id in (tc.VAR_SIGNALS, tc.VAR_STOPSTATE):
+            encoded = _typed_int(0)
+        elif var_id == tc.VAR_ROUTE_ID:
+            encoded = _typed_string(vehicle.route)
+        elif var_id == tc.VAR_VEHICLECLASS:
+            encoded = _typed_string(vehicle.vclass)
+        elif var_id == tc.VAR_SLOPE:
+            encoded = _typed_double(0.0)
+        else:
+            return None
+        vehicle.static[var_id] = encoded
+    return encoded
+
+
+_VEHICLE_DYNAMIC: Dict[int, Callable[[_Vehicle], bytes]] = {
+    tc.VAR_LANEPOSITION: lambda v: _typed_double(v.pos),
+    tc.VAR_SPEED: lambda v: _typed_double(v.speed),
+    tc.VAR_POSITION3D: lambda v: struct.pack(
+        "!Bddd", tc.POSITION_3D, v.x, v.y, 0.0
+    ),
+    tc.VAR_POSITION: lambda v: struct.pack(
+        "!Bdd", tc.POSITION_2D, v.x, v.y
+    ),
+    tc.VAR_ANGLE: lambda v: _typed_double(v.angle),
+}
+
+
+class SyntheticTraCIServer:
+    """
+    Serve a SyntheticTraffic to a single TraCI client (like SUMO does).
+    """
+
+    def __init__(self, traffic: SyntheticTraffic) -> None:
+        self.traffic = traffic
+        self.sim_subscription: Tuple[int, ...] = ()
+        self.vehicle_subscriptions: Dict[str, Tuple[int, ...]] = {}
+        self.tls_subscriptions: Dict[str, Tuple[int, ...]] = {}
+        self.handlers = {
+            tc.CMD_GETVERSION: self._get_version,
+            tc.CMD_SIMSTEP: self._simulation_step,
+            tc.CMD_SUBSCRIBE_SIM_VARIABLE: self._subscribe,
+            tc.CMD_SUBSCRIBE_VEHICLE_VARIABLE: self._subscribe,
+            tc.CMD_SUBSCRIBE_TL_VARIABLE: self._subscribe,
+            tc.CMD_GET_SIM_VARIABLE: self._get_variable,
+            tc.CMD_GET_TL_VARIABLE: self._get_variable,
+            tc.CMD_GET_LANE_VARIABLE: self._get_variable,
+            tc.CMD_GET_POLYGON_VARIABLE: self._get_variable,
+            tc.CMD_SET_VEHICLE_VARIABLE: self._set_vehicle_variable,
+        }
+
+    def serve(self, server_socket: socket.socket) -> None:
+        """Accept one client and serve it until it closes the connection."""
+        connection, address = server_socket.accept()
+        LOG.info("TraCI client connected from %s", address)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with connection:
+            while True:
+                message = self._receive(connection)
+                if message is None:
+                    LOG.info("TraCI client disconnected")
+                    return
+                reply, close = self.handle_message(message)
+                connection.sendall(struct.pack("!i", len(reply) + 4) + reply)
+                if close:
+                    LOG.info("TraCI client closed the simulation")
+                    return
+
+    @staticmethod
+    def _receive(connection: socket.socket) -> Optional[bytes]:
+        data = b""
+        length = None
+        while length is None or len(data) < length:
+            chunk = connection.recv(
+                4 - len(data) if length is None else length - len(data)
+            )
+            if not chunk:
+                return None
+            data += chunk
+            if length is None and len(data) == 4:
+                length = struct.unpack("!i", data)[0] - 4
+                data = b""
+        return data
+
+    def handle_message(self, message: bytes) -> Tuple[bytes, bool]:
+        """Answer all commands of message, return (reply, close)."""
+        reply = []
+        offset = 0
+        while offset < len(message):
+            length = message[offset]
+            header = 1
+            if length == 0:
+                length = struct.unpack_from("!i", message, offset + 1)[0]
+                header = 5
+            cmd_id = message[offset + header]
+            content = message[offset + header + 1 : offset + length]
+            offset += length
+            if cmd_id == tc.CMD_CLOSE:
+                reply.append(_status(cmd_id))
+                return b"".join(reply), True
+            handler = self.handlers.get(cmd_id)
+            if handler is None:
+                reply.append(
+                    _status(
+                        cmd_id,
+                        RTYPE_NOTIMPLEMENTED,
+                        f"Command {cmd_id:#x} not implemented "
+                        "by the synthetic SUMO",
+                    )
+                )
+                continue
+            try:
+                result = handler(cmd_id, content)
+            except TraCIError as exc:
+                reply.append(_status(cmd_id, exc.result, str(exc)))
+            except (struct.error, IndexError, UnicodeDecodeError) as exc:
+                reply.append(
+                    _status(cmd_id, RTYPE_ERR, f"Malformed command: {exc}")
+                )
+            else:
+                reply.append(_status(cmd_id))
+                reply.append(result)
+        return b"".join(reply), False
+
+    # commands
+
+    def _get_version(self, cmd_id: int, _content: bytes) -> bytes:
+        return _with_length(
+            struct.pack("!Bi", cmd_id, TRACI_API_VERSION)
+            + _string(SUMO_VERSION)
+        )
+
+    def _simulation_step(self, _cmd_id: int, content: bytes) -> bytes:
+        (target_s,) = struct.unpack("!d", content[:8])
+        traffic = self.traffic
+        target_ms = round(target_s * 1000)
+        if target_s == 0:
+            target_ms = traffic.time_ms + 1
+        while traffic.time_ms < target_ms:
+            traffic.step()
+            if traffic.scenario.step_delay_s > 0:
+                time.sleep(traffic.scenario.step_delay_s)
+        # like SUMO, subscriptions of vehicles which left are dropped
+        for vehicle_id in list(self.vehicle_subscriptions):
+            if vehicle_id and vehicle_id not in traffic.vehicles:
+                del self.vehicle_subscriptions[vehicle_id]
+        results = []
+        if self.sim_subscription:
+            results.append(
+                self._subscription_result(
+                    tc.CMD_SUBSCRIBE_SIM_VARIABLE, "", self.sim_subscription
+                )
+            )
+        for object_id, var_ids in self.vehicle_subscriptions.items():
+            results.append(
+                self._subscription_result(
+                    tc.CMD_SUBSCRIBE_VEHICLE_VARIABLE, object_id, var_ids
+                )
+            )
+        for object_id, var_ids in self.tls_subscriptions.items():
+            results.append(
+                self._subscription_result(
+                    tc.CMD_SUBSCRIBE_TL_VARIABLE, object_id, var_ids
+                )
+            )
+        return struct.pack("!i", len(results)) + b"".join(results)
+
+    def _subscribe(self, cmd_id: int, content: bytes) -> bytes:
+        # begin and end time are ignored
+        (id_length,) = struct.unpack_from("!i", content, 16)
+        object_id = content[20 : 20 + id_length].decode("latin1")
+        num_vars = content[20 + id_length]
+        var_ids = tuple(content[21 + id_length : 21 + id_length + num_vars])
+        subscriptions = {
+            tc.CMD_SUBSCRIBE_VEHICLE_VARIABLE: self.vehicle_subscriptions,
+            tc.CMD_SUBSCRIBE_TL_VARIABLE: self.tls_subscriptions,
+        }.get(cmd_id)
+        if not var_ids:
+            if subscriptions is None:
+                self.sim_subscription = ()
+            else:
+                subscriptions.pop(object_id, None)
+            return b""
+        # fails for unknown objects and variables
+        result = self._subscription_result(cmd_id, object_id, var_ids)
+        if subscriptions is None:
+            self.sim_subscription = var_ids
+        else:
+            subscriptions[object_id] = var_ids
+        return result
+
+    def _subscription_result(
+        self, cmd_id: int, object_id: str, var_ids: Sequence[int]
+    ) -> bytes:
+        if cmd_id == tc.CMD_SUBSCRIBE_VEHICLE_VARIABLE and object_id:
+            vehicle = self.traffic.vehicles.get(object_id)
+            if vehicle is not None:
+                return self._vehicle_subscription_result(vehicle, var_ids)
+        values = [
+            struct.pack("!BB", var_id, RTYPE_OK)
+            + self._value(cmd_id, object_id, var_id)
+            for var_id in var_ids
+        ]
+        return _with_length(
+            struct.pack("!B", cmd_id + 0x10)
+            + _string(object_id)
+            + struct.pack("!B", len(var_ids))
+            + b"".join(values)
+        )
+
+    def _vehicle_subscription_result(
+        self, vehicle: _Vehicle, var_ids: Sequence[int]
+    ) -> bytes:
+        """
+        Encode a vehicle subscription result based on a cached template.
+
+        Only variables changing every step are encoded again,
+        as this dominates the step time with many vehicles.
+        """
+        if vehicle.template is None or vehicle.template[0] != var_ids:
+            statics = []
+            dynamics = []
+            current = b""
+            dynamic_size = 0
+            for var_id in var_ids:
+                current += struct.pack("!BB", var_id, RTYPE_OK)
+                dynamic = _VEHICLE_DYNAMIC.get(var_id)
+                if dynamic is None:
+                    current += self._value(
+                        tc.CMD_GET_VEHICLE_VARIABLE, vehicle.id, var_id
+                    )
+                else:
+                    statics.append(current)
+                    dynamics.append(dynamic)
+                    current = b""
+                    dynamic_size += len(dynamic(vehicle))
+            statics.append(current)
+            content_size = (
+                1 + 4 + len(vehicle.id.encode("latin1")) + 1 + dynamic_size
+            ) + sum(map(len, statics))
+            statics[0] = (
+                struct.pack(
+                    "!BiB",
+                    0,
+                    content_size + 5,
+                    tc.RESPONSE_SUBSCRIBE_VEHICLE_VARIABLE,
+                )
+                + _string(vehicle.id)
+                + struct.pack("!B", len(var_ids))
+                + statics[0]
+            )
+            vehicle.template = (tuple(var_ids), statics, dynamics)
+        _, statics, dynamics = vehicle.template
+        parts = [statics[0]]
+        for encode, static in zip(dynamics, statics[1:]):
+            parts.append(encode(vehicle))
+            parts.append(static)
+        return b"".join(parts)
+
+    def _get_variable(self, cmd_id: int, content: bytes) -> bytes:
+        var_id = content[0]
+        (id_length,) = struct.unpack_from("!i", content, 1)
+        object_id = content[5 : 5 + id_length].decode("latin1")
+        return _with_length(
+            struct.pack("!BB", cmd_id + 0x10, var_id)
+            + _string(object_id)
+            + self._value(cmd_id, object_id, var_id)
+        )
+
+    def _value(self, cmd_id: int, object_id: str, var_id: int) -> bytes:
+        """Return the typed value of a variable of object_id."""
+        traffic = self.traffic
+        domain = cmd_id & 0x0F
+        if domain == tc.CMD_GET_VEHICLE_VARIABLE & 0x0F:
+            if var_id == ID_LIST:
+                return _typed_string_list(list(traffic.vehicles))
+            vehicle = traffic.vehicles.get(object_id)
+            if vehicle is None:
+                raise TraCIError(f"Vehicle '{object_id}' is not known")
+            dynamic = _VEHICLE_DYNAMIC.get(var_id)
+            if dynamic is not None:
+                return dynamic(vehicle)
+            encoded = _vehicle_static(vehicle, var_id)
+            if encoded is not None:
+                return encoded
+        elif domain == tc.CMD_GET_SIM_VARIABLE & 0x0F:
+            if var_id == tc.VAR_TIME_STEP:
+                return _typed_int(traffic.time_ms)
+            if var_id == tc.VAR_TIME:
+                return _typed_double(traffic.time_ms / 1000)
+            if var_id == tc.VAR_DELTA_T:
+                return _typed_double(traffic.scenario.step_length_s)
+            if var_id == tc.VAR_NET_BOUNDING_BOX:
+                size = traffic.scenario.size_m
+                return _typed_shape([(0.0, 0.0), (size, size)])
+        elif domain == tc.CMD_GET_TL_VARIABLE & 0x0F:
+            if var_id == ID_LIST:
+                return _typed_string_list(list(traffic.trafficlights))
+            if object_id not in traffic.trafficlights:
+                raise TraCIError(f"Traffic light '{object_id}' is not known")
+            phase, state, next_switch = traffic.trafficlight_state(object_id)
+            if var_id == tc.TL_CONTROLLED_LANES:
+                return _typed_string_list(
+                    [f"{object_id}_h_0", f"{object_id}_v_0"]
+                )
+            if var_id == tc.TL_CURRENT_PHASE:
+                return _typed_int(phase)
+            if var_id == tc.TL_CURRENT_PROGRAM:
+                return _typed_string("0")
+            if var_id == tc.TL_NEXT_SWITCH:
+                return _typed_double(next_switch)
+            if var_id == tc.TL_RED_YELLOW_GREEN_STATE:
+                return _typed_string(state)
+        elif domain == tc.CMD_GET_LANE_VARIABLE & 0x0F:
+            if var_id == tc.VAR_SHAPE:
+                return _typed_shape(traffic.lane_shape(object_id))
+        elif domain == tc.CMD_GET_POLYGON_VARIABLE & 0x0F:
+            if var_id == ID_LIST:
+                return _typed_string_list(list(traffic.polygons))
+            if object_id not in traffic.polygons:
+                raise TraCIError(f"Polygon '{object_id}' is not known")
+            if var_id == tc.VAR_TYPE:
+                return _typed_string("building")
+            if var_id == tc.VAR_SHAPE:
+                return _typed_shape(traffic.polygons[object_id])
+        raise TraCIError(
+            f"Variable {var_id:#x} of command {cmd_id:#x} not implemented "
+            "by the synthetic SUMO",
+            RTYPE_NOTIMPLEMENTED,
+        )
+
+    def _set_vehicle_variable(self, _cmd_id: int, content: bytes) -> bytes:
+        var_id = content[0]
+        (id_length,) = struct.unpack_from("!i", content, 1)
+        vehicle_id = content[5 : 5 + id_length].decode("latin1")
+        value = content[5 + id_length :]
+        traffic = self.traffic
+        if var_id == tc.ADD_FULL:
+            if vehicle_id in traffic.vehicles:
+                raise TraCIError(f"Vehicle '{vehicle_id}' already exists")
+            # compound of strings, the route id comes first
+            (route_length,) = struct.unpack_from("!i", value, 6)
+            vehicle = _Vehicle(
+                vehicle_id, "h0", 0.0, 0.0, "passenger", ego=True
+            )
+            vehicle.route = value[10 : 10 + route_length].decode("latin1")
+            traffic._place(vehicle)
+            traffic.pending_vehicles[vehicle_id] = vehicle
+            return b""
+        vehicle = traffic.vehicles.get(
+            vehicle_id, traffic.pending_vehicles.get(vehicle_id)
+        )
+        if vehicle is None:
+            raise TraCIError(f"Vehicle '{vehicle_id}' is not known")
+        if var_id == tc.REMOVE:
+            traffic.vehicles.pop(vehicle_id, None)
+            traffic.pending_vehicles.pop(vehicle_id, None)
+        elif var_id == tc.MOVE_TO_XY:
+            # compound: edge, lane, x, y, angle, keepRoute (, matchThreshold)
+            (edge_length,) = struct.unpack_from("!i", value, 6)
+            x, _, y, _, angle = struct.unpack_from(
+                "!dBdBd", value, 10 + edge_length + 5 + 1
+            )
+            vehicle.x, vehicle.y, vehicle.angle = x, y, angle
+            edge, vehicle.pos = traffic.snap_to_road(x, y, angle)
+            if edge != vehicle.edge:
+                vehicle.edge = edge
+                vehicle.invalidate()
+        elif var_id == tc.VAR_SPEED:
+            (vehicle.speed,) = struct.unpack_from("!d", value, 1)
+        elif var_id == tc.VAR_ROUTE_ID:
+            (route_length,) = struct.unpack_from("!i", value, 1)
+            vehicle.route = value[5 : 5 + route_length].decode("latin1")
+            vehicle.invalidate(tc.VAR_ROUTE_ID)
+        elif var_id not in (tc.VAR_SPEEDSETMODE, tc.VAR_LANECHANGE_MODE):
+            raise TraCIError(
+                f"Setting variable {var_id:#x} not implemented "
+                "by the synthetic SUMO",
+                RTYPE_NOTIMPLEMENTED,
+            )
+        return b""
+
+
+def read_scenario(config_file: Optional[str], args) -> SyntheticScenario:
+    """Merge the [synthetic-sumo] section of config_file and args."""
+    values = {}
+    if config_file:
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(config_file)
+        except configparser.Error:
+            # e.g., the .sumo.cfg passed by evid
+            LOG.info("No synthetic scenario in %s", config_file)
+        if parser.has_section("synthetic-sumo"):
+            values.update(parser["synthetic-sumo"])
+    for field in SyntheticScenario._fields:
+        if getattr(args, field) is not None:
+            values[field] = getattr(args, field)
+    defaults = SyntheticScenario()
+    return SyntheticScenario(
+        **{
+            field: type(getattr(defaults, field))(value)
+            for field, value in values.items()
+            if field in SyntheticScenario._fields
+        }
+    )
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog="evi-synthetic-sumo",
+        description="Serve synthetic traffic via TraCI in place of SUMO.",
+    )
+    parser.add_argument("--remote-port", type=int, default=8813)
+    parser.add_argument(
+        "-c",
+        "--configuration-file",
+        help="Config file with a [synthetic-sumo] section (optional).",
+    )
+    defaults = SyntheticScenario()
+    for field in SyntheticScenario._fields:
+        parser.add_argument(
+            "--" + field.replace("_", "-"),
+            type=type(getattr(defaults, field)),
+            help="default: {}".format(getattr(defaults, field)),
+        )
+    parser.add_argument(
+        "--verbosity",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="WARNING",
+    )
+    # other SUMO options are ignored
+    args, ignored = parser.parse_known_args(args)
+    return args, ignored
+
+
+def main(args=None) -> None:
+    """Entry point of evi-synthetic-sumo."""
+    args, ignored = parse_args(args)
+    logging.basicConfig(level=args.verbosity)
+    if ignored:
+        LOG.info("Ignoring SUMO options %s", ignored)
+    scenario = read_scenario(args.configuration_file, args)
+    LOG.info("Serving %s on port %d", scenario, args.remote_port)
+    server = SyntheticTraCIServer(SyntheticTraffic(scenario))
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind(("0.0.0.0", args.remote_port))
+        server_socket.listen(1)
+        server.serve(server_socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Offline analysis of EVI event traces (see evi.tracing).
+
+Spans (complete events and begin/end pairs) are matched per pid and tid.
+Spans nested in a root span (by default "process" on the "request" tid)
+form the span tree of one request. Events are streamed, only the spans
+of pending requests and the durations per span are kept in memory.
+
+Run `evi-trace-report --help` for usage.
+"""
+
+import argparse
+import array
+import collections
+import json
+import sys
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+
+from .defaultconfig import DEFAULTS
+from .tracing import iter_trace
+
+PERCENTILES = (50, 95, 99)
+
+# completed spans not (yet) nested in a root span
+MAX_PENDING_SPANS = 10000
+
+
+class Span(NamedTuple):
+    """A completed span with start and end in microseconds."""
+
+    name: str
+    tid: str
+    start: float
+    end: float
+    args: Optional[dict]
+    children: List["Span"]
+
+    @property
+    def key(self) -> str:
+        return f"{self.tid}:{self.name}"
+
+    @property
+    def dur(self) -> float:
+        return self.end - self.start
+
+
+def iter_spans(events: Iterable[Dict[str, Any]]) -> Iterator[Span]:
+    """
+    Yield spans in the order of their completion.
+
+    Begin/end events are matched by name as asyncio tasks may interleave.
+    """
+    open_spans: Dict[Tuple, List[Dict[str, Any]]] = collections.defaultdict(
+        list
+    )
+    for event in events:
+        phase = event.get("ph")
+        if phase == "X":
+            yield Span(
+                event["name"],
+                str(event.get("tid")),
+                event["ts"],
+                event["ts"] + event.get("dur", 0.0),
+                event.get("args"),
+                [],
+            )
+        elif phase in ("B", "E"):
+            key = (event.get("pid"), event.get("tid"), event["name"])
+            if phase == "B":
+                open_spans[key].append(event)
+            elif open_spans[key]:
+                begin = open_spans[key].pop()
+                args = {**begin.get("args", {}), **event.get("args", {})}
+                yield Span(
+                    event["name"],
+                    str(event.get("tid")),
+                    begin["ts"],
+                    event["ts"],
+                    args or None,
+                    [],
+                )
+
+
+def critical_path(span: Span) -> List[Tuple[str, float]]:
+    """
+    Return the critical path of span as (span key, exclusive time) pairs.
+
+    Starting at the end of span, the latest finishing child is followed,
+    time not covered by children counts for span itself.
+    """
+    path = []
+    self_time = 0.0
+    cursor = span.end
+    for child in sorted(span.children, key=lambda c: c.end, reverse=True):
+        if child.end > cursor:
+            # overlaps with a child already on the path
+            continue
+        self_time += cursor - child.end
+        path.extend(reversed(critical_path(child)))
+        cursor = child.start
+    self_time += max(cursor - span.start, 0.0)
+    path.append((span.key, self_time))
+    return list(reversed(path))
+
+
+def request_label(span: Span) -> str:
+    """Root key, distinguished by message type if traced (e.g. process)."""
+    if span.args and "msgtype" in span.args:
+        return f"{span.key}[{span.args['msgtype']}]"
+    return span.key
+
+
+class TraceAnalysis:
+    """Statistics of one trace, collected while streaming its spans."""
+
+    def __init__(
+        self, root: str, deadline_ms: float, num_slowest: int = 5
+    ) -> None:
+        self.root = root
+        self.deadline_us = deadline_ms * 1000
+        self.num_slowest = num_slowest
+        # durations in ms, compact arrays as traces may be large
+        self.durations: Dict[str, array.array] = collections.defaultdict(
+            lambda: array.array("d")
+        )
+        self.request_durations: Dict[str, array.array] = (
+            collections.defaultdict(lambda: array.array("d"))
+        )
+        self.critical_time: Dict[str, Dict[str, float]] = (
+            collections.defaultdict(lambda: collections.defaultdict(float))
+        )
+        self.deadline_misses: Dict[str, int] = collections.defaultdict(int)
+        self.slowest: List[Tuple[float, str, float, list]] = []
+        self._pending: Dict[str, Deque[Span]] = collections.defaultdict(
+            lambda: collections.deque(maxlen=MAX_PENDING_SPANS)
+        )
+
+    def add(self, span: Span) -> None:
+        """Add a completed span."""
+        self.durations[span.key].append(span.dur / 1000)
+        pending = self._pending[span.tid]
+        # nested spans complete before the span containing them,
+        # spans of concurrent tasks may complete in between
+        nested = []
+        for index in range(len(pending) - 1, -1, -1):
+            other = pending[index]
+            if other.end < span.start:
+                break
+            if other.start >= span.start and other.end <= span.end:
+                nested.append(index)
+        for index in nested:
+            span.children.append(pending[index])
+            del pending[index]
+        if span.key == self.root:
+            self._add_request(span)
+        else:
+            pending.append(span)
+
+    def _add_request(self, span: Span) -> None:
+        label = request_label(span)
+        self.request_durations[label].append(span.dur / 1000)
+        path = critical_path(span)
+        for key, exclusive in path:
+            self.critical_time[label][key] += exclusive / 1000
+        if span.dur > self.deadline_us:
+            self.deadline_misses[label] += 1
+        self.slowest.append((span.dur / 1000, label, span.start, path))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[self.num_slowest :]
+
+    def span_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return count, mean, max and percentiles (in ms) per span key."""
+        return {
+            key: summarize(durations)
+            for key, durations in sorted(self.durations.items())
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """Return all results as a json-serializable dict."""
+        requests = {}
+        for label, durations in sorted(self.request_durations.items()):
+            total = sum(durations)
+            requests[label] = {
+                **summarize(durations),
+                "deadline_misses": self.deadline_misses[label],
+                "critical_path_share": {
+                    key: time_ms / total if total else 0.0
+                    for key, time_ms in sorted(
+                        self.critical_time[label].items(),
+                        key=lambda item: item[1],
+                        reverse=True,
+                    )
+                },
+            }
+        return {
+            "root": self.root,
+            "deadline_ms": self.deadline_us / 1000,
+            "spans": self.span_stats(),
+            "requests": requests,
+            "slowest": [
+                {
+                    "request": label,
+                    "ts": start,
+                    "duration_ms": dur_ms,
+                    "critical_path": [
+                        (key, exclusive / 1000) for key, exclusive in path
+                    ],
+                }
+                for dur_ms, label, start, path in self.slowest
+            ],
+        }
+
+
+def summarize(durations: Iterable[float]) -> Dict[str, float]:
+    """Return count, mean, max and percentiles of durations."""
+    values = np.asarray(durations, dtype=np.float64)
+    stats = {
+        "count": len(values),
+        "mean": float(values.mean()) if len(values) else 0.0,
+        "max": float(values.max()) if len(values) else 0.0,
+    }
+    for percentile in PERCENTILES:
+        stats[f"p{percentile}"] = (
+            float(np.percentile(values, percentile)) if len(values) else 0.0
+        )
+    return stats
+
+
+def analyze_trace(
+    file_name: str, root: str, deadline_ms: float, num_slowest: int = 5
+) -> Dict[str, Any]:
+    """Stream and analyze a trace file."""
+    analysis = TraceAnalysis(root, deadline_ms, num_slowest)
+    for span in iter_spans(iter_trace(file_name)):
+        analysis.add(span)
+    return analysis.report()
+
+
+def diff_reports(
+    report: Dict[str, Any], baseline: Dict[str, Any]
+) -> Dict[str, Dict[str, float]]:
+    """Return relative changes of span percentiles compared to baseline."""
+    diff = {}
+    for key in sorted(set(report["spans"]) | set(baseline["spans"])):
+        stats = report["spans"].get(key)
+        base = baseline["spans"].get(key)
+        diff[key] = {
+            f"p{percentile}": (
+                stats[f"p{percentile}"] / base[f"p{percentile}"] - 1
+                if stats and base and base[f"p{percentile}"]
+                else float("nan")
+            )
+            for percentile in PERCENTILES
+        }
+        diff[key]["count"] = (stats or {}).get("count", 0) - (
+            base or {}
+        ).get("count", 0)
+    return diff
+
+
+def _percentile_columns(stats: Dict[str, float]) -> str:
+    return " ".join(
+        f"{stats[f'p{percentile}']:>9.3f}" for percentile in PERCENTILES
+    )
+
+
+def format_report(
+    report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None
+) -> str:
+    """Format a report (and its diff to baseline) as text tables."""
+    header = " ".join(f"{f'p{p} [ms]':>9}" for p in PERCENTILES)
+    lines = [
+        "Span durations",
+        f"{'span':<32} {'count':>8} {header} {'max [ms]':>9}",
+    ]
+    for key, stats in report["spans"].items():
+        lines.append(
+            f"{key:<32} {stats['count']:>8} {_percentile_columns(stats)} "
+            f"{stats['max']:>9.3f}"
+        )
+
+    lines += [
+        "",
+        f"Requests (root {report['root']}, "
+        f"deadline {report['deadline_ms']:.1f}ms)",
+    ]
+    for label, stats in report["requests"].items():
+        lines.append(
+            f"{label:<32} {stats['count']:>8} {_percentile_columns(stats)} "
+            f"{stats['max']:>9.3f}  "
+            f"{stats['deadline_misses']} deadline misses "
+            f"({stats['deadline_misses'] / stats['count']:.1%})"
+        )
+        lines.append("  critical path share:")
+        lines.extend(
+            f"    {key:<30} {share:>7.1%}"
+            for key, share in stats["critical_path_share"].items()
+            if share >= 0.001
+        )
+
+    if report["slowest"]:
+        lines += ["", "Slowest requests"]
+    for slow in report["slowest"]:
+        lines.append(
+            f"{slow['request']} at ts={slow['ts']:.0f}us: "
+            f"{slow['duration_ms']:.3f}ms"
+        )
+        lines.extend(
+            f"    {key:<30} {exclusive_ms:>9.3f}ms"
+            for key, exclusive_ms in slow["critical_path"]
+            if exclusive_ms >= 0.001
+        )
+
+    if baseline is not None:
+        lines += [
+            "",
+            "Change compared to baseline",
+            f"{'span':<32} {'count':>8} "
+            + " ".join(f"{f'p{p}':>9}" for p in PERCENTILES),
+        ]
+        for key, changes in diff_reports(report, baseline).items():
+            lines.append(
+                f"{key:<32} {changes['count']:>+8} "
+                + " ".join(
+                    f"{changes[f'p{percentile}']:>+9.1%}"
+                    for percentile in PERCENTILES
+                )
+            )
+    return "\n".join(lines)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog="evi-trace-report",
+        description="Summarize latencies in EVI event trace files.",
+    )
+    parser.add_argument(
+        "trace_file", help="Event trace (json or binary, may be compressed)."
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Trace of another run to compare the span percentiles to.",
+    )
+    parser.add_argument(
+        "--root",
+        default="request:process",
+        help=(
+            "Span (tid:name) forming the root of a request "
+            "(default: request:process)."
+        ),
+    )
+    parser.add_argument(
+        "--deadline-ms",
+        type=float,
+        default=float(DEFAULTS["sync_interval_ms"]),
+        help="Deadline of a request (default: sync interval, {}ms).".format(
+            DEFAULTS["sync_interval_ms"]
+        ),
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        default=5,
+        help="Number of slowest requests to show critical paths of.",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Write the report as json instead of text tables.",
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None) -> None:
+    """Entry point of evi-trace-report."""
+    args = parse_args(args)
+    report = analyze_trace(
+        args.trace_file, args.root, args.deadline_ms, args.slowest
+    )
+    baseline = None
+    if args.baseline:
+        baseline = analyze_trace(
+            args.baseline, args.root, args.deadline_ms, args.slowest
+        )
+    if args.json:
+        if baseline is not None:
+            report["baseline"] = baseline
+            report["diff"] = diff_reports(report, baseline)
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(format_report(report, baseline))
+
+
+if __name__ == "__main__":
+    main()
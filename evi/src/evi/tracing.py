@@ -0,0 +1,562 @@
+"""
+Bounded-memory tracing of chrome about://trace style events.
+
+Events are packed into fixed-size binary records in preallocated chunks.
+Names, pids and tids are interned, i.e., stored as numbers.
+Filled chunks are either kept in a ring of the most recent chunks
+or streamed to a file by a background writer thread.
+"""
+
+import collections
+import io
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+from typing import (
+    IO,
+    Any,
+    BinaryIO,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+LOG = logging.getLogger(__name__)
+
+# phase, name, pid, tid, ts (us), dur (us), index into chunk args or -1
+# (name, pid, and tid are indices into the same table of all strings)
+EVENT_RECORD = struct.Struct("<cIIIddi")
+# kind, number of entries, number of payload bytes
+BLOCK_HEADER = struct.Struct("<cII")
+BINARY_MAGIC = b"EVITRACE2\n"
+
+TRACE_FORMATS = ("json", "binary")
+
+_pack_into = EVENT_RECORD.pack_into
+_RECORD_SIZE = EVENT_RECORD.size
+
+
+class _Chunk:
+    """A buffer of packed event records and their (rare) args."""
+
+    __slots__ = ("buffer", "count", "args", "start_ts")
+
+    def __init__(self, size: int) -> None:
+        self.buffer = bytearray(size * EVENT_RECORD.size)
+        self.count = 0
+        self.args: List[Any] = []
+        self.start_ts = 0.0
+
+    def reset(self) -> None:
+        self.count = 0
+        self.args = []
+
+
+class _Span:
+    """Context manager recording a complete event."""
+
+    __slots__ = ("tracer", "name", "pid", "tid", "args", "start")
+
+    def __init__(self, tracer, name, pid, tid, args) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.pid = pid
+        self.tid = tid
+        self.args = args
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter_ns() / 1000
+
+    def __exit__(self, *exc_info) -> None:
+        end = time.perf_counter_ns() / 1000
+        self.tracer._record(
+            b"X",
+            self.name,
+            self.pid,
+            self.tid,
+            self.start,
+            end - self.start,
+            self.args,
+        )
+
+
+class _NullSpan:
+    """Context manager doing nothing, used for disabled or sampled spans."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class EventTracer:
+    """
+    Trace chrome about://trace style events.
+
+    All passed values should be in the units in the spec:
+
+    - ts (time stamps): microseconds
+
+    Memory use is bounded by max_chunks chunks of chunk_size events.
+    Without a writer (see start_writer), only the most recent chunks are
+    kept; with a writer, chunks it can not keep up with are dropped.
+    Instant and complete events of a tid can be sampled, e.g.,
+    sample_every={"veins": 10} keeps every 10th of them.
+    """
+
+    enabled: bool
+    sample_every: Dict[str, int]
+    dropped: int
+
+    def __init__(
+        self,
+        chunk_size: int = 4096,
+        max_chunks: int = 64,
+        flush_interval_s: float = 1.0,
+    ) -> None:
+        self.enabled = True
+        self.sample_every = {}
+        self.dropped = 0
+        self._chunk_size = chunk_size
+        self._max_chunks = max_chunks
+        self._flush_interval_us = flush_interval_s * 1e6
+        self._lock = threading.Lock()
+        self._string_ids: Dict[str, int] = {}
+        self._strings: List[str] = []
+        self._key_ids: Dict[Tuple[str, str, str], Tuple[int, int, int]] = {}
+        self._sample_counters: Dict[str, int] = collections.defaultdict(int)
+        self._chunk = _Chunk(chunk_size)
+        self._free: Deque[_Chunk] = collections.deque()
+        self._ring: Deque[_Chunk] = collections.deque()
+        self._queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+
+    @staticmethod
+    def ts() -> float:
+        """Get current timestamp in microseconds from the internal clock."""
+        return time.perf_counter_ns() / 1000
+
+    def _intern(self, string: str) -> int:
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            # append first, the writer thread may look it up any time later
+            self._strings.append(string)
+            self._string_ids[string] = string_id
+        return string_id
+
+    def _intern_key(self, name: str, pid: str, tid: str):
+        key_ids = self._key_ids[name, pid, tid] = (
+            self._intern(name),
+            self._intern(pid),
+            self._intern(tid),
+        )
+        return key_ids
+
+    def _sampled_out(self, tid: str) -> bool:
+        every = self.sample_every.get(tid)
+        if not every:
+            return False
+        count = self._sample_counters[tid]
+        self._sample_counters[tid] = count + 1
+        return count % every != 0
+
+    def _record(
+        self,
+        phase: bytes,
+        name: str,
+        pid: str,
+        tid: str,
+        ts: float,
+        dur: float,
+        args: Optional[dict],
+    ) -> None:
+        with self._lock:
+            key_ids = self._key_ids.get((name, pid, tid))
+            if key_ids is None:
+                key_ids = self._intern_key(name, pid, tid)
+            chunk = self._chunk
+            if chunk.count == 0:
+                chunk.start_ts = ts
+            args_index = -1
+            if args:
+                args_index = len(chunk.args)
+                chunk.args.append(args)
+            _pack_into(
+                chunk.buffer,
+                chunk.count * _RECORD_SIZE,
+                phase,
+                *key_ids,
+                ts,
+                dur,
+                args_index,
+            )
+            chunk.count += 1
+            if chunk.count == self._chunk_size or (
+                self._queue is not None
+                and ts - chunk.start_ts > self._flush_interval_us
+            ):
+                self._rotate()
+
+    def _rotate(self) -> None:
+        """Hand over the current chunk and start a new one (holding lock)."""
+        chunk = self._chunk
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(chunk)
+            except queue.Full:
+                self.dropped += chunk.count
+                chunk.reset()
+                return
+        else:
+            self._ring.append(chunk)
+            if len(self._ring) > self._max_chunks:
+                oldest = self._ring.popleft()
+                self.dropped += oldest.count
+                oldest.reset()
+                self._free.append(oldest)
+        self._chunk = (
+            self._free.popleft() if self._free else _Chunk(self._chunk_size)
+        )
+
+    def begin(
+        self,
+        name: str,
+        ts: Optional[float] = None,
+        pid: str = "evi",
+        tid: str = "main",
+    ) -> None:
+        """Begin a duration event."""
+        if not self.enabled:
+            return
+        ts = ts if ts is not None else self.ts()
+        self._record(b"B", name, pid, tid, ts, 0.0, None)
+
+    def end(
+        self,
+        name: str,
+        ts: Optional[float] = None,
+        pid: str = "evi",
+        tid: str = "main",
+        args: Optional[dict] = None,
+    ) -> None:
+        """End a duration event."""
+        if not self.enabled:
+            return
+        ts = ts if ts is not None else self.ts()
+        self._record(b"E", name, pid, tid, ts, 0.0, args)
+
+    def instant(
+        self,
+        name: str,
+        ts: Optional[float] = None,
+        pid: str = "evi",
+        tid: str = "main",
+    ) -> None:
+        """Record an instant event without a duration."""
+        if not self.enabled or self._sampled_out(tid):
+            return
+        ts = ts if ts is not None else self.ts()
+        self._record(b"i", name, pid, tid, ts, 0.0, None)
+
+    def complete(
+        self,
+        name: str,
+        pid: str = "evi",
+        tid: str = "main",
+        args: Optional[dict] = None,
+    ):
+        """Record a complete event with start time and duration."""
+        if not self.enabled or self._sampled_out(tid):
+            return _NULL_SPAN
+        return _Span(self, name, pid, tid, args)
+
+    def __len__(self) -> int:
+        """Number of events currently buffered."""
+        with self._lock:
+            return self._chunk.count + sum(
+                chunk.count for chunk in self._ring
+            )
+
+    def _take_buffered(self) -> List[_Chunk]:
+        with self._lock:
+            chunks = list(self._ring)
+            self._ring.clear()
+            if self._chunk.count:
+                chunks.append(self._chunk)
+                self._chunk = _Chunk(self._chunk_size)
+        return chunks
+
+    def events(self, chunk: _Chunk) -> Iterator[Dict[str, Any]]:
+        """Yield the events of a chunk as chrome trace event dicts."""
+        strings = self._strings
+        for phase, name, pid, tid, ts, dur, args_index in (
+            EVENT_RECORD.iter_unpack(
+                memoryview(chunk.buffer)[: chunk.count * EVENT_RECORD.size]
+            )
+        ):
+            yield _event_dict(
+                phase,
+                strings[name],
+                strings[pid],
+                strings[tid],
+                ts,
+                dur,
+                chunk.args[args_index] if args_index >= 0 else None,
+            )
+
+    def write(self, writable: IO, write_head=True) -> int:
+        """
+        Write buffered events to file, clear buffer and return written lines.
+        """
+        if write_head:
+            writable.write("[\n")
+        num_events = 0
+        for chunk in self._take_buffered():
+            for event in self.events(chunk):
+                if num_events:
+                    writable.write(",\n")
+                writable.write(json.dumps(event))
+                num_events += 1
+        if write_head:
+            writable.write("\n]\n")
+        return num_events
+
+    def start_writer(self, file_name: str, trace_format="json") -> None:
+        """
+        Stream all events to file_name from a background thread.
+
+        Events are written at least every flush_interval_s while recording.
+        The json output is a valid chrome trace even if the process crashed.
+        """
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format {trace_format}")
+        assert self._writer is None, "Writer already started"
+        with self._lock:
+            self._queue = queue.Queue(maxsize=self._max_chunks)
+            for chunk in self._ring:
+                self._queue.put_nowait(chunk)
+            self._ring.clear()
+        self._writer = threading.Thread(
+            target=self._write_chunks,
+            args=(file_name, trace_format, self._queue),
+            name="EventTracerWriter",
+            daemon=True,
+        )
+        self._writer.start()
+
+    def stop_writer(self) -> None:
+        """Flush all events to the writer and wait for it to finish."""
+        if self._writer is None:
+            return
+        with self._lock:
+            if self._chunk.count:
+                self._rotate()
+            queue_ = self._queue
+            self._queue = None
+        queue_.put(None)
+        self._writer.join()
+        self._writer = None
+        if self.dropped:
+            LOG.warning("Dropped %d trace events.", self.dropped)
+
+    def _write_chunks(self, file_name, trace_format, chunks) -> None:
+        # imported here as util imports this module
+        from .util import flex_open
+
+        write_chunk = (
+            self._write_json_chunk
+            if trace_format == "json"
+            else self._write_binary_chunk
+        )
+        mode = "wt" if trace_format == "json" else "wb"
+        with flex_open(file_name, mode) as trace_file:
+            trace_file.write("[\n" if trace_format == "json" else BINARY_MAGIC)
+            state = {"events": 0, "strings": 0}
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                write_chunk(trace_file, chunk, state)
+                trace_file.flush()
+                chunk.reset()
+                with self._lock:
+                    if len(self._free) < self._max_chunks:
+                        self._free.append(chunk)
+            if trace_format == "json":
+                trace_file.write("\n]\n")
+        LOG.debug("Wrote %d trace events to %s", state["events"], file_name)
+
+    def _write_json_chunk(self, trace_file, chunk, state) -> None:
+        lines = [json.dumps(event) for event in self.events(chunk)]
+        if lines:
+            if state["events"]:
+                trace_file.write(",\n")
+            trace_file.write(",\n".join(lines))
+            state["events"] += len(lines)
+
+    def _write_binary_chunk(self, trace_file, chunk, state) -> None:
+        # strings interned up to now cover all events of this chunk
+        num_strings = len(self._strings)
+        if num_strings > state["strings"]:
+            payload = json.dumps(
+                self._strings[state["strings"] : num_strings]
+            ).encode()
+            trace_file.write(
+                BLOCK_HEADER.pack(
+                    b"S", num_strings - state["strings"], len(payload)
+                )
+            )
+            trace_file.write(payload)
+            state["strings"] = num_strings
+        if chunk.args:
+            payload = json.dumps(chunk.args).encode()
+            trace_file.write(
+                BLOCK_HEADER.pack(b"A", len(chunk.args), len(payload))
+            )
+            trace_file.write(payload)
+        num_bytes = chunk.count * EVENT_RECORD.size
+        trace_file.write(BLOCK_HEADER.pack(b"E", chunk.count, num_bytes))
+        trace_file.write(memoryview(chunk.buffer)[:num_bytes])
+        state["events"] += chunk.count
+
+
+def _event_dict(
+    phase: bytes,
+    name: str,
+    pid: str,
+    tid: str,
+    ts: float,
+    dur: float,
+    args: Optional[dict],
+) -> Dict[str, Any]:
+    event = {
+        "ph": phase.decode("ascii"),
+        "name": name,
+        "ts": ts,
+        "pid": pid,
+        "tid": tid,
+    }
+    if phase == b"X":
+        event["dur"] = dur
+    if args:
+        event["args"] = args
+    return event
+
+
+def read_binary_trace(readable: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Yield chrome trace event dicts from a binary trace file."""
+    if readable.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not a binary EVI trace file")
+    strings: List[str] = []
+    args: List[Any] = []
+    while True:
+        header = readable.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            # end of file or truncated by a crash
+            return
+        kind, _count, num_bytes = BLOCK_HEADER.unpack(header)
+        payload = readable.read(num_bytes)
+        if len(payload) < num_bytes:
+            return
+        if kind == b"S":
+            strings.extend(json.loads(payload))
+        elif kind == b"A":
+            args = json.loads(payload)
+        elif kind == b"E":
+            for phase, name, pid, tid, ts, dur, args_index in (
+                EVENT_RECORD.iter_unpack(payload)
+            ):
+                yield _event_dict(
+                    phase,
+                    strings[name],
+                    strings[pid],
+                    strings[tid],
+                    ts,
+                    dur,
+                    args[args_index] if args_index >= 0 else None,
+                )
+            args = []
+        else:
+            raise ValueError(f"Unknown block kind {kind!r}")
+
+
+def _iter_json_trace(
+    readable: IO, chunk_size: int = 1 << 20
+) -> Iterator[Dict[str, Any]]:
+    """Yield events of a json trace without reading it as a whole."""
+    decoder = json.JSONDecoder()
+    buffer = readable.read(chunk_size)
+    position = len(buffer) - len(buffer.lstrip())
+    if buffer[position:].startswith("{"):
+        # json object format, only supported for (small) foreign traces
+        yield from json.loads(buffer + readable.read())["traceEvents"]
+        return
+    if not buffer[position:].startswith("["):
+        raise ValueError("Not a json trace file")
+    position += 1
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        event = None
+        if position < len(buffer):
+            try:
+                event, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                pass
+        if event is not None:
+            yield event
+            continue
+        more = readable.read(chunk_size)
+        if not more:
+            # json array format allows a missing end, e.g., after a crash
+            return
+        buffer = buffer[position:] + more
+        position = 0
+
+
+def iter_trace(file_name: str) -> Iterator[Dict[str, Any]]:
+    """Yield all events of a (compressed) json or binary trace file."""
+    from .util import flex_open
+
+    with flex_open(file_name, "rb") as trace_file:
+        binary = trace_file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+        trace_file.seek(0)
+        if binary:
+            yield from read_binary_trace(trace_file)
+        else:
+            yield from _iter_json_trace(
+                io.TextIOWrapper(trace_file, encoding="utf-8")
+            )
+
+
+def read_trace(file_name: str) -> List[Dict[str, Any]]:
+    """Return all events of a json or binary trace file."""
+    return list(iter_trace(file_name))
+
+
+def parse_sample_every(specs: str) -> Dict[str, int]:
+    """Parse comma separated sampling specs of the form tid=n."""
+    sample_every = {}
+    for spec in filter(None, specs.split(",")):
+        tid, _, every = spec.partition("=")
+        sample_every[tid.strip()] = int(every)
+    return sample_every
+
+
+# default event tracer
+TRACER = EventTracer()
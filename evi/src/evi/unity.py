@@ -1,21 +1,86 @@
 """
 Unity3D visualization interface.
+
+Several Unity (3D Environment) clients may connect at the same time.
+Each client is identified by its ZMQ ROUTER identity and owns a session.
+Vehicle updates of all clients are merged into one update per tick.
+Replies are serialized once and fanned out to all clients.
+Clients that miss several ticks in a row (e.g., after crashing) are dropped
+and their ego vehicles unregistered.
 """
 
 import asyncio
 import logging
-from typing import Sequence
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
 
 import zmq
 from zmq.asyncio import Context, Socket
 
 import asmp.asmp_pb2 as asmp
 
-from .request_handlers import RequestDispatcher
+from . import metrics
+from .request_handlers import ClientReply, Reply, RequestDispatcher
+from .util import ID_MAPPER
 
 LOG = logging.getLogger(__name__)
 
 
+class ClientSession:
+    """
+    State of one connected Unity client.
+    """
+
+    address: bytes
+    ego_ids: FrozenSet[str]
+    pending: List[asmp.Message]
+    ego_frames: List[bytes]
+    missed_ticks: int
+
+    def __init__(self, address: bytes) -> None:
+        self.address = address
+        self.ego_ids = frozenset()
+        self.pending = []
+        self.ego_frames = []
+        self.missed_ticks = 0
+
+    def update_ego_ids(self, message: asmp.Message) -> None:
+        """Track registered ego vehicles based on the commands in message."""
+        ego_ids = set(self.ego_ids)
+        for cmd in message.vehicle.commands:
+            if cmd.HasField("register_vehicle_command"):
+                ego_ids.add(
+                    ID_MAPPER.to_string(
+                        cmd.register_vehicle_command.vehicle_id
+                    )
+                )
+            elif cmd.HasField("update_vehicle_command"):
+                ego_ids.add(
+                    ID_MAPPER.to_string(cmd.update_vehicle_command.vehicle_id)
+                )
+            elif cmd.HasField("unregister_vehicle_command"):
+                ego_ids.discard(
+                    ID_MAPPER.to_string(
+                        cmd.unregister_vehicle_command.vehicle_id
+                    )
+                )
+        self.ego_ids = frozenset(ego_ids)
+
+
+def merge_vehicle_messages(messages: Sequence[asmp.Message]) -> asmp.Message:
+    """
+    Merge vehicle messages of several clients into a single message.
+
+    A single message is returned as is.
+    """
+    if len(messages) == 1:
+        return messages[0]
+    merged = asmp.Message()
+    merged.vehicle.time_s = max(msg.vehicle.time_s for msg in messages)
+    for msg in messages:
+        merged.vehicle.commands.extend(msg.vehicle.commands)
+    return merged
+
+
 class UnityProtocol:
     """
     Connection to Unity.
@@ -26,12 +91,21 @@ class UnityProtocol:
     context: Context
     connection: Socket
     current_id: int
+    sessions: Dict[bytes, ClientSession]
+    client_egos: Dict[bytes, FrozenSet[str]]
+    sync_timeout_s: float
+    max_missed_ticks: int
+    _flush_handle: Optional[asyncio.TimerHandle]
 
     def __init__(
         self,
         dispatcher: RequestDispatcher,
         shutdown_event: asyncio.Event,
         evi_port: int,
+        *,
+        client_egos: Optional[Dict[bytes, FrozenSet[str]]] = None,
+        sync_timeout_s: float = 0.1,
+        max_missed_ticks: int = 10,
     ) -> None:
         self.dispatcher = dispatcher
         self.shutdown_event = shutdown_event
@@ -40,73 +114,173 @@ class UnityProtocol:
         self.connection = self.context.socket(zmq.ROUTER)
         self.connection.bind(local_address)
         self.current_id = 0
-        self.clientAdress = ""
-        self.ego_ids = []
-
-
-    # serve from before Multiplayer Extension
-    async def serve_old(self):
-        """Serve requests until the shutdown_event is triggered."""
-        while True:
-            # FIXME: react to shutdown_event
-            # TODO: use recv_mulitpart instead
-            message_bytes = await self.connection.recv()
-
-            # decode
-            message = asmp.Message()
-            message.ParseFromString(message_bytes)
-            LOG.debug("Got Message from Unity: %s", message)
+        self.sessions = {}
+        # shared with the ego vehicle handler for per-client fellow filtering
+        self.client_egos = client_egos if client_egos is not None else {}
+        self.sync_timeout_s = sync_timeout_s
+        self.max_missed_ticks = max_missed_ticks
+        self._flush_handle = None
 
-            # dispatch
-            asyncio.create_task(
-                self.dispatcher.process(message, self._send_replies)
-            )
-            
-            
     async def serve(self):
         """Serve requests until the shutdown_event is triggered."""
         while True:
             # FIXME: react to shutdown_event
-            # because of Multiplayer design: use recv_multipart instead
             message_bytes = await self.connection.recv_multipart()
-            
-            self.clientAdress = message_bytes[0]
-            LOG.debug("Got Adress from Unity: %s", self.clientAdress)
-           
-            i = 0
-            for frame in message_bytes:
-                 
-                # skip client adress field in message
-                i += 1
-                
+            address = message_bytes[0]
+            LOG.debug("Got Adress from Unity: %s", address)
+            session = self.sessions.get(address)
+            if session is None:
+                LOG.info("New Unity client connected: %s", address)
+                session = self.sessions[address] = ClientSession(address)
+
+            for frame in message_bytes[1:]:
                 # skip seperating messages
-                if len(frame.strip())>5:
-                      
-                    # decode
-                    message = asmp.Message()
-                    message.ParseFromString(frame)
-                    
-                    LOG.debug("Got Message from Unity: %s", message)
-    
-                    # dispatch
+                if len(frame.strip()) <= 5:
+                    continue
+
+                # decode
+                message = asmp.Message()
+                message.ParseFromString(frame)
+                LOG.debug("Got Message from Unity: %s", message)
+
+                if message.HasField("vehicle"):
+                    session.ego_frames = [frame]
+                    session.pending.append(message)
+                    self._maybe_flush()
+                else:
+                    # dispatch, reply only to the sender
                     asyncio.create_task(
-                        self.dispatcher.process(message, self._send_replies)
-                    ) 
-
-    def _send_replies(self, replies: Sequence[asmp.Message]) -> None:
-        """Sends the message to Unity."""
-        message_strings = []
-        message_strings.append(self.clientAdress)
-        message_strings.append(b'') 
-        for reply in replies:
-            reply.id = self.current_id
-            self.current_id += 1
-            message_strings.append(reply.SerializeToString())
-        # TODO: proto dumping/tracing
-        LOG.debug(
-            "Unity protocol sending message with %d replies", len(replies)
+                        self.dispatcher.process(
+                            message, self._make_send_function([address])
+                        )
+                    )
+
+    def _maybe_flush(self) -> None:
+        """Flush the tick once all clients sent updates or on timeout."""
+        if all(
+            session.pending
+            for session in self.sessions.values()
+            if session.ego_ids or session.pending
+        ):
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.sync_timeout_s, self._flush
+            )
+
+    def _flush(self) -> None:
+        """Merge pending vehicle updates of all clients and dispatch them."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        messages = []
+        expired = []
+        for session in list(self.sessions.values()):
+            if not session.pending:
+                if session.ego_ids:
+                    session.missed_ticks += 1
+                    if session.missed_ticks >= self.max_missed_ticks:
+                        expired.append(session)
+                continue
+            session.missed_ticks = 0
+            for message in session.pending:
+                session.update_ego_ids(message)
+            messages.extend(session.pending)
+            session.pending = []
+            if session.ego_ids:
+                self.client_egos[session.address] = session.ego_ids
+            else:
+                LOG.info("Unity client left: %s", session.address)
+                self.client_egos.pop(session.address, None)
+                del self.sessions[session.address]
+        if expired and messages:
+            messages.append(self._expire(expired))
+        if not messages:
+            return
+        if len(messages) > 1:
+            LOG.debug("Merging vehicle updates of %d clients", len(messages))
+            metrics.COALESCED_REQUESTS.inc(len(messages) - 1)
+        asyncio.create_task(
+            self.dispatcher.process(
+                merge_vehicle_messages(messages),
+                self._make_send_function(None),
+            )
         )
-        asyncio.create_task(self._send_message_set(message_strings))
+
+    def _expire(self, sessions: Sequence[ClientSession]) -> asmp.Message:
+        """Drop silent sessions, return a message unregistering their egos."""
+        message = asmp.Message()
+        for session in sessions:
+            LOG.warning(
+                "Unity client %s missed %d ticks, dropping its egos %s",
+                session.address,
+                session.missed_ticks,
+                ", ".join(sorted(session.ego_ids)),
+            )
+            for ego_id in sorted(session.ego_ids):
+                command = message.vehicle.commands.add()
+                command.unregister_vehicle_command.vehicle_id = (
+                    ID_MAPPER.to_uint(ego_id)
+                )
+            self.client_egos.pop(session.address, None)
+            del self.sessions[session.address]
+        return message
+
+    def _make_send_function(
+        self, recipients: Optional[Sequence[bytes]]
+    ) -> Callable[[Sequence[Reply]], None]:
+        """Return a send function for replies (None means all clients)."""
+
+        def send_function(replies: Sequence[Reply]) -> None:
+            self._send_replies(
+                replies,
+                recipients
+                if recipients is not None
+                else [
+                    session.address
+                    for session in self.sessions.values()
+                    if session.ego_ids
+                ],
+            )
+
+        return send_function
+
+    def _send_replies(
+        self, replies: Sequence[Reply], recipients: Sequence[bytes]
+    ) -> None:
+        """Sends the messages to Unity clients."""
+        serialized: Dict[int, bytes] = {}
+
+        def serialize(message: asmp.Message) -> bytes:
+            # every message is only serialized once, even if fanned out
+            key = id(message)
+            if key not in serialized:
+                message.id = self.current_id
+                self.current_id += 1
+                with metrics.UNITY_ENCODE_SECONDS.time():
+                    serialized[key] = message.SerializeToString()
+            return serialized[key]
+
+        for address in recipients:
+            message_strings = [address, b""]
+            # relay the most recent ego updates of all other clients
+            for other in self.sessions.values():
+                if other.address != address:
+                    message_strings.extend(other.ego_frames)
+            for reply in replies:
+                if isinstance(reply, ClientReply):
+                    if reply.client != address:
+                        continue
+                    reply = reply.message
+                message_strings.append(serialize(reply))
+            # TODO: proto dumping/tracing
+            metrics.UNITY_MESSAGE_BYTES.set(sum(map(len, message_strings[2:])))
+            LOG.debug(
+                "Unity protocol sending message with %d replies to %s",
+                len(message_strings) - 2,
+                address,
+            )
+            asyncio.create_task(self._send_message_set(message_strings))
 
     async def _send_message_set(self, message_strings):
         await self.connection.send_multipart(message_strings)
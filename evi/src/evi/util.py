@@ -7,6 +7,7 @@ import collections
 import contextlib
 import gzip
 import hashlib
+import importlib.util
 import itertools
 import logging
 import os
@@ -15,7 +16,6 @@ import subprocess
 import time
 import xml.etree.ElementTree as ET
 from typing import (
-    IO,
     Iterable,
     Iterator,
     List,
@@ -25,16 +25,12 @@ from typing import (
     Any,
 )
 
-import psutil
-import sumolib
-import numpy as np
+# the event tracer lives in its own module, but is used via util everywhere
+from .tracing import TRACER, EventTracer  # noqa: F401
 
-try:
-    import pyproj
-
-    PYPROJ_AVAILABLE = True
-except ImportError:
-    PYPROJ_AVAILABLE = False
+# pyproj is only imported once a geo mapper is built (see make_geo_mapper),
+# numpy, psutil, and sumolib only in the helpers using them
+PYPROJ_AVAILABLE = importlib.util.find_spec("pyproj") is not None
 
 
 SomeType = TypeVar("SomeType")
@@ -109,9 +105,101 @@ def empty_dict_if_none(key: Hashable, value: Any) -> dict:
     return {key: value} if value is not None else {}
 
 
+# on-disk caching helpers
+
+
+def hash_files(file_names: Iterable[str], *extra: str) -> str:
+    """
+    Return a hex digest over the contents of all files and extra strings.
+
+    The order of file_names matters, extra strings are hashed after the files.
+    """
+    digest = hashlib.sha256()
+    for file_name in file_names:
+        with open(file_name, "rb") as hashed_file:
+            for block in iter(lambda: hashed_file.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(b"\0")
+    for value in extra:
+        digest.update(value.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Versioned on-disk store for derived data keyed by a (content) hash.
+
+    Entries are stored as `<cache_dir>/<namespace>/v<version>-<key><suffix>`.
+    Bumping the version invalidates all previous entries of a namespace.
+    Writing is atomic, so concurrent EVI instances never read partial data.
+    """
+
+    def __init__(
+        self, cache_dir: str, namespace: str, version: int, suffix=".bin"
+    ) -> None:
+        self.directory = os.path.join(cache_dir, namespace)
+        self.version = version
+        self.suffix = suffix
+
+    def path(self, key: str) -> str:
+        """Return the file name of the entry for key."""
+        return os.path.join(
+            self.directory, f"v{self.version}-{key}{self.suffix}"
+        )
+
+    def load(self, key: str) -> Optional[bytes]:
+        """Return the cached data for key or None if there is no entry."""
+        try:
+            with open(self.path(key), "rb") as cache_file:
+                return cache_file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            LOG.warning("Could not read cache entry %s: %s", key, exc)
+            return None
+
+    def store(self, key: str, data: bytes) -> None:
+        """Store data for key, failures are logged but not raised."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_name = f"{self.path(key)}.{os.getpid()}.tmp"
+            with open(tmp_name, "wb") as cache_file:
+                cache_file.write(data)
+            os.replace(tmp_name, self.path(key))
+        except OSError as exc:
+            LOG.warning("Could not write cache entry %s: %s", key, exc)
+
+
 # SUMO helper functions
 
 
+def sumo_config_input_files(
+    config_file: str, options: Iterable[str] = ("net-file", "additional-files")
+) -> List[str]:
+    """
+    Return the files given for options in the input section of a SUMO config.
+
+    By default, these are the network and additional files.
+    Paths are resolved relative to the directory of the config file.
+    """
+    config_dir = os.path.dirname(config_file)
+    input_section = ET.parse(config_file).getroot().find("input")
+    if input_section is None:
+        return []
+    file_names = []
+    for option in options:
+        element = input_section.find(option)
+        if element is None or not element.get("value"):
+            continue
+        file_names.extend(
+            os.path.join(config_dir, file_name.strip())
+            for file_name in element.get("value").split(",")
+            if file_name.strip()
+        )
+    return file_names
+
+
 def extract_projection_data(net_file_name):
     """
     Extract geo projection data and offset from a sumo net file.
@@ -136,6 +224,8 @@ def make_geo_mapper(projection_params, offset):
         # (https://sumo.dlr.de/docs/Networks/SUMO_Road_Networks.html)
         return lambda x, y: (x - x_off, y - y_off)
 
+    import pyproj
+
     projection = pyproj.Proj(projparams=projection_params)
 
     def geo_mapper(x, y):
@@ -174,6 +264,8 @@ def make_edge_to_lane_map(lane_ids):
 
 def vehicle_to_geolocation(network, vehicle):
     """Return the vehicle's geolocation in the network."""
+    import sumolib
+
     edge = network.getEdge(vehicle.position.road_id)
     lane = edge.getLanes()[vehicle.position.lane_id]
     return network.convertXY2LonLat(
@@ -198,6 +290,8 @@ def get_cartesian_and_direction_and_angle_from_edge_pos(
     :return: Cartesian coordinates (x, y), normalized direction vector,
         and angle in degrees for a given position on a SUMO edge.
     """
+    import numpy as np
+
     edge = sumo_net.getEdge(edge_id)
     if edge_pos < 0 or edge_pos > edge.getLength():
         raise ValueError(
@@ -274,9 +368,18 @@ def drop_consecutive_duplicates(
 async def wait_for_open_port(
     pid, port, transport, wait_duration=0.05, wait_times=100
 ):
-    """Wait until the process with pid is listening to port"""
+    """
+    Wait until the process with pid is listening to port.
+
+    Checks back off exponentially up to wait_duration between checks, within
+    wait_duration * wait_times seconds in total. The port is not connected
+    to, as SUMO serves only the first TraCI client.
+    """
+    import psutil
 
-    for _ in range(wait_times):
+    deadline = time.monotonic() + wait_duration * wait_times
+    interval = 0.001
+    while True:
         open_connections = psutil.Process(pid).connections()
         for connection in open_connections:
             tcp_open = (
@@ -290,8 +393,12 @@ async def wait_for_open_port(
             if connection.laddr[1] == port and (tcp_open or udp_open):
                 LOG.debug("Found open port %d on process %d", port, pid)
                 return
-        await asyncio.sleep(wait_duration)
-    raise TimeoutError("Process did not listen to port in time", pid, port)
+        if time.monotonic() >= deadline:
+            raise TimeoutError(
+                "Process did not listen to port in time", pid, port
+            )
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, wait_duration)
 
 
 async def launch_subproc(
@@ -351,13 +458,44 @@ async def launch_sumo(config, port, extra_opts=None, binary="sumo", seed=None):
     return proc
 
 
+def veins_command(
+    config_name, port, binary, runnr, lanradio_baseport=None, extra_opts=None
+):
+    """
+    Return the command line to run Veins with its TraCI manager on port.
+
+    Overrides the ports configured in omnetpp.ini, so several instances
+    can run side by side (lanradio_baseport only if given).
+    """
+    return [
+        binary,
+        "--",
+        "-c",
+        config_name,
+        "-r",
+        str(runnr),
+        f"--*.manager.port={port}",
+        *(
+            [f"--*.lanradio.baseport={lanradio_baseport}"]
+            if lanradio_baseport is not None
+            else []
+        ),
+        *(extra_opts if extra_opts is not None else []),
+    ]
+
+
 async def launch_veins(
-    config_name, port, binary, scenario_dir, runnr, extra_opts=None
+    config_name,
+    port,
+    binary,
+    scenario_dir,
+    runnr,
+    lanradio_baseport=None,
+    extra_opts=None,
 ):
     """
     Asynchronously lanch a Veins instance as subprocess and wait until its up.
     """
-    extra_opts = extra_opts if extra_opts is not None else []
 
     async def log_veins_instance(veins_launcher):
         async def process_pipe(stream, loggerName):
@@ -373,15 +511,14 @@ async def launch_veins(
 
     return await log_veins_instance(
         launch_subproc(
-            cmd=[
-                binary,
-                "--",
-                "-c",
+            cmd=veins_command(
                 config_name,
-                "-r",
-                str(runnr),
-                *extra_opts,
-            ],
+                port,
+                binary,
+                runnr,
+                lanradio_baseport=lanradio_baseport,
+                extra_opts=extra_opts,
+            ),
             port=port,
             transport="tcp",
             name="Veins (Port: {})".format(port),
@@ -506,113 +643,5 @@ class StringIdMapper:
         )
 
 
-class EventTracer:
-    """
-    Trace chrome about://trace style events.
-
-    All passed values should be in the units in the spec:
-
-    - ts (time stamps): microseconds
-    """
-
-    messages: List[str]
-
-    def __init__(self) -> None:
-        self.messages = []
-
-    def write(self, writable: IO, write_head=True) -> int:
-        """
-        Write stored messages to file, clear buffer and return written lines.
-        """
-        if write_head:
-            writable.write("[\n")
-        num_messages = len(self.messages)
-        for number, message in enumerate(self.messages):
-            comma = "," if number < num_messages - 1 else ""
-            writable.write("{" + message + "}" + comma + "\n")
-        if write_head:
-            writable.write("]\n")
-        self.messages = []
-        return num_messages
-
-    @staticmethod
-    def ts() -> float:
-        """Get current timestamp in microseconds from the internal clock."""
-        return time.perf_counter_ns() / 1000
-
-    def begin(
-        self,
-        name: str,
-        ts: Optional[float] = None,
-        pid: str = "evi",
-        tid: str = "main",
-    ) -> None:
-        """Begin a duration event."""
-        ts = ts if ts is not None else self.ts()
-        self.messages.append(
-            '"ph": "B", '
-            f'"name": "{name}", "ts": {ts}, '
-            f'"pid": "{pid}", "tid": "{tid}"'
-        )
-
-    def end(
-        self,
-        name: str,
-        ts: Optional[float] = None,
-        pid: str = "evi",
-        tid: str = "main",
-        args: Optional[dict] = None,
-    ) -> None:
-        """End a duration event."""
-        ts = ts if ts is not None else self.ts()
-        msg = (
-            '"ph": "E", '
-            f'"name": "{name}", "ts": {ts}, '
-            f'"pid": "{pid}", "tid": "{tid}"'
-        )
-        if args:
-            msg += f', "args": {args}'.replace("'", '"')
-        self.messages.append(msg)
-
-    def instant(
-        self,
-        name: str,
-        ts: Optional[float] = None,
-        pid: str = "evi",
-        tid: str = "main",
-    ) -> None:
-        """Record an instant event without a duration."""
-        ts = ts if ts is not None else self.ts()
-        self.messages.append(
-            '"ph": "i", '
-            f'"name": "{name}", "ts": {ts}, '
-            f'"pid": "{pid}", "tid": "{tid}"'
-        )
-
-    @contextlib.contextmanager
-    def complete(
-        self,
-        name: str,
-        pid: str = "evi",
-        tid: str = "main",
-        args: Optional[dict] = None,
-    ):
-        """Record a complete event with start time and duration."""
-        start = self.ts()
-        yield
-        end = self.ts()
-        msg = (
-            '"ph": "X", '
-            f'"name": "{name}", "ts": {start}, "dur": {end - start}, '
-            f'"pid": "{pid}", "tid": "{tid}"'
-        )
-        if args:
-            msg += f', "args": {args}'.replace("'", '"')
-        self.messages.append(msg)
-
-
 # default shared mapper
 ID_MAPPER = StringIdMapper()
-
-# default event tracer
-TRACER = EventTracer()
@@ -2,7 +2,6 @@
 Interface to Veins C2X simulator.
 """
 
-import argparse
 import asyncio
 import base64
 import logging
@@ -19,6 +18,7 @@ from .defaultconfig import DEFAULTS
 from .filtering import FELLOW_FILTERS, TrafficFilter
 from .proto import vehicle_to_protobuf
 from .state import Vehicle
+from . import metrics, options
 from .util import ID_MAPPER, TRACER
 
 LOG = logging.getLogger(__name__)
@@ -28,11 +28,12 @@ PROTO = logging.getLogger("proto." + __name__)
 VeinsResult = namedtuple("VeinsResult", ["visualization", "vehicle"])
 
 
-def make_network_init_message(
-    network_init_data, start_time_s, sync_interval_s
-):
+def make_network_init_payload(network_init_data):
     """
-    Prepare a serialized message with network initialization data for Veins.
+    Serialize network initialization data for Veins, without time fields.
+
+    The result only depends on the scenario, not on the run configuration.
+    Thus, it can be cached and completed with make_network_init_message.
     """
     msg = asmp.Message()
     netinit = msg.session.netinit
@@ -55,14 +56,28 @@ def make_network_init_message(
             polygon.shape.add()
             polygon.shape[j].x = point[0]
             polygon.shape[j].y = point[1]
-    netinit.init_time_s = start_time_s
-    netinit.sync_interval_s = sync_interval_s
-    LOG.debug("Sending init data:\n%s", netinit)
+    LOG.debug("Prepared init data:\n%s", netinit)
     if not netinit.polygons:
         LOG.warning("No polygons found to send to Veins!")
     return msg.SerializeToString()
 
 
+def make_network_init_message(
+    network_init_payload, start_time_s, sync_interval_s
+):
+    """
+    Prepare a serialized message with network initialization data for Veins.
+
+    Completes a payload from make_network_init_payload with the time fields.
+    Concatenated protobuf messages are merged when parsed,
+    so the (possibly large) payload does not need to be parsed again.
+    """
+    msg = asmp.Message()
+    msg.session.netinit.init_time_s = start_time_s
+    msg.session.netinit.sync_interval_s = sync_interval_s
+    return network_init_payload + msg.SerializeToString()
+
+
 def make_traffic_message(
         traffic_changes,
         ego_vehicles: FrozenSet[Vehicle],
@@ -198,59 +213,13 @@ class VeinsInterface:
     @classmethod
     def get_parser(cls, defaults):
         """Return argument parser for this interface's configuration."""
-        veins_parser = argparse.ArgumentParser(add_help=False)
-        veins_group = veins_parser.add_argument_group("Veins Interface")
-        veins_group.add_argument(
-            "--veins-host",
-            help=(
-                "Host running the Veins server. "
-                "If omitted, no connection to Veins is made."
-            ),
-        )
-        veins_group.add_argument(
-            "--veins-port",
-            type=int,
-            help="Port of the Veins server (default: {}).".format(
-                defaults["veins_port"]
-            ),
-        )
-        veins_group.add_argument(
-            "--sync-interval-ms",
-            type=int,
-            help=(
-                "Synchronization interval length in milliseconds "
-                "(default: {}).".format(defaults["sync_interval_ms"])
-            ),
-        )
-        veins_group.add_argument(
-            "--veins-max-vehicles",
-            type=lambda string: int(string) if string != "None" else None,
-            help=(
-                "Maximum number for vehicles synced to Veins, "
-                "None means unlimited "
-                "(default: {}).".format(defaults["veins_max_vehicles"])
-            ),
-        )
-        veins_group.add_argument(
-            "--veins-fellow-filter",
-            choices=list(FELLOW_FILTERS.keys()),
-            default=defaults["veins_fellow_filter"],
-            help="Filter mechanism to select fellow vehicles.",
-        )
-        veins_group.add_argument(
-            "--veins-threshold",
-            type=lambda string: float(string) if string != "None" else None,
-            default=None,
-            help=(
-                "Computation time veins should not exceed, "
-                "used to adapt number of vehicles, ratio of the sync interval."
-            ),
-        )
-        return veins_parser
+        return options.veins_parser(defaults)
 
-    async def init(self, start_time_ms, network_init_data):
+    async def init(self, start_time_ms, network_init_payload):
         """
         Connect to Veins and forward time until maneuver start.
+
+        Expects network init data serialized by make_network_init_payload.
         """
         connection = self._context.socket(zmq.REQ)
         connection.connect(self._addr)
@@ -259,7 +228,7 @@ class VeinsInterface:
         # wait for init subscription by veins and send init message
         LOG.debug("Socket for Veins set up, waiting for connection...")
         msg = make_network_init_message(
-            network_init_data, start_time_ms / 1e3, self._sync_interval_s
+            network_init_payload, start_time_ms / 1e3, self._sync_interval_s
         )
         await self._protocol.communicate([msg])
         if self._repro_filter:
@@ -349,13 +318,16 @@ class VeinsInterface:
             len(ego_vehicles),
         )
         num_changes = {key: len(val) for key, val in traffic_changes.items()}
-        with TRACER.complete("makeMessage", tid="veins", args=num_changes):
+        with TRACER.complete(
+            "makeMessage", tid="veins", args=num_changes
+        ), metrics.VEINS_ENCODE_SECONDS.time():
             traffic_bytes = make_traffic_message(
                 traffic_changes=traffic_changes,
                 ego_vehicles=ego_vehicles,
                 current_time_s=self._current_time_s,
                 geo_projection=self._geo_projection,
             )
+        metrics.VEINS_MESSAGE_BYTES.set(len(traffic_bytes))
 
         # trace all traffic for reproduction traces if enabled
         if self._repro_filter:
@@ -383,6 +355,9 @@ class VeinsInterface:
         before_send_time = TRACER.ts()
         received_frames = await self._protocol.communicate([traffic_bytes])
         reply_receeived_time = TRACER.ts()
+        metrics.VEINS_ROUNDTRIP_SECONDS.observe(
+            (reply_receeived_time - before_send_time) / 1e6
+        )
         TRACER.begin("simulate", ts=before_send_time, tid="veins")
         TRACER.end(
             "simulate",
@@ -1,10 +1,13 @@
 import itertools as it
+import struct
 import unittest.mock as mock
 
 import pytest
 import traci.constants as tc
+import traci.exceptions
+from traci.storage import Storage
 
-from evi.asynctraci import AsyncTraCI
+from evi.asynctraci import AsyncTraCI, PoiTracer
 
 # All test coroutines will be treated as marked.
 pytestmark = pytest.mark.asyncio
@@ -84,3 +87,110 @@ async def test_vehicle_subscription_yields_vehicle_next_step(atraci):
     assert "veh_1" in results
     assert tc.VAR_SPEED in results["veh_1"]
     assert 10.0 == results["veh_1"][tc.VAR_SPEED]
+
+
+def _pack_string(string):
+    return struct.pack("!i", len(string)) + string.encode("latin1")
+
+
+def make_polygon_response(polygons):
+    """Build the raw TraCI answer to bulk type and shape queries."""
+    response = b""
+    for poly_id, (poly_type, shape) in polygons.items():
+        for var_id, value in (
+            (tc.VAR_TYPE, _pack_string(poly_type)),
+            (
+                tc.VAR_SHAPE,
+                struct.pack("!B", len(shape))
+                + b"".join(struct.pack("!dd", *point) for point in shape),
+            ),
+        ):
+            response += struct.pack(
+                "!BBB", 7, tc.CMD_GET_POLYGON_VARIABLE, tc.RTYPE_OK
+            ) + _pack_string("")
+            body = (
+                struct.pack("!BB", tc.CMD_GET_POLYGON_VARIABLE + 16, var_id)
+                + _pack_string(poly_id)
+                + struct.pack("!B", 0)
+                + value
+            )
+            response += struct.pack("!B", len(body) + 1) + body
+    return Storage(response)
+
+
+async def test_get_all_polygons_uses_single_exchange(atraci):
+    polygons = {
+        "building-1": ("building", ((0.0, 0.0), (1.0, 0.0), (1.0, 1.0))),
+        "building-2": ("shop", ((5.0, 5.0), (6.0, 6.0))),
+    }
+    atraci._connection.polygon.getIDList = mock.Mock(
+        return_value=tuple(polygons.keys())
+    )
+    atraci._connection._recvExact = mock.Mock(
+        return_value=make_polygon_response(polygons)
+    )
+
+    result = await atraci.get_all_polygons()
+
+    atraci._connection._socket.send.assert_called_once()
+    assert result == [
+        {"id": poly_id, "type": poly_type, "shape": shape}
+        for poly_id, (poly_type, shape) in polygons.items()
+    ]
+
+
+async def test_trafficlight_subscriptions_use_single_exchange(atraci):
+    status = struct.pack(
+        "!BBB", 7, tc.CMD_SUBSCRIBE_TL_VARIABLE, tc.RTYPE_OK
+    ) + _pack_string("")
+    atraci._connection._recvExact = mock.Mock(
+        return_value=Storage(status * 3)
+    )
+    atraci._connection._readSubscription = mock.Mock(
+        return_value=("tls-new", tc.CMD_SUBSCRIBE_TL_VARIABLE + 16)
+    )
+
+    await atraci.update_trafficlight_subscriptions(
+        ["tls-new"], ["tls-old-1", "tls-old-2"], [tc.TL_CURRENT_PHASE]
+    )
+
+    atraci._connection._socket.send.assert_called_once()
+    # only the new subscription answers with initial values
+    atraci._connection._readSubscription.assert_called_once()
+
+
+async def test_poi_tracer_sends_only_changes_in_single_exchange(atraci):
+    status = struct.pack(
+        "!BBB", 7, tc.CMD_SET_POI_VARIABLE, tc.RTYPE_OK
+    ) + _pack_string("")
+    atraci._connection._recvExact = mock.Mock(
+        side_effect=lambda: Storage(status * 3)
+    )
+    update_pois = mock.AsyncMock(wraps=atraci.update_pois)
+    tracer = PoiTracer(atraci, min_interval_s=0.0, enabled=True)
+    tracer._atraci = mock.Mock(update_pois=update_pois)
+
+    await tracer.update([(0.0, 0.0), (1.0, 0.0), (2.0, 0.0)], owner=1)
+    await tracer.update([(1.0, 0.0), (2.0, 0.0), (3.0, 0.0)], owner=1)
+    await tracer.update([(1.0, 0.0), (2.0, 0.0), (3.0, 0.0)], owner=1)
+
+    assert atraci._connection._socket.send.call_count == 2
+    assert len(update_pois.call_args_list[0].kwargs["add"]) == 3
+    # the poi of the vanished coordinate is moved to the new one
+    assert update_pois.call_args_list[1].kwargs == {
+        "remove": [],
+        "move": [("1-0", (3.0, 0.0))],
+        "add": [],
+    }
+
+
+async def test_poi_tracer_is_disabled_without_gui(atraci):
+    atraci._connection.gui.getIDList = mock.Mock(
+        side_effect=traci.exceptions.TraCIException("not implemented")
+    )
+    tracer = PoiTracer(atraci)
+
+    await tracer.update([(0.0, 0.0)], owner=1)
+
+    assert tracer.enabled is False
+    atraci._connection._socket.send.assert_not_called()
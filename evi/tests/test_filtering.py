@@ -3,13 +3,16 @@ from random import Random
 
 import pytest  # noqa
 
-from evi.filtering import FELLOW_FILTERS
+from evi.filtering import FELLOW_FILTERS, TrafficLightFilter
 
 PLAYGROUND_SIZE = 10000
 
 # stub type for Vehicle and position objects without all the extra fields
 Position = namedtuple('Position', ['x', 'y'])
 Vehicle = namedtuple('Vehicle', ['id', 'position'])
+TrafficLight = namedtuple(
+    'TrafficLight', ['id', 'signals', 'phase_nr', 'program_id', 'time_to_switch']
+)
 
 
 def _generate_vehicles(rgen, number, prefix="vehicle-"):
@@ -65,3 +68,25 @@ def test_benchmark_filters(benchmark, filter_function, ego_vehicles, fellow_pool
         max_vehicles=vehicle_limit
     )
     assert len(selected_fellows) <= vehicle_limit
+
+
+def test_trafficlight_filter_sends_visible_changes_only():
+    tls_filter = TrafficLightFilter(
+        positions={"near": (10, 0), "far": (5000, 0)},
+        visibility_radius=100,
+        full_refresh_interval=3,
+    )
+    egos = [Vehicle("ego", Position(0, 0))]
+
+    def lights(time_s, near_state="r"):
+        return [
+            TrafficLight("near", (near_state,), 0, "0", 10 - time_s),
+            TrafficLight("far", ("r",), 0, "0", 10 - time_s),
+        ]
+
+    assert {tl.id for tl in tls_filter.derive_changes(lights(0), egos, 0)} == {"near"}
+    # countdown alone is no change
+    assert not tls_filter.derive_changes(lights(1), egos, 1)
+    assert {tl.id for tl in tls_filter.derive_changes(lights(2, "g"), egos, 2)} == {"near"}
+    # periodic full refresh
+    assert {tl.id for tl in tls_filter.derive_changes(lights(3, "g"), egos, 3)} == {"near"}
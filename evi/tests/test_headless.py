@@ -0,0 +1,127 @@
+"""
+Test driving EVI headless from ego trajectories.
+"""
+
+import asyncio
+
+import pytest
+
+from evi.headless import (
+    EgoSample,
+    HeadlessDriver,
+    read_vehicle_messages,
+    sample_trajectories,
+)
+from evi.playback import PlaybackInterface, TrafficRecorder
+from evi.request_handlers import EgoVehicleUpdateHandler, RequestDispatcher
+from evi.state import Position, Vehicle, VehicleType
+from evi.util import ID_MAPPER
+
+
+def command_summary(message):
+    """Return (command kind, ego id) pairs of a vehicle message."""
+    summary = []
+    for command in message.vehicle.commands:
+        kind = command.WhichOneof("command_oneof")
+        vehicle_id = getattr(command, kind).vehicle_id
+        summary.append((kind.split("_")[0], ID_MAPPER.to_string(vehicle_id)))
+    return summary
+
+
+def test_sample_trajectories():
+    samples = [
+        EgoSample(time_s / 10, "headless-a", time_s, 0.0, 90.0, 1.0)
+        for time_s in range(0, 4)
+    ] + [
+        EgoSample(time_s / 10, "headless-b", 0.0, time_s, 0.0, 1.0)
+        for time_s in (1, 2)
+    ]
+    messages = list(sample_trajectories(samples, 0.1))
+    assert [round(m.vehicle.time_s, 3) for m in messages] == [
+        0.0,
+        0.1,
+        0.2,
+        0.3,
+        0.4,
+    ]
+    assert [command_summary(message) for message in messages] == [
+        [("register", "headless-a")],
+        [("update", "headless-a"), ("register", "headless-b")],
+        [("update", "headless-a"), ("update", "headless-b")],
+        [("unregister", "headless-b"), ("update", "headless-a")],
+        [("unregister", "headless-a")],
+    ]
+    position = messages[2].vehicle.commands[0].update_vehicle_command.state
+    assert (position.position.px, position.speed_mps) == (2.0, 1.0)
+
+
+def test_sample_trajectories_holds_last_ego():
+    samples = [
+        EgoSample(0.0, "headless-a", 0.0, 0.0, 0.0, 0.0),
+        EgoSample(0.3, "headless-b", 0.0, 0.0, 0.0, 0.0),
+    ]
+    messages = list(sample_trajectories(samples, 0.1))
+    assert [command_summary(message) for message in messages] == [
+        [("register", "headless-a")],
+        [("update", "headless-a")],
+        [("update", "headless-a")],
+        [("unregister", "headless-a"), ("register", "headless-b")],
+        [("unregister", "headless-b")],
+    ]
+
+
+def test_read_vehicle_trace(tmp_path):
+    trace_file = tmp_path / "vehicles.csv"
+    trace_file.write_text(
+        "relativeTimeMs,module,debugLevel,callName,moduleSimTimeMs,"
+        "vehicleId,laneId,pos,x,y,angle,speed\n"
+        "1.0,trace.evi.sumo,DEBUG,sumoResult,1000,headless-a,0,0,1,2,3,4\n"
+        "2.0,trace.evi.sumo,DEBUG,sumoResult,1100,headless-a,0,0,5,6,7,8\n"
+    )
+    messages = list(read_vehicle_messages(str(trace_file), 0.1))
+    assert [round(m.vehicle.time_s, 3) for m in messages] == [1.0, 1.1, 1.2]
+    update = messages[1].vehicle.commands[0].update_vehicle_command
+    assert (update.state.position.px, update.state.speed_mps) == (5.0, 8.0)
+
+
+@pytest.mark.asyncio
+async def test_headless_driver(tmp_path):
+    recorder = TrafficRecorder(str(tmp_path))
+    recorder.set_network({"netbounds": ((0, 0), (1, 1)), "polygons": []}, {})
+    for step in range(5):
+        recorder.add_step(
+            step * 100,
+            [
+                Vehicle(
+                    "fellow",
+                    Position("road", 0.0, 0, 10.0 + step, 0.0, 90, 0, 0),
+                    1.0,
+                    None,
+                    frozenset(),
+                    VehicleType.PASSENGER_CAR,
+                    frozenset(),
+                )
+            ],
+            [],
+        )
+    recorder.close()
+    playback = PlaybackInterface(playback_traffic=str(tmp_path))
+    await playback.warm_up_traffic(0)
+
+    shutdown_event = asyncio.Event()
+    handler = EgoVehicleUpdateHandler(
+        playback, None, shutdown_event, "statically_distributed"
+    )
+    dispatcher = RequestDispatcher([handler], shutdown_event)
+    samples = [
+        EgoSample(step / 10, "headless-a", step, 0.0, 90.0, 1.0)
+        for step in range(10)
+    ]
+    driver = HeadlessDriver(
+        dispatcher, shutdown_event, sample_trajectories(samples, 0.1)
+    )
+    await driver.run()
+    assert shutdown_event.is_set()
+    assert driver.steps == 11
+    # one traffic reply per step, none to the final unregistration
+    assert driver.replies == 10
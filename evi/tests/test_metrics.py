@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from evi.metrics import MetricsRegistry, serve_metrics
+
+
+def test_render_prometheus_text_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram(
+        "evi_step_seconds", "Step time.", buckets=(0.01, 0.1)
+    )
+    for value in (0.005, 0.05, 0.01, 2.0):
+        histogram.observe(value)
+    registry.gauge("evi_bytes", "Size.", {"protocol": "asm"}).set(42)
+    registry.gauge("evi_bytes", "Size.", {"protocol": "unity"}).inc(3)
+    registry.counter("evi_dropped", "Dropped.").inc()
+
+    lines = registry.render().splitlines()
+    assert lines == [
+        "# HELP evi_bytes Size.",
+        "# TYPE evi_bytes gauge",
+        'evi_bytes{protocol="asm"} 42.0',
+        'evi_bytes{protocol="unity"} 3.0',
+        "# HELP evi_dropped Dropped.",
+        "# TYPE evi_dropped counter",
+        "evi_dropped_total 1.0",
+        "# HELP evi_step_seconds Step time.",
+        "# TYPE evi_step_seconds histogram",
+        'evi_step_seconds_bucket{le="0.01"} 2',
+        'evi_step_seconds_bucket{le="0.1"} 3',
+        'evi_step_seconds_bucket{le="+Inf"} 4',
+        "evi_step_seconds_sum 2.065",
+        "evi_step_seconds_count 4",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_serve_metrics():
+    registry = MetricsRegistry()
+    registry.gauge("evi_ego_vehicles", "Egos.").set(2)
+    server = await serve_metrics(registry, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    response = await get("/metrics")
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert response.endswith("evi_ego_vehicles 2.0\n")
+    assert (await get("/")).startswith("HTTP/1.1 404")
+    server.close()
+    await server.wait_closed()
@@ -0,0 +1,99 @@
+"""
+Test recording traffic from SUMO and playing it back.
+"""
+
+import socket
+import threading
+
+import pytest
+
+from evi.playback import PlaybackInterface
+from evi.state import Position, Vehicle, VehicleType
+from evi.sumo import SumoInterface
+from evi.syntheticsumo import (
+    SyntheticScenario,
+    SyntheticTraCIServer,
+    SyntheticTraffic,
+)
+
+
+def make_ego(x, y):
+    return Vehicle(
+        id="ego",
+        position=Position("", 0.0, 0, x, y, 90.0, 0.0, 0.0),
+        speed=5.0,
+        route=None,
+        signals=frozenset(),
+        veh_type=VehicleType.PASSENGER_CAR,
+        stop_states=frozenset(),
+    )
+
+
+@pytest.fixture
+def synthetic_sumo_port():
+    scenario = SyntheticScenario(
+        vehicles=50, churn_rate=0.5, trafficlights=4, polygons=3
+    )
+    server = SyntheticTraCIServer(SyntheticTraffic(scenario))
+    with socket.socket() as server_socket:
+        server_socket.bind(("127.0.0.1", 0))
+        server_socket.listen(1)
+        thread = threading.Thread(
+            target=server.serve, args=(server_socket,), daemon=True
+        )
+        thread.start()
+        yield server_socket.getsockname()[1]
+        thread.join(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_playback_matches_recorded_run(synthetic_sumo_port, tmp_path):
+    recording = str(tmp_path / "recording")
+    sumo = SumoInterface(
+        sumo_port=synthetic_sumo_port,
+        ego_route_name="ego-route",
+        config_file="scenario/scenario.evi.ini",
+        sumo_network_file="scenario.net.xml",
+        record_traffic=recording,
+    )
+    steps = []
+    try:
+        warm_up = await sumo.warm_up_traffic(1000)
+        network = await sumo.network_init_data()
+        await sumo.subscribe_to_trafficlights()
+        for step in range(10):
+            traffic = await sumo.advance(
+                frozenset([make_ego(160.0 + step, 52.0)])
+            )
+            await sumo._last_step
+            steps.append(
+                (traffic, sumo.time_ms(), await sumo.update_trafficlights())
+            )
+    finally:
+        await sumo.teardown()
+
+    playback = PlaybackInterface(playback_traffic=recording)
+    assert await playback.warm_up_traffic(1000) == warm_up
+    assert await playback.network_init_data() == {
+        "netbounds": tuple(network["netbounds"]),
+        "polygons": network["polygons"],
+    }
+    await playback.subscribe_to_trafficlights()
+    for step, (traffic, time_ms, trafficlights) in enumerate(steps):
+        # egos are accepted but not fed back
+        assert await playback.advance(frozenset()) == traffic
+        assert playback.time_ms() == time_ms
+        assert await playback.update_trafficlights() == trafficlights
+    assert len(trafficlights) == 4
+    assert all("ego" not in {v.id for v in traffic} for traffic, _, _ in steps)
+
+    # the last step is held at the end of the recording
+    last_time_ms = playback.time_ms()
+    await playback.advance(frozenset())
+    assert playback.time_ms() == last_time_ms
+
+    # random access by time, advance returns the traffic at that time
+    playback.seek(steps[4][1])
+    assert await playback.advance(frozenset()) == steps[5][0]
+    await playback.require_trafficlights("all", [])
+    assert await playback.update_trafficlights() == frozenset()
@@ -0,0 +1,73 @@
+"""
+Test the prediction of green phases of traffic lights.
+"""
+
+import sumolib.net
+
+from evi.routehelper import TLSTiming, get_next_green_phase_times
+
+
+def make_tls(program_type, phases):
+    tls = sumolib.net.TLS("tls")
+    program = sumolib.net.TLSProgram("0", 0, program_type)
+    for state, duration, min_dur in phases:
+        program.addPhase(state, duration, min_dur)
+    tls.addProgram(program)
+    return tls
+
+
+PHASES = [
+    ("Gr", 30, 10),
+    ("yr", 3, -1),
+    ("rG", 20, 5),
+    ("ry", 3, -1),
+]
+
+
+def test_static_program_matches_phase_durations():
+    tls = make_tls("static", PHASES)
+    windows = TLSTiming().next_green_windows(
+        tls, 1, "0", phase_nr=1, time_to_switch=2.0, green_phases=2
+    )
+    nominal = get_next_green_phase_times(
+        tls.getPrograms()["0"], 1, 1, green_phases=2
+    )
+    # one second of the 3 s yellow phase has passed
+    assert windows == [(begin - 1.0, end - 1.0) for begin, end in nominal]
+    assert windows == [(2.0, 22.0), (58.0, 78.0)]
+
+
+def test_actuated_program_only_predicts_certain_window():
+    tls = make_tls("actuated", PHASES)
+    timing = TLSTiming()
+    # green now, until the next switch reported by SUMO
+    assert timing.next_green_windows(
+        tls, 0, "0", phase_nr=0, time_to_switch=4.5, green_phases=3
+    ) == [(-25.5, 4.5)]
+    # green after the next switch, for at least the minimum duration
+    assert timing.next_green_windows(
+        tls, 1, "0", phase_nr=1, time_to_switch=2.0, green_phases=3
+    ) == [(2.0, 7.0)]
+    # no green phase directly after the next switch
+    assert (
+        timing.next_green_windows(
+            tls, 1, "0", phase_nr=0, time_to_switch=4.5, green_phases=3
+        )
+        == []
+    )
+
+
+def test_ongoing_green_same_for_static_and_actuated_programs():
+    windows = [
+        TLSTiming().next_green_windows(
+            make_tls(program_type, PHASES),
+            0,
+            "0",
+            phase_nr=0,
+            time_to_switch=10.0,
+            green_phases=1,
+        )
+        for program_type in ("static", "actuated")
+    ]
+    # 20 s of the 30 s green phase have passed
+    assert windows == [[(-20.0, 10.0)], [(-20.0, 10.0)]]
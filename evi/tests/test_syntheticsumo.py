@@ -0,0 +1,102 @@
+"""
+Test EVI's SUMO interface against the synthetic TraCI server.
+"""
+
+import socket
+import threading
+
+import pytest
+
+from evi.state import Position, Vehicle, VehicleType
+from evi.sumo import SumoInterface
+from evi.syntheticsumo import (
+    SyntheticScenario,
+    SyntheticTraCIServer,
+    SyntheticTraffic,
+)
+
+
+def make_ego(x, y):
+    return Vehicle(
+        id="ego",
+        position=Position("", 0.0, 0, x, y, 90.0, 0.0, 0.0),
+        speed=5.0,
+        route=None,
+        signals=frozenset(),
+        veh_type=VehicleType.PASSENGER_CAR,
+        stop_states=frozenset(),
+    )
+
+
+@pytest.fixture
+def synthetic_sumo():
+    scenario = SyntheticScenario(
+        vehicles=200, churn_rate=0.5, trafficlights=10, polygons=5
+    )
+    server = SyntheticTraCIServer(SyntheticTraffic(scenario))
+    with socket.socket() as server_socket:
+        server_socket.bind(("127.0.0.1", 0))
+        server_socket.listen(1)
+        thread = threading.Thread(
+            target=server.serve, args=(server_socket,), daemon=True
+        )
+        thread.start()
+        yield server, server_socket.getsockname()[1]
+        thread.join(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_sumo_interface_runs_unchanged(synthetic_sumo):
+    server, port = synthetic_sumo
+    sumo = SumoInterface(
+        sumo_port=port,
+        ego_route_name="ego-route",
+        config_file="scenario/scenario.evi.ini",
+        sumo_network_file="scenario.net.xml",
+    )
+    try:
+        traffic = await sumo.warm_up_traffic(2000)
+        assert sumo.time_ms() == 2000
+        assert len(traffic) == 200
+
+        network = await sumo.network_init_data()
+        assert network["netbounds"].topright == (2000.0, 2000.0)
+        assert len(network["polygons"]) == 5
+
+        await sumo.subscribe_to_trafficlights()
+        assert len(await sumo.update_trafficlights()) == 10
+        # the approaches of a light end at its position
+        tls_id, (x, y, _) = next(iter(server.traffic.trafficlights.items()))
+        assert await sumo.trafficlights_near([(x, y)], 1.0) == {tls_id}
+        assert await sumo.trafficlights_near([(-500.0, -500.0)], 1.0) == set()
+
+        ids_before = {vehicle.id for vehicle in traffic}
+        for _ in range(20):
+            traffic = await sumo.advance(frozenset([make_ego(160.0, 52.0)]))
+        await sumo._last_step
+        # churn replaced vehicles, the ego is no part of the traffic
+        assert len(traffic) == 200
+        assert {vehicle.id for vehicle in traffic} != ids_before
+        assert "ego" not in {vehicle.id for vehicle in traffic}
+        ego = server.traffic.vehicles["ego"]
+        assert (ego.x, ego.y, ego.edge) == (160.0, 52.0, "h0")
+        assert ego.route == "ego-route"
+    finally:
+        await sumo.teardown()
+
+
+def test_synthetic_traffic_is_deterministic():
+    first, second = (
+        SyntheticTraffic(SyntheticScenario(vehicles=50, churn_rate=1.0))
+        for _ in range(2)
+    )
+    for _ in range(30):
+        first.step()
+        second.step()
+    assert [
+        (vehicle.id, vehicle.x, vehicle.y)
+        for vehicle in first.vehicles.values()
+    ] == [
+        (vehicle.id, vehicle.x, vehicle.y)
+        for vehicle in second.vehicles.values()
+    ]
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from evi.tracereport import (
+    TraceAnalysis,
+    analyze_trace,
+    critical_path,
+    format_report,
+    iter_spans,
+    main,
+)
+from evi.tracing import EventTracer
+
+
+def request_events(start, sumo_ms, filter_ms, msgtype="vehicle"):
+    sumo_end = start + 100 + sumo_ms * 1000
+    filter_end = sumo_end + filter_ms * 1000
+    return [
+        {"ph": "B", "name": "process", "ts": start, "tid": "request"},
+        {"ph": "B", "name": "egohandler", "ts": start + 50, "tid": "request"},
+        {"ph": "X", "name": "simulate", "ts": start + 150, "dur": 500,
+         "tid": "sumo"},
+        {"ph": "X", "name": "sumoAdvance", "ts": start + 100,
+         "dur": sumo_end - start - 100, "tid": "request"},
+        {"ph": "X", "name": "filterFellows", "ts": sumo_end,
+         "dur": filter_end - sumo_end, "tid": "request"},
+        {"ph": "E", "name": "egohandler", "ts": filter_end + 50,
+         "tid": "request"},
+        {"ph": "E", "name": "process", "ts": filter_end + 100,
+         "tid": "request", "args": {"msgtype": msgtype}},
+    ]
+
+
+def write_trace(path, events, crash=False):
+    with open(path, "w") as trace_file:
+        trace_file.write("[\n" + ",\n".join(map(json.dumps, events)))
+        if not crash:
+            trace_file.write("\n]\n")
+
+
+def test_request_trees_and_critical_path(tmp_path):
+    events = []
+    for number in range(100):
+        # every 10th request is slow in sumo and misses the deadline
+        sumo_ms = 150 if number % 10 == 0 else 10
+        events += request_events(number * 1e6, sumo_ms, 2)
+    write_trace(tmp_path / "trace.json", events, crash=True)
+
+    report = analyze_trace(
+        str(tmp_path / "trace.json"), "request:process", 100
+    )
+    assert report["spans"]["sumo:simulate"]["count"] == 100
+    assert report["spans"]["request:sumoAdvance"]["p50"] == pytest.approx(10)
+    assert report["spans"]["request:sumoAdvance"]["max"] == pytest.approx(150)
+    request = report["requests"]["request:process[vehicle]"]
+    assert request["count"] == 100
+    assert request["deadline_misses"] == 10
+    share = request["critical_path_share"]
+    assert max(share, key=share.get) == "request:sumoAdvance"
+    slowest = report["slowest"][0]
+    assert slowest["duration_ms"] == pytest.approx(152.2)
+    assert [key for key, _ in slowest["critical_path"]] == [
+        "request:process",
+        "request:egohandler",
+        "request:sumoAdvance",
+        "request:filterFellows",
+    ]
+    assert "request:process[vehicle]" in format_report(report, report)
+
+
+def test_critical_path_follows_latest_child():
+    tracer = EventTracer()
+    tracer.begin("process", ts=0, tid="request")
+    tracer.begin("a", ts=0, tid="request")
+    tracer.end("a", ts=10, tid="request")
+    tracer.begin("b", ts=2, tid="request")
+    tracer.end("b", ts=8, tid="request")
+    tracer.end("process", ts=12, tid="request")
+    analysis = TraceAnalysis("request:process", 100)
+    root = None
+    for span in iter_spans(
+        event for chunk in tracer._take_buffered()
+        for event in tracer.events(chunk)
+    ):
+        analysis.add(span)
+        root = span
+    assert critical_path(root) == [
+        ("request:process", 2.0),
+        ("request:a", 10.0),
+    ]
+
+
+def test_diff_between_runs(tmp_path, capsys):
+    write_trace(tmp_path / "base.json", request_events(0, 10, 2))
+    write_trace(tmp_path / "new.json", request_events(0, 20, 2))
+    main([str(tmp_path / "new.json"), "--baseline",
+          str(tmp_path / "base.json"), "--json"])
+    report = json.loads(capsys.readouterr().out)
+    assert report["diff"]["request:sumoAdvance"]["p50"] == pytest.approx(1.0)
+    assert report["diff"]["request:filterFellows"]["p50"] == pytest.approx(0)
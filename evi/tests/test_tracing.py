@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from evi.tracing import EventTracer, parse_sample_every, read_trace
+
+
+def record_events(tracer, num_steps):
+    for step in range(num_steps):
+        tracer.begin("step", tid="veins")
+        with tracer.complete("send", tid="asm", args={"step": step}):
+            pass
+        tracer.instant("tick")
+        tracer.end("step", tid="veins", args={"num_vehicles": step})
+
+
+def test_ring_buffer_keeps_most_recent_events():
+    tracer = EventTracer(chunk_size=8, max_chunks=2)
+    record_events(tracer, 10)
+    assert len(tracer) <= 3 * 8
+    assert tracer.dropped == 40 - len(tracer)
+    assert tracer.dropped > 0
+
+
+@pytest.mark.parametrize("trace_format", ["json", "binary"])
+def test_streamed_trace_contains_all_events(tmp_path, trace_format):
+    trace_file = str(tmp_path / "trace")
+    tracer = EventTracer(chunk_size=16)
+    tracer.instant("beforeWriter")
+    tracer.start_writer(trace_file, trace_format)
+    record_events(tracer, 20)
+    tracer.stop_writer()
+
+    events = read_trace(trace_file)
+    assert len(events) == 1 + 4 * 20
+    assert events[0]["name"] == "beforeWriter"
+    sends = [event for event in events if event["ph"] == "X"]
+    assert [event["args"]["step"] for event in sends] == list(range(20))
+    assert all(event["dur"] >= 0 for event in sends)
+    if trace_format == "json":
+        with open(trace_file) as json_file:
+            assert len(json.load(json_file)) == len(events)
+
+
+def test_binary_trace_with_more_than_16_bit_string_ids(tmp_path):
+    trace_file = str(tmp_path / "trace")
+    tracer = EventTracer()
+    for nr in range(2**16):
+        tracer._intern(f"filler{nr}")
+    tracer.start_writer(trace_file, "binary")
+    tracer.instant("late", pid="latePid", tid="lateTid")
+    tracer.stop_writer()
+
+    [event] = read_trace(trace_file)
+    assert (event["name"], event["pid"], event["tid"]) == (
+        "late",
+        "latePid",
+        "lateTid",
+    )
+
+
+def test_sampling_and_disabled_mode():
+    tracer = EventTracer()
+    tracer.sample_every = parse_sample_every("asm=5, main=2")
+    record_events(tracer, 10)
+    names = [
+        event["name"] for chunk in tracer._take_buffered()
+        for event in tracer.events(chunk)
+    ]
+    assert names.count("step") == 20
+    assert names.count("send") == 2
+    assert names.count("tick") == 5
+
+    tracer.enabled = False
+    record_events(tracer, 10)
+    assert len(tracer) == 0
@@ -0,0 +1,151 @@
+"""
+Test the multi-client Unity protocol.
+"""
+
+import asyncio
+
+import pytest
+
+import asmp.asmp_pb2 as asmp
+from evi.request_handlers import ClientReply, UnityEgoVehicleUpdateHandler
+from evi.state import TrafficLight
+from evi.unity import ClientSession, UnityProtocol, merge_vehicle_messages
+from evi.util import ID_MAPPER
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_vehicle_message(time_s, command, vehicle_id):
+    message = asmp.Message()
+    message.vehicle.time_s = time_s
+    cmd = getattr(message.vehicle.commands.add(), command)
+    cmd.vehicle_id = ID_MAPPER.to_uint(vehicle_id)
+    return message
+
+
+async def test_client_session_tracks_ego_ids():
+    session = ClientSession(b"client")
+    session.update_ego_ids(
+        make_vehicle_message(0.0, "register_vehicle_command", "ego-a")
+    )
+    assert session.ego_ids == {"ego-a"}
+    session.update_ego_ids(
+        make_vehicle_message(0.1, "unregister_vehicle_command", "ego-a")
+    )
+    assert not session.ego_ids
+
+
+async def test_merge_vehicle_messages_keeps_all_commands():
+    first = make_vehicle_message(1.0, "update_vehicle_command", "ego-a")
+    second = make_vehicle_message(1.1, "update_vehicle_command", "ego-b")
+
+    assert merge_vehicle_messages([first]) is first
+    merged = merge_vehicle_messages([first, second])
+    assert merged.vehicle.time_s == pytest.approx(1.1)
+    assert [
+        ID_MAPPER.to_string(cmd.update_vehicle_command.vehicle_id)
+        for cmd in merged.vehicle.commands
+    ] == ["ego-a", "ego-b"]
+
+
+async def test_replies_are_serialized_once_and_fanned_out(mocker):
+    protocol = UnityProtocol(mocker.Mock(), mocker.Mock(), "*")
+    sent = []
+
+    async def fake_send(message_strings):
+        sent.append(message_strings)
+
+    mocker.patch.object(protocol, "_send_message_set", fake_send)
+    for address in (b"one", b"two"):
+        protocol.sessions[address] = ClientSession(address)
+        protocol.sessions[address].ego_ids = frozenset([address.decode()])
+        protocol.sessions[address].ego_frames = [b"ego-" + address]
+
+    shared = asmp.Message()
+    private = asmp.Message()
+    protocol._send_replies(
+        [ClientReply(b"two", private), shared], [b"one", b"two"]
+    )
+    await asyncio.sleep(0)
+
+    # every message gets a single id, i.e., is serialized once
+    assert (shared.id, private.id) == (0, 1)
+    assert protocol.current_id == 2
+    assert sent[0] == [b"one", b"", b"ego-two", shared.SerializeToString()]
+    assert sent[1] == [
+        b"two",
+        b"",
+        b"ego-one",
+        private.SerializeToString(),
+        shared.SerializeToString(),
+    ]
+    protocol.connection.close()
+
+
+async def test_silent_client_is_dropped(mocker):
+    dispatcher = mocker.Mock()
+    dispatcher.process = mocker.AsyncMock()
+    protocol = UnityProtocol(
+        dispatcher, mocker.Mock(), "*", sync_timeout_s=0.01, max_missed_ticks=2
+    )
+    for address in (b"alive", b"silent"):
+        protocol.sessions[address] = ClientSession(address)
+        protocol.sessions[address].pending.append(
+            make_vehicle_message(
+                0.0, "register_vehicle_command", address.decode()
+            )
+        )
+    protocol._maybe_flush()
+    assert protocol.client_egos.keys() == {b"alive", b"silent"}
+
+    # only one client keeps sending, ticks are flushed after the timeout
+    for tick in (1, 2):
+        protocol.sessions[b"alive"].pending.append(
+            make_vehicle_message(tick / 10, "update_vehicle_command", "alive")
+        )
+        protocol._maybe_flush()
+        assert protocol._flush_handle is not None
+        await asyncio.sleep(0.02)
+
+    assert protocol.sessions.keys() == {b"alive"}
+    assert protocol.client_egos.keys() == {b"alive"}
+    merged = dispatcher.process.call_args_list[-1].args[0]
+    commands = merged.vehicle.commands
+    kinds = [cmd.WhichOneof("command_oneof") for cmd in commands]
+    assert [
+        (kind, ID_MAPPER.to_string(getattr(cmd, kind).vehicle_id))
+        for kind, cmd in zip(kinds, commands)
+    ] == [
+        ("update_vehicle_command", "alive"),
+        ("unregister_vehicle_command", "silent"),
+    ]
+    # the next tick does not wait for the dropped client anymore
+    protocol.sessions[b"alive"].pending.append(
+        make_vehicle_message(0.3, "update_vehicle_command", "alive")
+    )
+    protocol._maybe_flush()
+    assert protocol._flush_handle is None
+    protocol.connection.close()
+
+
+async def test_joining_client_gets_unchanged_trafficlights(mocker):
+    sumo_interface = mocker.Mock()
+    sumo_interface.subscribe_to_trafficlights = mocker.AsyncMock()
+    sumo_interface.update_trafficlights = mocker.AsyncMock(
+        return_value=[TrafficLight("tls", ("r",), 0, "0", 10.0)]
+    )
+    sumo_interface.time_ms.return_value = 0
+    client_egos = {b"first": frozenset({"ego1"})}
+    handler = UnityEgoVehicleUpdateHandler(
+        sumo_interface,
+        None,
+        asyncio.Event(),
+        "statically_distributed",
+        client_egos=client_egos,
+    )
+    assert len(await handler.update_trafficlights()) == 1
+    assert not await handler.update_trafficlights()
+    # replies are broadcast, so all clients get the state again
+    client_egos[b"second"] = frozenset({"ego2"})
+    assert len(await handler.update_trafficlights()) == 1
+    assert not await handler.update_trafficlights()
@@ -1,11 +1,15 @@
 import pytest  # noqa
 
 from evi.util import (
+    DiskCache,
     edge_lane_nr_to_lane_id,
+    hash_files,
     lane_to_edge,
     lane_to_nr,
     make_edge_to_lane_map,
     make_uint_mapping,
+    sumo_config_input_files,
+    veins_command,
 )
 
 
@@ -50,3 +54,73 @@ class TestUIntMapping():
         assert mystr in fw
         assert fw[mystr] in bw
         assert fw[mystr] < 2**32
+
+
+class TestDiskCache():
+
+    def test_missing_entry_is_none(self, tmp_path):
+        cache = DiskCache(str(tmp_path), 'test', 1)
+        assert cache.load('somekey') is None
+
+    def test_stored_entry_is_loaded(self, tmp_path):
+        cache = DiskCache(str(tmp_path), 'test', 1)
+        cache.store('somekey', b'somedata')
+        assert cache.load('somekey') == b'somedata'
+
+    def test_version_bump_invalidates_entries(self, tmp_path):
+        DiskCache(str(tmp_path), 'test', 1).store('somekey', b'somedata')
+        assert DiskCache(str(tmp_path), 'test', 2).load('somekey') is None
+
+
+def test_hash_files_depends_on_content(tmp_path):
+    file_name = tmp_path / 'somefile'
+    file_name.write_text('content')
+    first_hash = hash_files([str(file_name)])
+    assert first_hash == hash_files([str(file_name)])
+    file_name.write_text('other content')
+    assert first_hash != hash_files([str(file_name)])
+
+
+def test_sumo_config_input_files(tmp_path):
+    config_file = tmp_path / 'scenario.sumo.cfg'
+    config_file.write_text(
+        '<configuration><input>'
+        '<net-file value="scenario.net.xml"/>'
+        '<route-files value="a.rou.xml, b.rou.xml"/>'
+        '</input></configuration>'
+    )
+    assert sumo_config_input_files(str(config_file)) == [
+        str(tmp_path / 'scenario.net.xml')
+    ]
+    assert sumo_config_input_files(
+        str(config_file), ('net-file', 'route-files')
+    ) == [
+        str(tmp_path / name)
+        for name in ('scenario.net.xml', 'a.rou.xml', 'b.rou.xml')
+    ]
+
+
+def test_veins_command_overrides_ports():
+    cmd = veins_command(
+        "LanradioDisabled",
+        23456,
+        "./run",
+        3,
+        lanradio_baseport=34567,
+        extra_opts=["-u", "Cmdenv"],
+    )
+    assert cmd == [
+        "./run",
+        "--",
+        "-c",
+        "LanradioDisabled",
+        "-r",
+        "3",
+        "--*.manager.port=23456",
+        "--*.lanradio.baseport=34567",
+        "-u",
+        "Cmdenv",
+    ]
+    assert not any(
+        "lanradio" in opt for opt in veins_command("c", 1, "./run", 0)
+    )
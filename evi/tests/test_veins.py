@@ -0,0 +1,30 @@
+"""
+Test Veins interface helpers.
+"""
+
+import pytest  # noqa
+
+import asmp.asmp_pb2 as asmp
+from evi.veins import make_network_init_message, make_network_init_payload
+
+
+def test_network_init_message_merges_payload_and_times():
+    payload = make_network_init_payload(
+        {
+            "netbounds": ((0.0, 0.0), (100.0, 50.0)),
+            "polygons": [
+                {"id": "poly-1", "type": "building", "shape": [(1, 2), (3, 4)]}
+            ],
+        }
+    )
+
+    message = asmp.Message()
+    message.ParseFromString(make_network_init_message(payload, 12.5, 0.1))
+
+    netinit = message.session.netinit
+    assert netinit.version.server == "evi"
+    assert netinit.network_boundaries.bottomright.x == 100.0
+    assert [poly.id for poly in netinit.polygons] == ["poly-1"]
+    assert netinit.polygons[0].shape[1].y == 4
+    assert netinit.init_time_s == 12.5
+    assert netinit.sync_interval_s == 0.1
@@ -0,0 +1,57 @@
+"""
+Smoke test the commands vce-launcher builds for the example configurations.
+
+Run with `python -m pytest scripts/test_vce_launcher.py`.
+"""
+
+import importlib.util
+import pathlib
+import subprocess
+import tomllib
+
+import pytest
+
+SCRIPTS_DIR = pathlib.Path(__file__).parent.absolute()
+LAUNCHER_CONFIGS = sorted(
+    (SCRIPTS_DIR.parent / "scenarios").glob("*/*.launcher.toml")
+)
+
+
+def load_launcher():
+    spec = importlib.util.spec_from_file_location(
+        "vce_launcher", SCRIPTS_DIR / "vce-launcher.py"
+    )
+    launcher = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(launcher)
+    return launcher
+
+
+@pytest.mark.parametrize("container_img", [None, pathlib.Path("vce.sif")])
+@pytest.mark.parametrize(
+    "config",
+    LAUNCHER_CONFIGS,
+    ids=[config.name for config in LAUNCHER_CONFIGS],
+)
+def test_full_cmds_are_valid_bash(config, container_img):
+    launcher = load_launcher()
+    with open(config, "rb") as config_file:
+        full_cfg = tomllib.load(config_file)
+    components = [
+        component_cls(
+            full_cfg=full_cfg,
+            workdir=config.parent.absolute(),
+            container_img=container_img,
+            container_nvidia=False,
+        )
+        for component_cls in launcher.COMPONENT_CLASSES
+    ]
+    enabled = [component for component in components if component.is_enabled]
+    assert enabled
+    for component in enabled:
+        # -n only parses the command without running it
+        result = subprocess.run(
+            ["bash", "-n", "-c", str(component.full_cmd)],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, (component.name, result.stderr)
@@ -2,12 +2,16 @@
 
 import os
 import argparse
+import json
 import pathlib
+import re
+import signal
 import tomllib
 import asyncio
 import subprocess
 import shutil
 import sys
+import time
 
 
 VCE_ROOT = pathlib.Path(__file__).parent.parent.absolute()
@@ -51,9 +55,10 @@ def main():
     parser.add_argument(
         '--no-tmux',
         action='store_true',
-        help="NOT IMPLEMENTED YET. "
-             "Do not start a tmux session and instead run each component "
-             "silently.",
+        help="Do not start a tmux session and instead run each component "
+             "silently. Components are started concurrently as soon as "
+             "the components they depend on are ready, followed by a "
+             "report of the startup timeline.",
     )
     parser.add_argument(
         '--container',
@@ -71,15 +76,25 @@ def main():
     parser.add_argument(
         '--logs-dir',
         type=pathlib.Path,
-        help="NOT IMPLEMENTED YET. "
-             "If running with --no-tmux, the standard output of each "
+        help="If running with --no-tmux, the standard output of each "
              "component will be written to a <component>.log file "
-             "in the specified logs directory. "
+             "in the specified logs directory, "
+             "along with the startup-timeline.json. "
              "Note that this may impact performance.",
         default=".",
     )
+    parser.add_argument(
+        '--startup-timeout',
+        type=float,
+        help="If running with --no-tmux, stop all components if they are "
+             "not ready after this many seconds (default: %(default)s).",
+        default=300.0,
+    )
     args = parser.parse_args()
 
+    if args.prepare_only and args.no_tmux:
+        sys.exit("--prepare-only does not work with --no-tmux.")
+
     if not args.no_tmux and not shutil.which("tmux"):
         sys.exit("Could not find an installation of `tmux`.")
     if args.container and not shutil.which("apptainer"):
@@ -106,6 +121,7 @@ def main():
         use_tmux=not args.no_tmux,
         prepare_only=args.prepare_only,
         logs_dir=args.logs_dir,
+        startup_timeout=args.startup_timeout,
         use_container=args.container,
         container_nvidia=args.nv,
     )
@@ -116,9 +132,22 @@ class Component:
     _cfg_mandatory_args = dict()
     _cfg_optional_args = dict(
         wait_for_ports=(
-            "A list of ports. "
-            "Launch this component only when all ports are open."
-        )
+            "A list of TCP ports. "
+            "Launch this component only when all ports accept connections."
+        ),
+        depends_on=(
+            "A list of components (e.g., [\"evi\"]). "
+            "Launch this component only when they are ready."
+        ),
+        ready_ports=(
+            "A list of TCP ports. This component is ready once all ports "
+            "accept connections. Components waiting for any of these "
+            "ports depend on this component."
+        ),
+        ready_log_pattern=(
+            "A regular expression. With --no-tmux, this component is "
+            "ready once a line of its output matches."
+        ),
     )
 
     @classmethod
@@ -162,22 +191,35 @@ class Component:
         is already in the appropriate environment.
         E.g., `./run.sh --myarg`
         """
+        # components without an environment command only run run_cmd,
+        # a leading `&&` would be a syntax error in bash
         self.full_cmd = (
             full_cmd if full_cmd else
-            Cmd.concat(env_cmd, Cmd(" && "), run_cmd)
+            Cmd.concat(env_cmd, Cmd(" && "), run_cmd) if str(env_cmd) else
+            Cmd.concat(run_cmd)
         )
         self.prompt = prompt
         """Override bash or Apptainer prompt"""
         self.greeting = greeting
 
-        if ports := full_cfg[self._cfg_section].get('wait_for_ports'):
-            self.run_cmd = Cmd(
-                QuotedCmd(VCE_ROOT / "scripts" / "wait-for-component.py"),
-                " --port-open "
-                + " ".join([str(port) for port in ports])
-                + " && ",
-                self.run_cmd,
-            )
+        component_cfg = full_cfg[self._cfg_section]
+        self.wait_for_ports: list[int] = list(
+            component_cfg.get('wait_for_ports', [])
+        )
+        self.depends_on: list[str] = list(
+            component_cfg.get('depends_on', [])
+        )
+        """
+        Names of the components to wait for,
+        completed by `resolve_dependencies`.
+        """
+        self.ready_ports: list[int] = list(
+            component_cfg.get('ready_ports', [])
+        )
+        self.ready_log_pattern = (
+            re.compile(component_cfg['ready_log_pattern'])
+            if 'ready_log_pattern' in component_cfg else None
+        )
 
         self.container_img = container_img
         self._container_enabled = False  # only enable once
@@ -189,6 +231,10 @@ class Component:
     def is_enabled(self):
         return self._enabled
 
+    @property
+    def name(self) -> str:
+        return self._cfg_section
+
     def enable_container(self):
         if self._container_enabled:
             print("Container was already enabled for this component.")
@@ -203,8 +249,13 @@ class Component:
                 ")",
             )
         self.env_cmd = build_container_cmd(self.env_cmd)
-        # TODO: skip using --init-file for full_cmd
-        self.full_cmd = build_container_cmd(self.full_cmd)
+        # full_cmd is run non-interactively, so don't use --init-file:
+        self.full_cmd = Cmd(
+            f"apptainer exec {'--nv' if self.container_nvidia else ''} ",
+            QuotedCmd(self.container_img),
+            " bash -c ",
+            QuotedCmd(self.full_cmd),
+        )
         self._container_enabled = True
 
     @classmethod
@@ -307,6 +358,7 @@ def launch_vce(
         container_nvidia: bool,
         prepare_only: bool,
         logs_dir: pathlib.Path,
+        startup_timeout: float,
 ):
     container_img = DEFAULT_CONTAINER if use_container else None
     components: list[Component] = []
@@ -319,29 +371,334 @@ def launch_vce(
         )
         if component.is_enabled:
             components.append(component)
+    components = resolve_dependencies(components)
 
     if use_tmux:
+        add_wait_commands(components)
         launch_tmux(components, prepare_only=prepare_only)
+    elif not components:
+        sys.exit("No components configured.")
     else:
-        sys.exit("Launching without tmux not implemented yet")
-        # subprocess.run(
-        #     evi_launch_cmd,
-        #     stdout=f,  # TODO
-        #     stderr=subprocess.STDOUT,
-        #     check=True,  # may raise CalledProcessError
-        # )
-
-
-async def launch_component(
-        cmd: str,
-        log_file: pathlib.Path | None,
-):
-    proc = await asyncio.subprocess.create_subprocess_shell(
-        cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    # TODO
+        try:
+            returncode = asyncio.run(launch_without_tmux(
+                components,
+                logs_dir=logs_dir,
+                startup_timeout=startup_timeout,
+            ))
+        except KeyboardInterrupt:
+            returncode = 130
+        sys.exit(returncode)
+
+
+def resolve_dependencies(components: list[Component]) -> list[Component]:
+    """
+    Complete the dependencies of each component and return the components
+    in an order in which all dependencies come first.
+
+    A component depends on the components in its depends_on and on
+    the components with ready_ports that it waits for.
+    """
+    by_name = {component.name: component for component in components}
+    ready_port_owners = {
+        port: component.name
+        for component in components
+        for port in component.ready_ports
+    }
+    for component in components:
+        for dependency in component.depends_on:
+            if dependency not in by_name:
+                sys.exit(
+                    f"[{component.name}] depends on [{dependency}], "
+                    "which is not configured."
+                )
+        component.depends_on.extend(
+            owner
+            for port, owner in ready_port_owners.items()
+            if port in component.wait_for_ports
+            and owner != component.name
+            and owner not in component.depends_on
+        )
+
+    ordered: list[Component] = []
+    visiting: list[str] = []
+
+    def visit(component: Component):
+        if component in ordered:
+            return
+        if component.name in visiting:
+            sys.exit(
+                "Components depend on each other: "
+                + " -> ".join(visiting + [component.name])
+            )
+        visiting.append(component.name)
+        for dependency in component.depends_on:
+            visit(by_name[dependency])
+        visiting.pop()
+        ordered.append(component)
+
+    for component in components:
+        visit(component)
+    return ordered
+
+
+def add_wait_commands(components: list[Component]):
+    """
+    Prefix the run_cmd of components with a wait for the ports they
+    wait for and the ready_ports of the components they depend on.
+    """
+    by_name = {component.name: component for component in components}
+    for component in components:
+        ports = list(component.wait_for_ports)
+        for dependency in component.depends_on:
+            if by_name[dependency].ready_log_pattern:
+                print(
+                    f"[{component.name}] cannot wait for "
+                    f"ready_log_pattern of [{dependency}] in tmux."
+                )
+            ports.extend(
+                port for port in by_name[dependency].ready_ports
+                if port not in ports
+            )
+        if ports:
+            component.run_cmd = Cmd(
+                QuotedCmd(VCE_ROOT / "scripts" / "wait-for-component.py"),
+                " --port-open "
+                + " ".join([str(port) for port in ports])
+                + " && ",
+                component.run_cmd,
+            )
+
+
+async def wait_for_port(port: int, host: str = "127.0.0.1"):
+    """Wait until a TCP port accepts connections, backing off up to 0.5 s."""
+    interval = 0.01
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 0.5)
+            continue
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return
+
+
+class ComponentRun:
+    """A component launched by `launch_without_tmux`."""
+
+    def __init__(self, component: Component, start: float):
+        self.component = component
+        self.start = start
+        """`time.monotonic()` at the start of the launcher"""
+        self.launched_s: float | None = None
+        self.ready_s: float | None = None
+        self.exited_s: float | None = None
+        self.returncode: int | None = None
+        self.ready = asyncio.Event()
+        self.log_line_matched = asyncio.Event()
+        self.process: asyncio.subprocess.Process | None = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    async def run(self, runs: dict[str, 'ComponentRun'], log_file):
+        """
+        Launch the component once its dependencies are ready,
+        mark it ready and wait for it to exit.
+        """
+        component = self.component
+        await asyncio.gather(
+            *(runs[name].ready.wait() for name in component.depends_on),
+            *(wait_for_port(port) for port in component.wait_for_ports),
+        )
+        self.launched_s = self.elapsed()
+        print(f"Launching [{component.name}] after {self.launched_s:.2f} s")
+        self.process = await asyncio.create_subprocess_shell(
+            str(component.full_cmd),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            executable=shutil.which("bash"),
+            # to stop all processes of the component at once:
+            start_new_session=True,
+        )
+        output = asyncio.create_task(self._read_output(log_file))
+        readiness = asyncio.create_task(self._wait_until_ready())
+        try:
+            await asyncio.wait(
+                (readiness, output), return_when=asyncio.FIRST_COMPLETED
+            )
+        except asyncio.CancelledError:
+            readiness.cancel()
+            output.cancel()
+            raise
+        if readiness.done():
+            self.ready_s = self.elapsed()
+            print(
+                f"[{component.name}] ready after {self.ready_s:.2f} s "
+                f"({self.ready_s - self.launched_s:.2f} s startup)"
+            )
+            self.ready.set()
+        else:
+            readiness.cancel()
+        await output
+        self.returncode = await self.process.wait()
+        self.exited_s = self.elapsed()
+        print(
+            f"[{component.name}] exited with code {self.returncode} "
+            f"after {self.exited_s:.2f} s"
+        )
+        if not self.ready.is_set():
+            raise RuntimeError(
+                f"[{component.name}] exited before it was ready"
+            )
+
+    async def _wait_until_ready(self):
+        await asyncio.gather(
+            *(wait_for_port(port) for port in self.component.ready_ports),
+            *(
+                (self.log_line_matched.wait(),)
+                if self.component.ready_log_pattern else ()
+            ),
+        )
+
+    async def _read_output(self, log_file):
+        """Write the output to log_file, matching ready_log_pattern."""
+        pattern = self.component.ready_log_pattern
+        while line := await self.process.stdout.readline():
+            log_file.write(line)
+            if (
+                pattern
+                and not self.log_line_matched.is_set()
+                and pattern.search(line.decode(errors='replace'))
+            ):
+                self.log_line_matched.set()
+
+    def terminate(self):
+        if self.process and self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def kill(self):
+        if self.process and self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def timeline_entry(self) -> dict:
+        return dict(
+            component=self.component.name,
+            depends_on=self.component.depends_on,
+            launched_s=self.launched_s,
+            ready_s=self.ready_s,
+            exited_s=self.exited_s,
+            returncode=self.returncode,
+        )
+
+
+def format_timeline(runs: list[ComponentRun]) -> str:
+    def fmt(seconds):
+        return f"{seconds:8.2f}" if seconds is not None else f"{'-':>8}"
+
+    name_len = max(len(run.component.name) for run in runs)
+    lines = [
+        "Startup timeline (seconds since launch of the VCE):",
+        f"  {'component':{name_len}}  launched     ready   startup  "
+        "depends on",
+    ]
+    for run in runs:
+        startup = (
+            run.ready_s - run.launched_s
+            if run.ready_s is not None else None
+        )
+        lines.append(
+            f"  {run.component.name:{name_len}}  {fmt(run.launched_s)}  "
+            f"{fmt(run.ready_s)}  {fmt(startup)}  "
+            f"{', '.join(run.component.depends_on) or '-'}"
+        )
+    return "\n".join(lines)
+
+
+async def launch_without_tmux(
+        components: list[Component],
+        logs_dir: pathlib.Path,
+        startup_timeout: float,
+) -> int:
+    """
+    Run all components concurrently, each as soon as the components it
+    depends on are ready. Return the exit code for the launcher.
+    """
+    logs_dir.mkdir(parents=True, exist_ok=True)
+    start = time.monotonic()
+    runs = {
+        component.name: ComponentRun(component, start)
+        for component in components
+    }
+    log_files = [
+        open(logs_dir / f"{name}.log", 'wb') for name in runs
+    ]
+    tasks = [
+        asyncio.create_task(run.run(runs, log_file))
+        for run, log_file in zip(runs.values(), log_files)
+    ]
+
+    async def wait_all_ready():
+        for run in runs.values():
+            await run.ready.wait()
+
+    all_ready = asyncio.create_task(wait_all_ready())
+
+    async def startup():
+        pending = {all_ready, *tasks}
+        while all_ready in pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task is not all_ready and task.exception():
+                    raise task.exception()
+
+    try:
+        try:
+            await asyncio.wait_for(startup(), startup_timeout)
+            startup_ok = True
+        except asyncio.TimeoutError:
+            print(f"Startup timed out after {startup_timeout} s.")
+            startup_ok = False
+        except Exception as ex:
+            print(f"Startup failed: {ex}")
+            startup_ok = False
+        print(format_timeline(list(runs.values())))
+        if not startup_ok:
+            return 1
+        print("All components are ready, press Ctrl+C to stop them.")
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return int(any(run.returncode for run in runs.values()))
+    finally:
+        all_ready.cancel()
+        for run, task in zip(runs.values(), tasks):
+            if run.process is None:
+                task.cancel()  # still waiting for its dependencies
+            else:
+                run.terminate()
+        _, still_running = await asyncio.wait(tasks, timeout=10)
+        if still_running:
+            for run in runs.values():
+                run.kill()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for log_file in log_files:
+            log_file.close()
+        with open(logs_dir / "startup-timeline.json", 'w') as f:
+            json.dump(
+                [run.timeline_entry() for run in runs.values()], f, indent=2
+            )
 
 
 class EVIComponent(Component):
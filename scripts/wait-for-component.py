@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
 import argparse
-import subprocess
-import time
-import shutil
+import pathlib
+import re
+import socket
 import sys
+import time
 
 
 def main():
@@ -15,14 +16,35 @@ def main():
     parser.add_argument(
         '--poll-interval',
         type=float,
-        help="Interval in seconds with which to check conditions.",
+        help="Maximum interval in seconds with which to check conditions. "
+             "Checks start at a 10 ms interval and back off exponentially.",
         default=0.5,
     )
     parser.add_argument(
         '--port-open',
         nargs='*',
         type=int,
-        help="Wait until the given ports are open.",
+        help="Wait until the given TCP ports accept connections.",
+    )
+    parser.add_argument(
+        '--host',
+        help="Host to connect to for --port-open.",
+        default="127.0.0.1",
+    )
+    parser.add_argument(
+        '--log-file',
+        type=pathlib.Path,
+        help="Wait until a line of this file matches --log-pattern.",
+    )
+    parser.add_argument(
+        '--log-pattern',
+        help="Regular expression to search for in lines of --log-file.",
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        help="Exit with an error if the conditions are not met in time "
+             "(in seconds, default: wait forever).",
     )
     parser.add_argument(
         '--wait-message',
@@ -30,32 +52,77 @@ def main():
         default="Waiting for ports {ports}…",
     )
     args = parser.parse_args()
-
-    if not shutil.which("netstat"):
-        sys.exit("Could not find an installation of `netstat`.")
-    if not shutil.which("grep"):
-        sys.exit("Could not find an installation of `grep`.")
+    if (args.log_file is None) != (args.log_pattern is None):
+        parser.error("--log-file and --log-pattern go together")
 
     print(
         args.wait_message.format(ports=args.port_open)
     )
+    conditions = [
+        PortOpen(args.host, port)
+        for port in (args.port_open if args.port_open else ())
+    ]
+    if args.log_file:
+        conditions.append(LogLineMatches(args.log_file, args.log_pattern))
+
+    start = time.monotonic()
+    interval = 0.01
     while True:
-        ok = True
-        for port in (args.port_open if args.port_open else ()):
-            ok &= check_port_in_use(port)
-        if ok:
+        # conditions stay met once they were met
+        conditions = [condition for condition in conditions if not condition()]
+        if not conditions:
             break
-        time.sleep(args.poll_interval)
+        if args.timeout is not None and (
+            time.monotonic() - start > args.timeout
+        ):
+            sys.exit(
+                f"Timed out after {args.timeout} s waiting for "
+                + ", ".join(str(condition) for condition in conditions)
+            )
+        time.sleep(interval)
+        interval = min(interval * 2, args.poll_interval)
 
 
-def check_port_in_use(port: int) -> bool:
-    proc = subprocess.run(
-        f"netstat -tulpn | grep -E ':{port}\\s'",
-        capture_output=True,
-        shell=True,
-        check=False,
-    )
-    return proc.stdout != b""
+class PortOpen:
+    """Condition that a TCP port accepts connections."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+
+    def __call__(self) -> bool:
+        try:
+            with socket.create_connection((self.host, self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def __str__(self):
+        return f"port {self.port}"
+
+
+class LogLineMatches:
+    """Condition that a line of a (growing) log file matches a pattern."""
+
+    def __init__(self, log_file: pathlib.Path, pattern: str):
+        self.log_file = log_file
+        self.pattern = re.compile(pattern)
+        self._offset = 0
+        self._partial_line = ""
+
+    def __call__(self) -> bool:
+        try:
+            with open(self.log_file, errors='replace') as f:
+                f.seek(self._offset)
+                text = self._partial_line + f.read()
+                self._offset = f.tell()
+        except FileNotFoundError:
+            return False
+        *lines, self._partial_line = text.split("\n")
+        return any(self.pattern.search(line) for line in lines)
+
+    def __str__(self):
+        return f"'{self.pattern.pattern}' in {self.log_file}"
 
 
 if __name__ == '__main__':